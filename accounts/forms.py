@@ -1,4 +1,5 @@
 from django import forms
+from imaging.forms import LosslessImageField, ProcessedImageField
 from .models import Account
 from django.contrib.auth.forms import PasswordChangeForm, PasswordResetForm, SetPasswordForm
 
@@ -83,6 +84,12 @@ class ProfileUpdateForm(forms.ModelForm):
             "profile_picture": forms.FileInput(attrs={"class": "form-control"}),
             "payment_qr": forms.ClearableFileInput(attrs={"class": "form-control-file"}),
         }
+        # uploads are bounded, EXIF-rotated, stripped and re-encoded (imaging.uploads);
+        # QR codes stay lossless PNG so they still scan
+        field_classes = {
+            "profile_picture": ProcessedImageField,
+            "payment_qr": LosslessImageField,
+        }
 
     def __init__(self, *args, **kwargs):
         super(ProfileUpdateForm, self).__init__(*args, **kwargs)
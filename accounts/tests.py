@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core import mail
+from outbox.services import deliver_pending
 from .forms import CustomPasswordResetForm
 
 User = get_user_model()
@@ -32,6 +33,8 @@ class PasswordResetTests(TestCase):
             'email': 'test@example.com'
         })
         self.assertEqual(response.status_code, 302)  # Redirect to done page
+        self.assertEqual(len(mail.outbox), 0)  # only queued by the view
+        deliver_pending()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Password Reset Request', mail.outbox[0].subject)
     
@@ -41,6 +44,7 @@ class PasswordResetTests(TestCase):
             'email': 'nonexistent@example.com'
         })
         self.assertEqual(response.status_code, 302)  # Still redirects for security
+        deliver_pending()
         self.assertEqual(len(mail.outbox), 0)  # No email sent
     
     def test_password_reset_done_view(self):
@@ -104,6 +108,7 @@ class PasswordResetTests(TestCase):
             'email': 'test@example.com'
         })
         self.assertEqual(response.status_code, 302)
+        deliver_pending()
         self.assertEqual(len(mail.outbox), 1)
         
         email = mail.outbox[0]
@@ -12,7 +12,6 @@ from orders.models import Order, OrderProduct
 from django.core.paginator import Paginator
 from django.db import transaction
 from django.db.models import F
-from carts.models import Cart, CartItem
 # Password change
 from . forms import CustomPasswordChangeForm, CustomPasswordResetForm, CustomSetPasswordForm
 from django.contrib.auth import update_session_auth_hash
@@ -25,8 +24,9 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import EmailMessage
+from outbox.services import enqueue as enqueue_email
 
-from carts.views import _cart_id
+from carts.services import merge_session_cart
 
 def user_login(request):
     if request.method == "POST":
@@ -37,48 +37,8 @@ def user_login(request):
         user = auth.authenticate(email=email, password=password)
         
         if user is not None:
-            try:
-                cart = Cart.objects.get(cart_id=_cart_id(request))
-                is_cart_item_exists = CartItem.objects.filter(cart=cart).exists()
-                if is_cart_item_exists:
-                    cart_item = CartItem.objects.filter(cart=cart)
-                    
-                    # Getting product variation by cart id
-                    product_variation = []
-                    for item in cart_item:
-                        variation = item.variations.all()
-                        product_variation.append(list(variation))
-                    
-                    # Get the cart items from the user to access his product variations
-                    cart_item = CartItem.objects.filter(user=user)
-            
-                    # existing variations, current variation, item id needed
-                    # If the current variation is inside the existing variations, then increase
-                    
-                    ex_var_list = []
-                    id = []
-                    for item in cart_item:
-                        existing_variation = item.variations.all()
-                        ex_var_list.append(list(existing_variation))
-                        id.append(item.id)
-                    
-                    # product_variation = [1, 2, 3, 4, 6]
-                    # ex_var_list = [4, 5, 3, 5]
-                    for pr in product_variation:
-                        if pr in ex_var_list:
-                            index = ex_var_list.index(pr)
-                            item_id = id[index]
-                            item = CartItem.objects.get(id=item_id)
-                            item.quantity += 1
-                            item.user = user
-                            item.save()
-                        else:
-                            cart_item = CartItem.objects.filter(cart=cart)
-                            for item in cart_item:
-                                item.user = user
-                                item.save()
-            except:
-                pass
+            # Carry the anonymous session cart over before login rotates the session key
+            merge_session_cart(request.session.session_key, user)
             auth.login(request, user)
             messages.success(request, "You are now logged in.")
             # Redirect to next page if provided
@@ -131,14 +91,7 @@ def user_register(request):
                 'token': token
             })
             to_email = email
-            try:
-                send_email = EmailMessage(
-                    mail_subject, message, to=[to_email]
-                )
-                send_email.send()
-                # messages.success(request, "Account created. Check your email to activate your account.")
-            except Exception:
-                messages.warning(request, "Account created, but we couldn't send the email. Ask admin to activate you.")
+            enqueue_email(EmailMessage(mail_subject, message, to=[to_email]))
             
             return redirect("/accounts/login/?command=verification&email="+email)
             
@@ -330,15 +283,9 @@ def update_delivery_status(request, order_product_id):
             "status_label": status_label,
         })
 
-        try:
-            msg = EmailMessage(mail_subject, email_body, to=[buyer.email])
-            msg.content_subtype = "html"  # Sends as HTML
-            msg.send()
-        except Exception:
-            messages.warning(
-                request,
-                "Status updated, but we couldn't send the email notification."
-            )
+        msg = EmailMessage(mail_subject, email_body, to=[buyer.email])
+        msg.content_subtype = "html"  # Sends as HTML
+        enqueue_email(msg)
 
         messages.success(request, f"Updated to {valid[new_status]}.")
         return redirect("my_sales")
@@ -475,7 +422,7 @@ class CustomPasswordResetView(PasswordResetView):
             email_msg = EmailMultiAlternatives(subject, html_content, None, [email])
             email_msg.content_subtype = "html"
             email_msg.attach_alternative(text_content, "text/plain")
-            email_msg.send()
+            enqueue_email(email_msg)
         
         # Add success message
         messages.success(
@@ -511,7 +458,7 @@ class CustomPasswordResetView(PasswordResetView):
         email = EmailMultiAlternatives(subject, html_content, from_email, [to_email])
         email.content_subtype = "html"  # Set content type to HTML
         email.attach_alternative(text_content, "text/plain")
-        email.send()
+        enqueue_email(email)
 
 
 class CustomPasswordResetConfirmView(PasswordResetConfirmView):
@@ -1,12 +1,15 @@
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Banner
-from utils.media_cleanup import delete_old_file_on_update, delete_file_on_delete
+from .models import Banner, PromoBanner
+from marketplace.cache import bump_home_version
+from utils.media_cleanup import track_files
 
-@receiver(pre_save, sender=Banner)
-def banner_image_update_cleanup(sender, instance, **kwargs):
-    delete_old_file_on_update(instance, Banner, 'banner_image')
+# Dedupe uploads; delete replaced/orphaned image files
+track_files(Banner, 'banner_image')
+track_files(PromoBanner, 'image')
 
-@receiver(post_delete, sender=Banner)
-def banner_image_delete_cleanup(sender, instance, **kwargs):
-    delete_file_on_delete(instance, 'banner_image')
+# Home page fragments render banners and promo banners
+@receiver([post_save, post_delete], sender=Banner)
+@receiver([post_save, post_delete], sender=PromoBanner)
+def banner_changed_bump_home(sender, **kwargs):
+    bump_home_version()
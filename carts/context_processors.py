@@ -1,23 +1,7 @@
-from .models import Cart, CartItem
-from . views import _cart_id
+from .services import get_cart_count
 
 def counter(request):
-    cart_count = 0
     if 'admin' in request.path:
         return {}
-    else:
-        try:
-            cart = Cart.objects.filter(cart_id=_cart_id(request))
-            if request.user.is_authenticated:
-                cart_items = CartItem.objects.all().filter(user=request.user)
-            else:
-                cart_items = CartItem.objects.all().filter(cart=cart[:1])
-                
-            for cart_item in cart_items:
-                cart_count += cart_item.quantity
-        except Cart.DoesNotExist:
-            cart_count = 0
-    # return dict(cart_count=cart_count)
-    return {'cart_count': cart_count}
-
-
+    # Single SUM(quantity), cached until add/remove/order invalidates it
+    return {'cart_count': get_cart_count(request)}
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:23
+
+from django.conf import settings
+import hashlib
+
+from django.db import migrations, models
+
+
+def variation_signature(variation_ids):
+    # frozen copy of carts.models.variation_signature
+    joined = ','.join(str(pk) for pk in sorted(set(variation_ids)))
+    return hashlib.sha1(joined.encode()).hexdigest()
+
+
+def backfill_variation_keys(apps, schema_editor):
+    CartItem = apps.get_model('carts', 'CartItem')
+    through = CartItem.variations.through
+    ids = {}
+    for item_id, variation_id in through.objects.values_list('cartitem_id', 'variation_id'):
+        ids.setdefault(item_id, []).append(variation_id)
+    items = []
+    for item in CartItem.objects.filter(id__in=list(ids)).only('id'):
+        item.variation_key = variation_signature(ids[item.id])
+        items.append(item)
+    CartItem.objects.bulk_update(items, ['variation_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0001_initial'),
+        ('store', '0008_product_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_key',
+            field=models.CharField(default='da39a3ee5e6b4b0d3255bfef95601890afd80709', editable=False, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='cart_id',
+            field=models.CharField(blank=True, db_index=True, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['user', 'product', 'variation_key'], name='cartitem_user_line_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['cart', 'product', 'variation_key'], name='cartitem_cart_line_idx'),
+        ),
+        migrations.RunPython(backfill_variation_keys, migrations.RunPython.noop),
+    ]
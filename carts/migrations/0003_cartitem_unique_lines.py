@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # concurrent add_cart requests could create the same line twice; fold them
+    # into the oldest one so the unique constraints can be added
+    CartItem = apps.get_model('carts', 'CartItem')
+    for owner in ('user', 'cart'):
+        duplicates = (
+            CartItem.objects.filter(**{f'{owner}__isnull': False})
+            .values(owner, 'product', 'variation_key')
+            .annotate(lines=Count('id'), total=Sum('quantity'), keep=Min('id'))
+            .filter(lines__gt=1)
+        )
+        for row in duplicates:
+            lines = CartItem.objects.filter(
+                **{owner: row[owner], 'product': row['product'], 'variation_key': row['variation_key']}
+            )
+            lines.filter(id=row['keep']).update(quantity=row['total'])
+            lines.exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0002_cartitem_variation_key'),
+        ('store', '0008_product_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cartitem',
+            name='cartitem_user_line_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='cartitem',
+            name='cartitem_cart_line_idx',
+        ),
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'product', 'variation_key'), name='cartitem_user_line_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('cart__isnull', False)), fields=('cart', 'product', 'variation_key'), name='cartitem_cart_line_uniq'),
+        ),
+    ]
@@ -1,10 +1,23 @@
+import hashlib
+
 from django.db import models
+from django.db.models import Q
 from store.models import Product, Variation
 from accounts.models import Account
 
+
+def variation_signature(variation_ids):
+    """Canonical key for a set of variations: sha1 of the sorted, comma-joined ids."""
+    joined = ','.join(str(pk) for pk in sorted(set(variation_ids)))
+    return hashlib.sha1(joined.encode()).hexdigest()
+
+
+NO_VARIATIONS = variation_signature(())
+
+
 # Create your models here.
 class Cart(models.Model):
-    cart_id = models.CharField(max_length=250, blank=True) #This is the session id
+    cart_id = models.CharField(max_length=250, blank=True, db_index=True) #This is the session id
     date_added = models.DateField(auto_now_add=True)
     
     def __str__(self):
@@ -14,9 +27,20 @@ class CartItem(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variations = models.ManyToManyField(Variation, blank=True)
+    # variation_signature() of `variations`, so a cart line is one indexed lookup
+    variation_key = models.CharField(max_length=40, default=NO_VARIATIONS, editable=False)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, null=True)
     quantity = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+
+    class Meta:
+        # one line per owner + product + variations; also the indexes add_cart looks lines up by
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product', 'variation_key'], condition=Q(user__isnull=False),
+                                    name='cartitem_user_line_uniq'),
+            models.UniqueConstraint(fields=['cart', 'product', 'variation_key'], condition=Q(cart__isnull=False),
+                                    name='cartitem_cart_line_uniq'),
+        ]
     
     def sub_total(self):
         return self.product.price * self.quantity
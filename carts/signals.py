@@ -0,0 +1,17 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from .models import CartItem, variation_signature
+
+# Keep CartItem.variation_key in sync when variations are edited outside
+# add_cart (e.g. the admin); add_cart sets the key up front and flags the
+# instance, so no query runs there
+@receiver(m2m_changed, sender=CartItem.variations.through)
+def cart_item_variations_changed(sender, instance, action, reverse, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if instance.__dict__.pop('_variation_key_synced', False):
+        return
+    key = variation_signature(instance.variations.values_list('id', flat=True))
+    if key != instance.variation_key:
+        instance.variation_key = key
+        CartItem.objects.filter(pk=instance.pk).update(variation_key=key)
@@ -1,3 +1,201 @@
-from django.test import TestCase
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Account
+from category.models import Category
+from store.models import Product, Variation
+from .context_processors import counter
+from .models import Cart, CartItem, variation_signature
+from .services import merge_session_cart
+
+
+class MergeSessionCartTests(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='Cart', last_name='User',
+            username='cartuser', email='cart@example.com', password='testpass123',
+        )
+        self.user.is_active = True
+        self.user.save()
+        self.category = Category.objects.create(category_name='Clothes', slug='clothes')
+
+    def _product(self, i):
+        product = Product.objects.create(
+            product_name=f'Shirt {i}', slug=f'shirt-{i}', price=10, stock=50,
+            category=self.category, is_approved=True,
+        )
+        red = Variation.objects.create(product=product, variation_category='color', variation_value='red')
+        large = Variation.objects.create(product=product, variation_category='size', variation_value='L')
+        return product, [red, large]
+
+    def _item(self, product, variations, quantity, cart=None, user=None):
+        item = CartItem.objects.create(product=product, quantity=quantity, cart=cart, user=user)
+        item.variations.set(variations)
+        return item
+
+    def _fill(self, cart_id, lines):
+        cart = Cart.objects.create(cart_id=cart_id)
+        for i in range(lines):
+            product, variations = self._product(f'{cart_id}-{i}')
+            self._item(product, variations, 1, cart=cart)
+            # half the lines already sit in the user's cart with the same variations
+            if i % 2:
+                self._item(product, variations, 2, user=self.user)
+        return cart
+
+    def test_matching_lines_are_summed_and_others_reassigned(self):
+        cart = Cart.objects.create(cart_id='session-a')
+        product, (red, large) = self._product('a')
+        owned = self._item(product, [red, large], 2, user=self.user)
+        self._item(product, [large, red], 3, cart=cart)      # same variations, other order
+        other = self._item(product, [red], 1, cart=cart)     # different variations
+
+        self.assertEqual(merge_session_cart('session-a', self.user), 2)
+
+        owned.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(owned.quantity, 5)
+        self.assertEqual(other.user, self.user)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(CartItem.objects.filter(user__isnull=True).exists())
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        self._fill('small', 4)
+        self._fill('large', 40)
+        with CaptureQueriesContext(connection) as small:
+            merge_session_cart('small', self.user)
+        with CaptureQueriesContext(connection) as large:
+            merge_session_cart('large', self.user)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 8)
+
+    def test_login_merges_session_cart(self):
+        product, variations = self._product('login')
+        session = self.client.session
+        session.save()
+        cart = Cart.objects.create(cart_id=session.session_key)
+        item = self._item(product, variations, 1, cart=cart)
+
+        response = self.client.post(reverse('user_login'), {
+            'email': 'cart@example.com', 'password': 'testpass123',
+        })
+        self.assertEqual(response.status_code, 302)
+        item.refresh_from_db()
+        self.assertEqual(item.user, self.user)
+
+
+class AddCartTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Shoes', slug='shoes')
+        self.product = Product.objects.create(
+            product_name='Sneaker', slug='sneaker', price=40, stock=10,
+            category=category, is_approved=True,
+        )
+        self.black = Variation.objects.create(product=self.product, variation_category='color', variation_value='Black')
+        self.white = Variation.objects.create(product=self.product, variation_category='color', variation_value='White')
+        self.size = Variation.objects.create(product=self.product, variation_category='size', variation_value='42')
+        self.url = reverse('add_cart', args=[self.product.id])
+
+    def test_same_variations_bump_one_line(self):
+        self.client.post(self.url, {'color': 'black', 'size': '42'})
+        self.client.post(self.url, {'size': '42', 'color': 'BLACK'})
+        self.client.post(self.url, {'color': 'white', 'size': '42'})
+
+        lines = CartItem.objects.order_by('id')
+        self.assertEqual([line.quantity for line in lines], [2, 1])
+        self.assertEqual(set(lines[0].variations.all()), {self.black, self.size})
+        self.assertEqual(lines[0].variation_key, variation_signature([self.black.id, self.size.id]))
+
+    def test_existing_line_is_matched_with_constant_queries(self):
+        self.client.post(self.url, {'color': 'black', 'size': '42'})
+        # product, variations, session cart, UPDATE (+ session bookkeeping)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'color': 'black', 'size': '42'})
+        variation_queries = [q for q in ctx.captured_queries if 'store_variation' in q['sql']]
+        self.assertEqual(len(variation_queries), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_new_line_does_not_reread_its_variations(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'color': 'black', 'size': '42'})
+        through_reads = [q for q in ctx.captured_queries
+                         if q['sql'].startswith('SELECT') and 'carts_cartitem_variations' in q['sql']]
+        # only the m2m add() itself checks for existing rows
+        self.assertEqual(len(through_reads), 1)
+        self.assertEqual(CartItem.objects.get().variation_key, variation_signature([self.black.id, self.size.id]))
+
+    def test_one_line_per_owner_product_and_variations(self):
+        cart = Cart.objects.create(cart_id='abc')
+        CartItem.objects.create(product=self.product, cart=cart, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(product=self.product, cart=cart, quantity=1)
+
+    def test_concurrent_add_bumps_the_line_another_request_created(self):
+        real_update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # another request inserts the line between our UPDATE and INSERT
+            if queryset.model is CartItem and not CartItem.objects.exists():
+                CartItem.objects.create(product=self.product, cart=Cart.objects.get(), quantity=1)
+                return 0
+            return real_update(queryset, **kwargs)
+
+        with patch.object(QuerySet, 'update', racing_update):
+            response = self.client.post(self.url)
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_admin_style_variation_edit_refreshes_key(self):
+        item = CartItem.objects.create(product=self.product, quantity=1)
+        item.variations.add(self.white)
+        item.refresh_from_db()
+        self.assertEqual(item.variation_key, variation_signature([self.white.id]))
+
+
+class CartCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_name='Snacks', slug='snacks')
+        self.product = Product.objects.create(
+            product_name='Chips', slug='chips', price=5, stock=10,
+            category=category, is_approved=True,
+        )
+        self.user = Account.objects.create_user(
+            first_name='Count', last_name='User',
+            username='counter', email='counter@example.com', password='testpass123',
+        )
+        self.user.is_active = True
+        self.user.save()
+
+    def test_anonymous_visitor_without_cart_gets_no_session(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            self.assertEqual(counter(request), {'cart_count': 0})
+        self.assertIsNone(request.session.session_key)
+
+    def test_count_is_cached_until_the_cart_changes(self):
+        self.client.force_login(self.user)
+        add_url = reverse('add_cart', args=[self.product.id])
+        self.client.post(add_url)
+        self.client.post(add_url)
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertEqual(counter(request)['cart_count'], 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(counter(request)['cart_count'], 2)
+
+        item = CartItem.objects.get()
+        self.client.get(reverse('remove_cart', args=[self.product.id, item.id]))
+        self.assertEqual(counter(request)['cart_count'], 1)
@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from store.models import Product, Variation
-from .models import Cart, CartItem
+from .models import Cart, CartItem, variation_signature
+from .services import invalidate_cart_state
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
@@ -13,166 +16,83 @@ def _cart_id(request):
     
     # If there is no session, create a new session and return the cart id
     if not cart:
-        cart = request.session.create()
+        request.session.create()  # returns None; the new key is on the session
+        cart = request.session.session_key
     return cart
 
+def _posted_variations(request, product):
+    """Resolve every posted (category, value) pair, e.g. color=black, in one query."""
+    if request.method != 'POST':
+        return []
+    wanted = {}
+    for key, value in request.POST.items():
+        if key != 'csrfmiddlewaretoken':
+            wanted[key.lower()] = value.lower()
+    if not wanted:
+        return []
+    condition = Q()
+    for key, value in wanted.items():
+        # iexact also ignores small or capital
+        condition |= Q(variation_category__iexact=key, variation_value__iexact=value)
+    # one variation per category, like the old per-key Variation.objects.get
+    chosen = {}
+    for variation in Variation.objects.filter(condition, product=product).order_by('id'):
+        chosen.setdefault(variation.variation_category.lower(), variation)
+    return list(chosen.values())
+
+
 def add_cart(request, product_id):
     current_user = request.user
     product = get_object_or_404(Product, id=product_id, is_approved=True)
-    # If user is authenticated
-    if current_user.is_authenticated:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                # If the color is black, the name color will be stored in key
-                key = item
-                # And the name black will be stored inside value
-                value = request.POST[key]
-
-                try:
-                    # iexact also ignores small or capital
-                    variation = Variation.objects.get(product=product,variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
+    product_variation = _posted_variations(request, product)
 
-        # Block owner adding their own product
-        if request.user.is_authenticated and getattr(product, "owner_id", None) == request.user.id:
-            messages.error(request, "You cannot add your own product to the cart.")
-            return redirect(product.get_url())
-        
-        # Check Out of stock
-        if product.stock <= 0:
-            messages.info(request, "This item is currently out of stock.")
-            return redirect(product.get_url())
-        
-        # Cart Item
-        is_cart_item_exists = CartItem.objects.filter(product=product, user=current_user).exists()
-        
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, user=current_user)
-            
-            # existing variations, current variation, item id needed
-            # If the current variation is inside the existing variations, then increase
-            
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-                
-            if product_variation in ex_var_list:
-                # Increase
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, user=current_user)
-                if len(product_variation) > 0:
-                    item.variations.clear()
-                    item.variations.add(*product_variation)
-                item.save()
-            
-            # if cart_item.quantity >= product.stock:
-            #     messages.warning(request, "You've reached the available stock for this item.")
-            #     return redirect('cart')
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                user = current_user
-            )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-        
-        return redirect('cart')
-        
-    # If user is not authenticated
+    # Block owner adding their own product
+    if current_user.is_authenticated and getattr(product, "owner_id", None) == current_user.id:
+        messages.error(request, "You cannot add your own product to the cart.")
+        return redirect(product.get_url())
     
+    # Check Out of stock
+    if product.stock <= 0:
+        messages.info(request, "This item is currently out of stock.")
+        return redirect(product.get_url())
+
+    # Cart lines belong to the user, or to the session cart for anonymous visitors
+    if current_user.is_authenticated:
+        owner = {'user': current_user}
     else:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                # If the color is black, the name color will be stored in key
-                key = item
-                # And the name black will be stored inside value
-                value = request.POST[key]
+        cart, _ = Cart.objects.get_or_create(cart_id=_cart_id(request))
+        owner = {'cart': cart}
 
-                try:
-                    # iexact also ignores small or capital
-                    variation = Variation.objects.get(product=product,variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
+    # Same product + same variations -> same line: bump it with one indexed UPDATE
+    variation_key = variation_signature(v.id for v in product_variation)
+    updated = CartItem.objects.filter(
+        product=product, variation_key=variation_key, **owner
+    ).update(quantity=F('quantity') + 1)
 
-        # Block owner adding their own product
-        if request.user.is_authenticated and getattr(product, "owner_id", None) == request.user.id:
-            messages.error(request, "You cannot add your own product to the cart.")
-            return redirect(product.get_url())
-        
-        # Check Out of stock
-        if product.stock <= 0:
-            messages.info(request, "This item is currently out of stock.")
-            return redirect(product.get_url())
-        
-        # Cart
+    if not updated:
         try:
-            # Get the cart using the cart_id present in the session
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(
-                cart_id = _cart_id(request)
-            )
-        cart.save()
-        
-        # Cart Item
-        is_cart_item_exists = CartItem.objects.filter(product=product, cart=cart).exists()
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, cart=cart)
-            
-            # existing variations, current variation, item id needed
-            # If the current variation is inside the existing variations, then increase
-            
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-            if product_variation in ex_var_list:
-                # Increase
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, cart=cart)
-                if len(product_variation) > 0:
-                    item.variations.clear()
-                    item.variations.add(*product_variation)
-                item.save()
-            
-            # if cart_item.quantity >= product.stock:
-            #     messages.warning(request, "You've reached the available stock for this item.")
-            #     return redirect('cart')
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                cart = cart #Just saved cart
-            )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-        
-        return redirect('cart')
+            with transaction.atomic():
+                cart_item = CartItem.objects.create(
+                    product=product,
+                    quantity=1,
+                    variation_key=variation_key,
+                    **owner
+                )
+                if product_variation:
+                    cart_item._variation_key_synced = True  # key already matches (carts.signals)
+                    cart_item.variations.add(*product_variation)
+        except IntegrityError:
+            # a concurrent add created the line between our UPDATE and INSERT
+            CartItem.objects.filter(
+                product=product, variation_key=variation_key, **owner
+            ).update(quantity=F('quantity') + 1)
+    invalidate_cart_state(user=current_user, cart_id=request.session.session_key)
+
+    # if cart_item.quantity >= product.stock:
+    #     messages.warning(request, "You've reached the available stock for this item.")
+    #     return redirect('cart')
+    
+    return redirect('cart')
 
 def remove_cart(request, product_id, cart_item_id):
     # cart = Cart.objects.get(cart_id=_cart_id(request))
@@ -195,6 +115,7 @@ def remove_cart(request, product_id, cart_item_id):
         
     else:
         cart_item.delete()
+    invalidate_cart_state(user=request.user, cart_id=request.session.session_key)
         
     return redirect('cart')
 
@@ -210,6 +131,8 @@ def remove_cart_item(request, product_id, cart_item_id):
     
     if not deleted_count:
         messages.warning(request, "This item was not in your cart.")
+    else:
+        invalidate_cart_state(user=request.user, cart_id=request.session.session_key)
    
     return redirect('cart')
 
@@ -0,0 +1,11 @@
+from utils.cache import VersionedCache
+from .models import Category
+
+# Active categories for the navbar / store sidebar
+menu_links_cache = VersionedCache(
+    'menu_links', lambda: list(Category.objects.filter(status=True))
+)
+
+
+def get_menu_links():
+    return menu_links_cache.get()
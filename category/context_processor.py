@@ -1,6 +1,6 @@
-from .models import Category
+from .cache import get_menu_links
 
 
 def menu_links(request):
-    links = Category.objects.all().filter(status=True)
+    links = get_menu_links()
     return dict(links=links)
@@ -1,12 +1,18 @@
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
+from .cache import menu_links_cache
 from .models import Category
-from utils.media_cleanup import delete_old_file_on_update, delete_file_on_delete
+from marketplace.cache import bump_catalog_version, bump_home_version
+from utils.media_cleanup import track_files
 
-@receiver(pre_save, sender=Category)
-def category_image_update_cleanup(sender, instance, **kwargs):
-    delete_old_file_on_update(instance, Category, 'category_image')
+# Dedupe uploads; delete replaced/orphaned image files
+track_files(Category, 'category_image')
 
-@receiver(post_delete, sender=Category)
-def category_image_delete_cleanup(sender, instance, **kwargs):
-    delete_file_on_delete(instance, 'category_image')
+# Invalidate once the write is committed: a request refilling the cache
+# before that would read, and keep, the old rows
+@receiver([post_save, post_delete], sender=Category)
+def category_menu_links_changed(sender, **kwargs):
+    transaction.on_commit(menu_links_cache.invalidate)
+    bump_home_version()
+    bump_catalog_version()
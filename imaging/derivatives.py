@@ -0,0 +1,241 @@
+"""
+Pre-sized image derivatives.
+
+Every image in IMAGE_FIELDS is rendered once into fixed widths (SIZES) in
+WebP and JPEG, with EXIF orientation applied and metadata dropped. Files
+are stored under
+
+    derived/<hash[:2]>/<hash>/<size>-<width>.<ext>
+
+where <hash> is the SHA-256 of the original's bytes. The path changes
+whenever the content (or the configured width) does, so derivatives can be
+cached forever, and re-uploading the same picture reuses the same files.
+
+render_derivatives() only touches storage, so the backfill command can run
+it in worker processes. record_asset() writes the ImageAsset row and the
+cached lookup that the template tags read. A render never queries the
+database once the cache is warm (misses are cached too). Listings prime
+the lookups of all their images at once (prime_assets, the prime_images
+tag), so a cold cache costs one round trip and one query per listing
+rather than per image.
+
+AVIF is not generated: encoding it costs several times WebP on our hosts,
+and serving it would need <picture> markup in every template.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# (app_label.Model, field) pairs that get derivatives
+IMAGE_FIELDS = (
+    ('store.Product', 'images'),
+    ('store.ProductGallery', 'image'),
+    ('category.Category', 'category_image'),
+    ('banner.Banner', 'banner_image'),
+    ('banner.PromoBanner', 'image'),
+)
+
+# size name -> maximum width in pixels (never upscaled)
+SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 960,
+    'zoom': 1600,
+}
+
+# format -> (Pillow format, file extension)
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+DERIVED_ROOT = 'derived'
+_MISSING = 0  # cached marker for "no asset"; None means "not cached"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def derivative_name(content_hash, size, width, fmt):
+    return f'{DERIVED_ROOT}/{content_hash[:2]}/{content_hash}/{size}-{width}.{FORMATS[fmt][1]}'
+
+
+def _asset_cache_key(name):
+    return 'imaging:asset:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def _flatten(image, fmt):
+    """Convert to a mode the target format can encode."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if fmt == 'webp' and has_alpha:
+        return image.convert('RGBA')
+    if has_alpha:
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivatives(name, storage=None):
+    """
+    Write every SIZES x FORMATS derivative of the stored image `name`
+    (skipping files that already exist). Returns the asset fields:
+    {'name', 'content_hash', 'width', 'height', 'sizes', 'formats'}.
+    """
+    storage = storage or default_storage
+    quality = _setting('IMAGE_DERIVATIVE_QUALITY', 80)
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    with Image.open(io.BytesIO(data)) as image:
+        # let the JPEG decoder scale down by 1/2, 1/4 or 1/8 when it can
+        largest = max(SIZES.values())
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    width, height = image.size
+
+    sizes = {}
+    for size, max_width in SIZES.items():
+        w = min(max_width, width)
+        h = max(1, round(height * w / width))
+        sizes[size] = [w, h]
+        resized = None
+        for fmt, (pil_format, _) in FORMATS.items():
+            target = derivative_name(content_hash, size, w, fmt)
+            if storage.exists(target):
+                continue
+            if resized is None:
+                resized = image if w == width else image.resize((w, h), Image.LANCZOS)
+            buffer = io.BytesIO()
+            options = {'quality': quality, 'method': 4} if fmt == 'webp' else {'quality': quality, 'optimize': True, 'progressive': True}
+            _flatten(resized, fmt).save(buffer, pil_format, **options)
+            storage.save(target, ContentFile(buffer.getvalue()))
+
+    return {
+        'name': name,
+        'content_hash': content_hash,
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+        'formats': list(FORMATS),
+    }
+
+
+def _cached_value(asset):
+    return {'hash': asset['content_hash'], 'sizes': asset['sizes'], 'formats': asset['formats']}
+
+
+def record_asset(asset):
+    """Store the result of render_derivatives() and refresh the cached lookup."""
+    from .models import ImageAsset
+
+    ImageAsset.objects.update_or_create(
+        name=asset['name'],
+        defaults={k: asset[k] for k in ('content_hash', 'width', 'height', 'sizes', 'formats')},
+    )
+    cache.set(_asset_cache_key(asset['name']), _cached_value(asset),
+              _setting('IMAGE_ASSET_CACHE_TIMEOUT', 86400))
+
+
+def process_image(name):
+    """Render and record derivatives for `name`; errors are logged, not raised."""
+    try:
+        record_asset(render_derivatives(name))
+        return True
+    except Exception:
+        logger.exception("Could not build image derivatives for %s", name)
+        return False
+
+
+def get_asset(name):
+    """Cached {'hash', 'sizes', 'formats'} for a stored image, or None."""
+    if not name:
+        return None
+    key = _asset_cache_key(name)
+    value = cache.get(key)
+    if value is None:
+        from .models import ImageAsset
+
+        row = ImageAsset.objects.filter(name=name).values('content_hash', 'sizes', 'formats').first()
+        value = _cached_value(row) if row else _MISSING
+        cache.set(key, value, _setting('IMAGE_ASSET_CACHE_TIMEOUT', 86400))
+    return value or None
+
+
+def get_assets(names):
+    """Bulk get_asset(): {name: asset or None}, one cache round trip and at most one query."""
+    keys = {_asset_cache_key(name): name for name in names if name}
+    if not keys:
+        return {}
+    values = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = set(keys.values()) - values.keys()
+    if missing:
+        from .models import ImageAsset
+
+        rows = ImageAsset.objects.filter(name__in=missing).values('name', 'content_hash', 'sizes', 'formats')
+        loaded = {row['name']: _cached_value(row) for row in rows}
+        fetched = {name: loaded.get(name, _MISSING) for name in missing}
+        cache.set_many({_asset_cache_key(name): value for name, value in fetched.items()},
+                       _setting('IMAGE_ASSET_CACHE_TIMEOUT', 86400))
+        values.update(fetched)
+    return {name: value or None for name, value in values.items()}
+
+
+def prime_assets(fieldfiles):
+    """
+    Look up the assets of many images with get_assets() and keep each on its
+    FieldFile, so derivative_url/derivative_srcset need no further round trip.
+    """
+    fieldfiles = [fieldfile for fieldfile in fieldfiles if fieldfile]
+    assets = get_assets(fieldfile.name for fieldfile in fieldfiles)
+    for fieldfile in fieldfiles:
+        fieldfile._derivative_asset = (fieldfile.name, assets.get(fieldfile.name))
+
+
+def _asset_for(fieldfile):
+    primed = getattr(fieldfile, '_derivative_asset', None)
+    if primed is not None and primed[0] == fieldfile.name:
+        return primed[1]
+    return get_asset(fieldfile.name)
+
+
+def derivative_url(fieldfile, size='card', fmt='jpeg'):
+    """URL of one derivative, falling back to the original."""
+    if not fieldfile:
+        return ''
+    asset = _asset_for(fieldfile)
+    if asset is None or size not in asset['sizes'] or fmt not in asset['formats']:
+        return fieldfile.url
+    width = asset['sizes'][size][0]
+    return default_storage.url(derivative_name(asset['hash'], size, width, fmt))
+
+
+def derivative_srcset(fieldfile, largest='zoom', fmt='webp'):
+    """'url 160w, url 480w, ...' up to the `largest` size; '' without derivatives."""
+    if not fieldfile:
+        return ''
+    asset = _asset_for(fieldfile)
+    if asset is None or fmt not in asset['formats']:
+        return ''
+    entries, seen = [], set()
+    for size in SIZES:
+        if size not in asset['sizes']:
+            continue
+        width = asset['sizes'][size][0]
+        if width not in seen:
+            seen.add(width)
+            entries.append(f"{default_storage.url(derivative_name(asset['hash'], size, width, fmt))} {width}w")
+        if size == largest:
+            break
+    return ', '.join(entries)
@@ -0,0 +1,23 @@
+from django import forms
+
+from .uploads import process_upload
+
+
+class ProcessedImageField(forms.ImageField):
+    """
+    ImageField that decodes the upload once with process_upload() (size
+    limits, EXIF orientation, metadata stripped, re-encoded) instead of
+    forms.ImageField's verify() pass.
+    """
+    lossless = False
+
+    def to_python(self, data):
+        upload = forms.FileField.to_python(self, data)
+        if upload is None:
+            return None
+        return process_upload(upload, lossless=self.lossless)
+
+
+class LosslessImageField(ProcessedImageField):
+    """For images that must stay pixel exact, such as payment QR codes."""
+    lossless = True
@@ -0,0 +1,67 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from imaging.uploads import process_upload
+
+# (label, size, format); camera-style JPEGs carry EXIF orientation + GPS
+SAMPLES = [
+    ('phone 12MP jpeg', (4032, 3024), 'JPEG'),
+    ('camera 24MP jpeg', (6000, 4000), 'JPEG'),
+    ('screenshot png', (2880, 1800), 'PNG'),
+]
+
+
+def _sample(size, fmt, path):
+    # noise over a gradient compresses roughly like a photo
+    base = Image.linear_gradient('L').resize(size).convert('RGB')
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    image = Image.blend(base, noise, 0.35)
+    if fmt == 'JPEG':
+        exif = Image.Exif()
+        exif[0x0112] = 6                      # orientation: rotate 90
+        exif[0x8825] = {1: 'N', 2: (27.0, 42.0, 0.0)}  # GPS
+        image.save(path, 'JPEG', quality=95, exif=exif)
+    else:
+        image.save(path, 'PNG')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time upload processing (imaging.uploads.process_upload) on large "
+        "synthetic camera images against the old verify-and-store path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'sample':<18} {'input':>9} {'verify ms':>10} {'process ms':>11} {'output':>9} {'pixels out':>12}"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, size, fmt in SAMPLES:
+                path = os.path.join(tmp, f'sample.{fmt.lower()}')
+                _sample(size, fmt, path)
+                verify_ms, process_ms = [], []
+                for _ in range(options['repeat']):
+                    with open(path, 'rb') as f:
+                        start = time.perf_counter()
+                        Image.open(f).verify()   # what forms.ImageField did
+                        verify_ms.append((time.perf_counter() - start) * 1000)
+                    with open(path, 'rb') as f:
+                        start = time.perf_counter()
+                        result = process_upload(f)
+                        data = result.read()
+                        process_ms.append((time.perf_counter() - start) * 1000)
+                with Image.open(io.BytesIO(data)) as out:
+                    dims = f'{out.width}x{out.height}'
+                self.stdout.write(
+                    f"{label:<18} {os.path.getsize(path) / 1e6:>8.2f}M {statistics.median(verify_ms):>10.1f} "
+                    f"{statistics.median(process_ms):>11.1f} {len(data) / 1e6:>8.2f}M {dims:>12}"
+                )
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from imaging.derivatives import IMAGE_FIELDS, record_asset, render_derivatives
+from imaging.models import ImageAsset
+
+
+def _render(name):
+    try:
+        return name, render_derivatives(name), None
+    except Exception as exc:
+        return name, None, f"{type(exc).__name__}: {exc}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate missing image derivatives (thumb/card/detail/zoom in WebP and "
+        "JPEG) for every stored product, gallery, category and banner image, "
+        "using a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (1 renders in this process).")
+        parser.add_argument('--force', action='store_true',
+                            help="Re-render images that already have derivatives.")
+
+    def handle(self, *args, **options):
+        names = set()
+        for label, field in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True).distinct()
+            )
+        if not options['force']:
+            names -= set(ImageAsset.objects.filter(name__in=names).values_list('name', flat=True))
+        names = sorted(names)
+        self.stdout.write(f"{len(names)} image(s) to process.")
+
+        done = failed = 0
+        for name, asset, error in self._run(names, options['workers']):
+            if error:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+            else:
+                record_asset(asset)
+                done += 1
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {done} image(s), {failed} failed."))
+
+    def _run(self, names, workers):
+        if workers <= 1 or len(names) <= 1:
+            yield from map(_render, names)
+            return
+        # workers only touch storage; never share the parent's DB connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            futures = [pool.submit(_render, name) for name in names]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,98 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from imaging.derivatives import DERIVED_ROOT, _asset_cache_key
+from imaging.models import ImageAsset, StoredFile
+from utils.media_cleanup import file_fields
+
+
+def _walk(storage, path=''):
+    try:
+        dirs, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(path, name)
+    for name in dirs:
+        yield from _walk(storage, posixpath.join(path, name))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark-and-sweep media storage: mark every file referenced by a FileField "
+        "on any model (and the derivatives of referenced images), then report "
+        "or delete the unreferenced files older than --min-age."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete unreferenced files (default: only report them).")
+        parser.add_argument('--min-age', type=float, default=24,
+                            help="Only sweep files older than this many hours, so uploads "
+                                 "still being saved are left alone (default 24).")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+
+        # mark
+        referenced = set()
+        for model, field_name in file_fields():
+            names = (model._base_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                     .values_list(field_name, flat=True))
+            referenced.update(names.iterator(chunk_size=batch_size))
+        live_hashes, dead_assets = set(), []
+        for name, content_hash in ImageAsset.objects.values_list('name', 'content_hash').iterator(chunk_size=batch_size):
+            if name in referenced:
+                live_hashes.add(content_hash)
+            else:
+                dead_assets.append(name)
+
+        # sweep
+        garbage, seen, garbage_bytes = [], set(), 0
+        for name in _walk(storage):
+            seen.add(name)
+            if name in referenced or (name.endswith('.gz') and name[:-3] in referenced):
+                continue  # .gz: precompressed copy served by marketplace.media
+            parts = name.split('/')
+            if parts[0] == DERIVED_ROOT and len(parts) == 4 and parts[2] in live_hashes:
+                continue
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            garbage.append(name)
+            garbage_bytes += storage.size(name)
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"  {name}")
+        # hash records of files that are gone from storage
+        stale_records = [
+            name for name in StoredFile.objects.values_list('name', flat=True).iterator(chunk_size=batch_size)
+            if name not in seen and name not in referenced
+        ]
+
+        summary = (f"{len(referenced)} referenced file(s); {len(garbage)} unreferenced "
+                   f"({garbage_bytes / 1024 / 1024:.1f} MB), {len(dead_assets)} orphaned image asset(s)")
+        if not options['delete']:
+            self.stdout.write(f"{summary}. Run with --delete to remove them.")
+            return
+
+        for batch in _batches(garbage, batch_size):
+            for name in batch:
+                storage.delete(name)
+            StoredFile.objects.filter(name__in=batch).delete()
+        for batch in _batches(dead_assets + stale_records, batch_size):
+            ImageAsset.objects.filter(name__in=batch).delete()
+            StoredFile.objects.filter(name__in=batch).delete()
+            cache.delete_many([_asset_cache_key(name) for name in batch])
+        self.stdout.write(self.style.SUCCESS(f"{summary}; deleted."))
@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class ImageAsset(models.Model):
+    """
+    Derivatives generated for one stored image (see imaging.derivatives).
+    `name` is the storage name held by the ImageField; the derivative files
+    live under paths derived from `content_hash`.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    # {size: [width, height]} of each derivative, e.g. {"card": [480, 360]}
+    sizes = models.JSONField(default=dict)
+    formats = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class StoredFile(models.Model):
+    """
+    Content hash of an uploaded media file, so an identical later upload to
+    the same directory can reuse it (see utils.media_cleanup).
+    """
+    name = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
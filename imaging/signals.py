@@ -0,0 +1,42 @@
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+
+from .derivatives import IMAGE_FIELDS, process_image
+
+
+def _fields_by_model():
+    fields = {}
+    for label, field in IMAGE_FIELDS:
+        fields.setdefault(apps.get_model(label), []).append(field)
+    return fields
+
+
+FIELDS = _fields_by_model()
+
+
+def note_new_uploads(sender, instance, raw=False, **kwargs):
+    # a FieldFile that is not committed yet holds a fresh upload
+    if raw:
+        return
+    uploads = [f for f in FIELDS[sender] if getattr(instance, f) and not getattr(instance, f)._committed]
+    if uploads:
+        instance._new_image_fields = uploads
+
+
+def build_derivatives_for_uploads(sender, instance, raw=False, **kwargs):
+    fields = instance.__dict__.pop('_new_image_fields', ())
+    if raw or not getattr(settings, 'IMAGE_DERIVATIVES_ON_UPLOAD', True):
+        return
+    for field in fields:
+        name = getattr(instance, field).name
+        if name:
+            transaction.on_commit(partial(process_image, name))
+
+
+for model in FIELDS:
+    pre_save.connect(note_new_uploads, sender=model, dispatch_uid=f'imaging_note_{model._meta.label}')
+    post_save.connect(build_derivatives_for_uploads, sender=model, dispatch_uid=f'imaging_build_{model._meta.label}')
@@ -0,0 +1,31 @@
+from operator import attrgetter
+
+from django import template
+
+from imaging.derivatives import derivative_srcset, derivative_url, prime_assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(fieldfile, size='card', fmt='jpeg'):
+    """URL of a pre-sized derivative (JPEG by default), or the original."""
+    return derivative_url(fieldfile, size, fmt)
+
+
+@register.simple_tag
+def image_srcset(fieldfile, largest='zoom', fmt='webp'):
+    """srcset value listing the WebP derivatives up to `largest`."""
+    return derivative_srcset(fieldfile, largest, fmt)
+
+
+@register.simple_tag
+def prime_images(objects, field):
+    """
+    Look up the derivatives of `field` (a dotted path such as
+    'product.images') for every object of a listing at once, before the
+    loop renders them. Outputs nothing.
+    """
+    get = attrgetter(field)
+    prime_assets(get(obj) for obj in objects)
+    return ''
@@ -0,0 +1,302 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from accounts.forms import ProfileUpdateForm
+from category.models import Category
+from store.forms import ProductForm
+from store.models import Product
+from .derivatives import SIZES, derivative_name, get_asset, record_asset, render_derivatives
+from .forms import LosslessImageField, ProcessedImageField
+from .models import ImageAsset, StoredFile
+from .uploads import process_upload
+
+
+def make_jpeg(width=2000, height=1000, color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.category = Category.objects.create(category_name='Books', slug='books')
+
+    def make_product(self, slug, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                product_name=slug.title(), slug=slug, price=100, stock=1, category=self.category,
+                images=SimpleUploadedFile(f'{slug}.jpg', data, content_type='image/jpeg'),
+            )
+
+    def test_upload_builds_hashed_derivatives(self):
+        product = self.make_product('atlas', make_jpeg())
+        asset = ImageAsset.objects.get(name=product.images.name)
+        self.assertEqual((asset.width, asset.height), (2000, 1000))
+        self.assertEqual(asset.sizes['card'], [480, 240])
+        self.assertEqual(len(asset.content_hash), 64)
+        for size, (width, _) in asset.sizes.items():
+            for fmt in ('webp', 'jpeg'):
+                name = derivative_name(asset.content_hash, size, width, fmt)
+                self.assertTrue(default_storage.exists(name), name)
+        with default_storage.open(derivative_name(asset.content_hash, 'thumb', 160, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (160, 80))
+
+        # same bytes uploaded again share the derivative files
+        other = self.make_product('atlas-copy', make_jpeg())
+        self.assertEqual(ImageAsset.objects.get(name=other.images.name).content_hash, asset.content_hash)
+
+    def test_small_images_are_not_upscaled(self):
+        product = self.make_product('stamp', make_jpeg(300, 200))
+        sizes = ImageAsset.objects.get(name=product.images.name).sizes
+        self.assertEqual(sizes['thumb'], [160, 107])
+        self.assertEqual({tuple(sizes[s]) for s in ('card', 'detail', 'zoom')}, {(300, 200)})
+
+    def test_template_tags(self):
+        product = self.make_product('globe', make_jpeg())
+        cache.clear()
+        template = Template(
+            "{% load images %}{% image_url p.images 'card' %}|{% image_srcset p.images 'detail' %}"
+        )
+        with self.assertNumQueries(1):
+            rendered = template.render(Context({'p': product}))
+        with self.assertNumQueries(0):
+            self.assertEqual(template.render(Context({'p': product})), rendered)
+
+        url, srcset = rendered.split('|')
+        self.assertRegex(url, r'^/media/derived/[0-9a-f]{2}/[0-9a-f]{64}/card-480\.jpg$')
+        self.assertEqual([entry.split()[1] for entry in srcset.split(', ')], ['160w', '480w', '960w'])
+        self.assertTrue(all(entry.split()[0].endswith('.webp') for entry in srcset.split(', ')))
+
+    def test_listing_primes_all_lookups_at_once(self):
+        products = [self.make_product(f'card-{i}', make_jpeg(300, 200, (i * 40, 0, 0))) for i in range(3)]
+        products.append(Product.objects.create(
+            product_name='Plain', slug='plain', price=1, stock=1, category=self.category,
+            images='photos/products/plain.jpg',
+        ))
+        loop = "{% for p in products %}{% image_url p.images 'card' %} {% image_srcset p.images 'card' %};{% endfor %}"
+        plain = Template("{% load images %}" + loop)
+        primed = Template("{% load images %}{% prime_images products 'images' %}" + loop)
+
+        def listing():
+            return {'products': list(Product.objects.order_by('pk'))}
+
+        cache.clear()
+        context = listing()
+        with self.assertNumQueries(len(products)):
+            expected = plain.render(Context(context))
+        cache.clear()
+        context = listing()
+        with self.assertNumQueries(1):
+            rendered = primed.render(Context(context))
+        self.assertEqual(rendered, expected)
+        self.assertIn('/media/photos/products/plain.jpg ;', rendered)
+
+        # warm: no query and no per-image lookup, misses included
+        context = listing()
+        with self.assertNumQueries(0), mock.patch('imaging.derivatives.get_asset') as single:
+            self.assertEqual(primed.render(Context(context)), expected)
+        single.assert_not_called()
+
+    def test_missing_asset_falls_back_to_original(self):
+        product = Product.objects.create(
+            product_name='Plain', slug='plain', price=1, stock=1, category=self.category,
+            images='photos/products/plain.jpg',
+        )
+        rendered = Template("{% load images %}{% image_url p.images %}|{% image_srcset p.images %}").render(
+            Context({'p': product})
+        )
+        self.assertEqual(rendered, '/media/photos/products/plain.jpg|')
+        self.assertIsNone(get_asset(product.images.name))
+
+    def test_backfill_command(self):
+        names = []
+        for i in range(3):
+            names.append(default_storage.save(f'photos/products/old-{i}.jpg',
+                                              SimpleUploadedFile('x.jpg', make_jpeg(color=(i, 0, 0)))))
+            Product.objects.create(product_name=f'Old {i}', slug=f'old-{i}', price=1, stock=1,
+                                   category=self.category, images=names[-1])
+
+        out = StringIO()
+        call_command('build_image_derivatives', workers=2, stdout=out, stderr=StringIO())
+        self.assertIn('Built derivatives for 3 image(s), 0 failed.', out.getvalue())
+        self.assertEqual(set(ImageAsset.objects.values_list('name', flat=True)), set(names))
+        self.assertEqual(len(get_asset(names[0])['sizes']), len(SIZES))
+
+        out = StringIO()
+        call_command('build_image_derivatives', workers=2, stdout=out)
+        self.assertIn('0 image(s) to process.', out.getvalue())
+
+
+def upload(name, image, fmt='JPEG', **save_options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **save_options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(IMAGE_UPLOAD_MAX_SIDE=1000, IMAGE_UPLOAD_MAX_PIXELS=4_000_000)
+class UploadProcessingTests(TestCase):
+    def test_rotates_shrinks_and_strips_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, shown portrait
+        exif[0x010F] = 'Camera Co'
+        result = process_upload(upload('IMG_001.JPEG', Image.new('RGB', (1600, 1200), 'red'), exif=exif))
+
+        self.assertEqual(result.name, 'IMG_001.jpg')
+        with Image.open(result) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (750, 1000))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_small_images_keep_their_size(self):
+        result = process_upload(upload('small.png', Image.new('RGB', (300, 200), 'blue'), 'PNG'))
+        self.assertEqual(result.name, 'small.jpg')
+        with Image.open(result) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (300, 200)))
+
+    def test_transparency_and_lossless_stay_png(self):
+        result = process_upload(upload('logo.png', Image.new('RGBA', (50, 50), (0, 0, 0, 0)), 'PNG'))
+        with Image.open(result) as image:
+            self.assertEqual((image.format, image.mode), ('PNG', 'RGBA'))
+
+        qr = Image.new('1', (1200, 1200), 1)
+        result = process_upload(upload('qr.png', qr, 'PNG'), lossless=True)
+        with Image.open(result) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('PNG', '1', (1000, 1000)))
+
+    def test_rejects_bad_uploads(self):
+        cases = {
+            'invalid_image': SimpleUploadedFile('notes.jpg', b'not an image at all'),
+            'image_too_large': upload('huge.png', Image.new('1', (3000, 3000)), 'PNG'),
+        }
+        for code, bad in cases.items():
+            with self.subTest(code), self.assertRaises(ValidationError) as ctx:
+                process_upload(bad)
+            self.assertEqual(ctx.exception.code, code)
+        with self.assertRaises(ValidationError):
+            process_upload(upload('anim.tiff', Image.new('RGB', (10, 10)), 'TIFF'))
+
+    def test_forms_use_processing_fields(self):
+        self.assertIsInstance(ProductForm().fields['images'], ProcessedImageField)
+        profile = ProfileUpdateForm().fields
+        self.assertIsInstance(profile['profile_picture'], ProcessedImageField)
+        self.assertIsInstance(profile['payment_qr'], LosslessImageField)
+
+        field = ProcessedImageField(required=False)
+        self.assertIsNone(field.clean(None))
+        with self.assertRaises(ValidationError):
+            field.clean(SimpleUploadedFile('x.jpg', b'garbage'))
+
+
+class MediaLifecycleTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, IMAGE_DERIVATIVES_ON_UPLOAD=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(category_name='Maps', slug='maps')
+
+    def product(self, slug, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                product_name=slug.title(), slug=slug, price=1, stock=1, category=self.category,
+                images=SimpleUploadedFile(f'{slug}.jpg', data),
+            )
+
+    def test_changes_are_detected_from_loaded_state(self):
+        product = self.product('atlas', make_jpeg())
+        old_name = product.images.name
+        product = Product.objects.get(pk=product.pk)
+
+        product.product_name = 'Atlas 2'
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            product.save(update_fields=['product_name'])
+        self.assertTrue(default_storage.exists(old_name))
+
+        product.images = SimpleUploadedFile('atlas2.jpg', make_jpeg(color=(0, 0, 255)))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(product.images.name))
+
+        # a field deferred at load time falls back to reading the old name
+        deferred = Product.objects.only('pk').get(pk=product.pk)
+        current = product.images.name
+        deferred.images = SimpleUploadedFile('atlas3.jpg', make_jpeg(color=(0, 255, 0)))
+        with self.captureOnCommitCallbacks(execute=True):
+            deferred.save()
+        self.assertFalse(default_storage.exists(current))
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.product('atlas', make_jpeg())
+        second = self.product('atlas-copy', make_jpeg())
+        self.assertEqual(first.images.name, second.images.name)
+        self.assertEqual(len(default_storage.listdir('photos/products')[1]), 1)
+        self.assertEqual(StoredFile.objects.get().name, first.images.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.images.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.images.name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_old_file_is_deleted_only_on_commit(self):
+        product = self.product('atlas', make_jpeg())
+        old_name = product.images.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.images = SimpleUploadedFile('new.jpg', make_jpeg(color=(1, 2, 3)))
+            product.save()
+        self.assertTrue(default_storage.exists(old_name))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists(old_name))
+
+    def test_sweep_deletes_old_unreferenced_files(self):
+        kept = self.product('atlas', make_jpeg()).images.name
+        old_stray = default_storage.save('photos/users/left-behind.jpg', SimpleUploadedFile('x', b'x' * 10))
+        new_stray = default_storage.save('photos/users/uploading.jpg', SimpleUploadedFile('x', b'y'))
+        dead = render_derivatives(default_storage.save('photos/products/gone.jpg',
+                                                       SimpleUploadedFile('x', make_jpeg(color=(9, 9, 9)))))
+        record_asset(dead)
+        a_day_ago = time.time() - 2 * 86400
+        for root, _, files in os.walk(self.media):
+            for f in files:
+                if not f.startswith('uploading'):
+                    os.utime(os.path.join(root, f), (a_day_ago, a_day_ago))
+
+        out = StringIO()
+        call_command('sweep_media', stdout=out)
+        self.assertIn('1 referenced file(s); 10 unreferenced', out.getvalue())
+        self.assertIn('1 orphaned image asset(s)', out.getvalue())
+        self.assertTrue(default_storage.exists(old_stray))
+
+        call_command('sweep_media', '--delete', stdout=StringIO())
+        self.assertTrue(default_storage.exists(kept))
+        self.assertTrue(default_storage.exists(new_stray))
+        self.assertFalse(default_storage.exists(old_stray))
+        self.assertFalse(default_storage.exists(dead['name']))
+        self.assertFalse(ImageAsset.objects.filter(name=dead['name']).exists())
+        h = dead['content_hash']
+        self.assertEqual(default_storage.listdir(f'derived/{h[:2]}/{h}')[1], [])
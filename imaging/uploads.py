@@ -0,0 +1,99 @@
+"""
+Upload-time image normalisation.
+
+process_upload() is the one place an uploaded image is decoded. It checks
+the header first: format on the allowlist, and width x height within
+IMAGE_UPLOAD_MAX_PIXELS, so a decompression bomb is rejected before any
+pixel is allocated. It then decodes (JPEGs straight at reduced scale via
+draft()), applies EXIF orientation, and shrinks the image to fit
+IMAGE_UPLOAD_MAX_SIDE. It re-encodes without EXIF/XMP metadata: JPEG at
+IMAGE_UPLOAD_QUALITY, or PNG when the image has transparency or must stay
+lossless (payment QR codes).
+
+Pillow reads the source straight from the upload (Django spools large
+uploads to a temporary file). The output goes to a SpooledTemporaryFile
+that spills to disk past IMAGE_UPLOAD_SPOOL_SIZE, and storage copies it in
+chunks, so the file is never held in memory twice.
+"""
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF'}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def process_upload(upload, lossless=False):
+    """
+    Validate and re-encode an uploaded image file. Returns a django File
+    ready to assign to an ImageField; raises ValidationError for anything
+    that is not a reasonably sized image.
+    """
+    max_side = _setting('IMAGE_UPLOAD_MAX_SIDE', 2560)
+    max_pixels = _setting('IMAGE_UPLOAD_MAX_PIXELS', 50_000_000)
+
+    if hasattr(upload, 'seek'):
+        upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ValidationError("This image is too large.", code='image_too_large')
+    except Exception:
+        raise ValidationError(
+            "Upload a valid image. The file you uploaded was either not an image or a corrupted image.",
+            code='invalid_image',
+        )
+
+    with image:
+        if image.format not in ALLOWED_FORMATS:
+            raise ValidationError("Upload a JPEG, PNG, WebP or GIF image.", code='invalid_image')
+        if image.width * image.height > max_pixels:
+            raise ValidationError(
+                f"This image is too large ({image.width}x{image.height} pixels).", code='image_too_large'
+            )
+        try:
+            image.draft('RGB', (max_side, max_side))
+            icc_profile = image.info.get('icc_profile')
+            oriented = ImageOps.exif_transpose(image)
+            oriented.load()
+        except Exception:
+            raise ValidationError("The uploaded image could not be decoded.", code='invalid_image')
+
+    alpha = _has_alpha(oriented)
+    if not lossless or oriented.mode not in ('1', 'L', 'P', 'RGB', 'RGBA'):
+        # palette images resize with nearest-neighbour; photos need real colour
+        oriented = oriented.convert('RGBA' if alpha else 'RGB')
+    if max(oriented.size) > max_side:
+        oriented.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if lossless or alpha:
+        options, extension = {'format': 'PNG', 'optimize': True}, 'png'
+    else:
+        options = {
+            'format': 'JPEG', 'quality': _setting('IMAGE_UPLOAD_QUALITY', 85),
+            'optimize': True, 'progressive': True,
+        }
+        extension = 'jpg'
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+
+    output = tempfile.SpooledTemporaryFile(max_size=_setting('IMAGE_UPLOAD_SPOOL_SIZE', 2 * 1024 * 1024))
+    oriented.save(output, **options)
+    output.seek(0)
+
+    stem = os.path.splitext(os.path.basename(getattr(upload, 'name', '') or 'image'))[0] or 'image'
+    return File(output, name=f'{stem}.{extension}')
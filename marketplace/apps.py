@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MarketplaceConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'marketplace'
+
+    def ready(self):
+        import marketplace.checks
@@ -0,0 +1,270 @@
+"""
+Query-count and latency benchmarks for the public views.
+
+seed() fills the database with a synthetic marketplace at a given scale.
+run() requests every scenario and records, per view, the query count of a
+warm request and the median / p95 latency. compare() checks the results
+against the stored baseline (benchmark_baseline.json next to this file).
+
+Driven by `manage.py benchmark_views`; marketplace.tests runs the "small"
+scale on every test run and fails if any view needs more queries than its
+baseline.
+"""
+import io
+import json
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+# products, users, reviews per product, orders per buyer, activity rows
+SCALES = {
+    'small': dict(products=40, users=12, reviews=3, orders=2, activity=600),
+    'medium': dict(products=2_000, users=500, reviews=5, orders=3, activity=50_000),
+    'large': dict(products=50_000, users=20_000, reviews=5, orders=3, activity=1_000_000),
+}
+
+WORDS = (
+    "laptop phone charger notebook textbook calculator hoodie jacket sneakers "
+    "backpack bottle lamp headphones keyboard guitar novel physics snack coffee"
+).split()
+
+
+@dataclass
+class Dataset:
+    category: object
+    product: object
+    seller: object
+    buyer: object
+    order: object
+    payment: object
+    counts: dict = field(default_factory=dict)
+
+
+def seed(products, users, reviews, orders, activity, seed=42):
+    """Insert a synthetic marketplace and build every derived table."""
+    from accounts.models import Account
+    from carts.models import CartItem
+    from category.models import Category
+    from orders.models import Order, OrderProduct, Payment
+    from recommendations.engine import build_neighbors
+    from recommendations.ingest import update_recently_viewed
+    from recommendations.models import UserActivity
+    from recommendations.utils import rebuild_copurchases, rebuild_trending
+    from store.models import Product, Review
+    from store.search import get_search_backend
+
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    categories = Category.objects.bulk_create([
+        Category(category_name=f'Bench {name}', slug=f'bench-{name}')
+        for name in ('books', 'gadgets', 'clothes', 'snacks')
+    ])
+    accounts = Account.objects.bulk_create(
+        [
+            Account(first_name='Bench', last_name=str(i), username=f'bench-{i}',
+                    email=f'bench-{i}@example.com', is_active=True)
+            for i in range(max(users, 2))
+        ],
+        batch_size=2000,
+    )
+    seller, buyer = accounts[0], accounts[1]
+    catalog = Product.objects.bulk_create(
+        [
+            Product(
+                product_name=f"{' '.join(rng.choices(WORDS, k=3))} {i}",
+                slug=f'bench-product-{i}',
+                description=' '.join(rng.choices(WORDS, k=20)),
+                price=rng.randint(50, 5000),
+                stock=rng.randint(0, 50),
+                images='photos/products/bench.jpg',
+                category=rng.choice(categories),
+                owner=seller if i % 4 == 0 else rng.choice(accounts),
+                is_approved=True,
+                is_featured=i % 10 == 0,
+            )
+            for i in range(max(products, 1))
+        ],
+        batch_size=2000,
+    )
+
+    Review.objects.bulk_create(
+        [
+            Review(product=product, user=rng.choice(accounts), subject='Bench review',
+                   description='Solid.', rating=rng.randint(1, 5))
+            for product in catalog for _ in range(reviews)
+        ],
+        batch_size=2000,
+    )
+
+    payment = Payment.objects.create(user=buyer, payment_id='bench-payment', payment_method='eSewa',
+                                     amount_paid='0', status='COMPLETED')
+    order_rows, lines = [], []
+    for account in accounts[1:]:
+        for n in range(orders):
+            order_rows.append(Order(
+                user=account, payment=payment if account == buyer else None,
+                order_number=f'{90000000 + len(order_rows)}', first_name='Bench', last_name='Buyer',
+                phone='9800000000', email=account.email, address_line_1='Campus', country='Nepal',
+                state='Bagmati', city='Kathmandu', order_total=0, tax=0, is_ordered=True,
+            ))
+    order_rows = Order.objects.bulk_create(order_rows, batch_size=2000)
+    for order in order_rows:
+        for product in rng.sample(catalog, min(3, len(catalog))):
+            lines.append(OrderProduct(order=order, payment=order.payment, user_id=order.user_id,
+                                      product=product, quantity=1, product_price=product.price,
+                                      ordered=True))
+    OrderProduct.objects.bulk_create(lines, batch_size=2000)
+    CartItem.objects.bulk_create([
+        CartItem(user=buyer, product=product, quantity=1)
+        for product in rng.sample(catalog, min(3, len(catalog)))
+    ])
+
+    weights = [1 / (rank + 1) for rank in range(len(catalog))]
+    events = []
+    for user, product in zip(rng.choices(accounts, k=activity), rng.choices(catalog, weights=weights, k=activity)):
+        events.append(UserActivity(
+            user=user, product=product, action='buy' if rng.random() < 0.1 else 'view',
+            timestamp=now - timezone.timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+        ))
+    UserActivity.objects.bulk_create(events, batch_size=5000)
+
+    # bulk_create skips signals: build what they would have maintained
+    call_command('rebuild_ratings', stdout=io.StringIO())
+    rebuild_copurchases()
+    rebuild_trending()
+    build_neighbors()
+    update_recently_viewed([e for e in events if e.user_id == buyer.pk and e.action == 'view'])
+    get_search_backend().rebuild()
+    cache.clear()
+
+    return Dataset(
+        category=catalog[0].category, product=catalog[0], seller=seller, buyer=buyer,
+        order=next(o for o in order_rows if o.user_id == buyer.pk), payment=payment,
+        counts=dict(products=len(catalog), users=len(accounts), reviews=len(catalog) * reviews,
+                    orders=len(order_rows), activity=activity),
+    )
+
+
+BILLING = {
+    'first_name': 'Bench', 'last_name': 'Buyer', 'phone': '9800000000',
+    'email': 'bench@example.com', 'address_line_1': 'Campus', 'state': 'Bagmati',
+    'city': 'Kathmandu',
+}
+
+
+def scenarios(data):
+    """
+    (name, method, url, user, post data) for every benchmarked view.
+    'revalidate' is a GET carrying the ETag of a previous response (a 304).
+    """
+    product = data.product
+    detail_url = reverse('product_detail', args=[product.category.slug, product.slug])
+    return [
+        ('home', 'get', reverse('home'), None, None),
+        ('store', 'get', reverse('store'), None, None),
+        ('category', 'get', reverse('products_by_category', args=[data.category.slug]), None, None),
+        ('search', 'get', reverse('search') + '?keyword=laptop', None, None),
+        ('product_detail', 'get', detail_url, None, None),
+        ('store_304', 'revalidate', reverse('store'), None, None),
+        ('detail_304', 'revalidate', detail_url, None, None),
+        ('cart', 'get', reverse('cart'), data.buyer, None),
+        ('checkout', 'get', reverse('checkout'), data.buyer, None),
+        ('place_order', 'post', reverse('place_order'), data.buyer, BILLING),
+        ('order_complete', 'get',
+         f"{reverse('order_complete')}?order_number={data.order.order_number}&payment_id={data.payment.payment_id}",
+         data.buyer, None),
+        ('dashboard', 'get', reverse('user_dashboard'), data.seller, None),
+        ('my_sales', 'get', reverse('my_sales'), data.seller, None),
+        ('recently_viewed', 'get', reverse('recommendations:recently_viewed', args=[data.buyer.pk]), None, None),
+        ('also_bought', 'get', reverse('recommendations:also_bought', args=[product.pk]), None, None),
+        ('trending', 'get', reverse('recommendations:trending'), None, None),
+    ]
+
+
+def run(data, repeat=10, only=None):
+    """
+    {name: {'status', 'queries', 'p50_ms', 'p95_ms'}}. The query count is
+    taken from a warm request (after one warm-up), which is what steady
+    traffic sees. Activity is written synchronously so counts are stable.
+    ETags are on: everything runs in this process, so even LocMem is shared.
+    """
+    results = {}
+    with override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False, CATALOG_ETAGS=True):
+        for name, method, url, user, post in scenarios(data):
+            if only and name not in only:
+                continue
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            if method == 'revalidate':
+                client.get(url)  # the first response sets the CSRF cookie, which is part of the ETag
+                request = partial(client.get, headers={'If-None-Match': client.get(url)['ETag']})
+            else:
+                request = getattr(client, method)
+            args = (url, post) if post is not None else (url,)
+
+            request(*args)  # warm-up
+            queries = []
+            # not CaptureQueriesContext: request_started resets connection.queries_log
+            with connection.execute_wrapper(lambda execute, sql, *rest: queries.append(sql) or execute(sql, *rest)):
+                response = request(*args)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                request(*args)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = {
+                'status': response.status_code,
+                'queries': len(queries),
+                'p50_ms': round(statistics.median(timings), 2) if timings else None,
+                'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2) if timings else None,
+            }
+    return results
+
+
+def load_baseline(scale, path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text()).get(scale, {})
+
+
+def save_baseline(scale, results, path=BASELINE_PATH):
+    stored = json.loads(Path(path).read_text()) if Path(path).exists() else {}
+    stored[scale] = results
+    Path(path).write_text(json.dumps(stored, indent=2, sort_keys=True) + '\n')
+
+
+def compare(results, baseline, time_tolerance=None):
+    """
+    Regression messages: more queries than the baseline, a different status
+    code, or (with `time_tolerance`, e.g. 1.5) a p95 above baseline * tolerance.
+    """
+    problems = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            problems.append(f"{name}: no baseline recorded")
+            continue
+        if result['status'] != expected['status']:
+            problems.append(f"{name}: status {result['status']} (baseline {expected['status']})")
+        if result['queries'] > expected['queries']:
+            problems.append(f"{name}: {result['queries']} queries (baseline {expected['queries']})")
+        if time_tolerance and expected.get('p95_ms') and result['p95_ms'] is not None:
+            limit = expected['p95_ms'] * time_tolerance
+            if result['p95_ms'] > limit:
+                problems.append(f"{name}: p95 {result['p95_ms']} ms (baseline {expected['p95_ms']} ms)")
+    return problems
@@ -0,0 +1,55 @@
+import hashlib
+import uuid
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from banner.models import Banner, PromoBanner
+from category.models import Category
+from store.models import Product, Review
+from utils.cache import VersionedCache
+
+# Models whose rows show up in the cached home page fragments. Reviews are
+# included because ratings are written with update() and never touch
+# Product.updated_date.
+HOME_MODELS = (Product, Banner, PromoBanner, Category, Review)
+
+
+def _home_stamp():
+    parts = []
+    for model in HOME_MODELS:
+        row = model.objects.aggregate(latest=Max('updated_date'), rows=Count('pk'))
+        parts.append(f"{row['latest'].isoformat() if row['latest'] else '-'}/{row['rows']}")
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()[:12]
+
+
+# Version of the home page fragments: latest updated_date (plus row count, so
+# deletes count too) of every model they render. Signals invalidate it.
+home_version_cache = VersionedCache('home_version', _home_stamp)
+
+
+def get_home_version():
+    return home_version_cache.get()
+
+
+def bump_home_version():
+    # after commit: a request refilling the fragments before that would read,
+    # and cache for the whole timeout, the old rows
+    transaction.on_commit(home_version_cache.invalidate)
+
+
+# Version of what the catalog pages (store, category, product detail) and the
+# site layout show. Variations, gallery images, stock and site settings have
+# no updated_date to aggregate, so this is a fresh token per change; signals
+# (and stock reservation) invalidate it.
+catalog_version_cache = VersionedCache('catalog_version', lambda: uuid.uuid4().hex[:12])
+
+
+def get_catalog_version():
+    return catalog_version_cache.get()
+
+
+def bump_catalog_version():
+    # after commit, like bump_home_version: a revalidation before that would
+    # get the new ETag for the old page, and keep revalidating against it
+    transaction.on_commit(catalog_version_cache.invalidate)
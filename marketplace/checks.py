@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from utils.cache import is_shared_cache
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if not getattr(settings, 'SHARED_CACHE_REQUIRED', False) or is_shared_cache():
+        return []
+    return [Error(
+        "The default cache is per-process, so cache invalidation only reaches "
+        "the worker that made the change.",
+        hint="Set CACHE_BACKEND and CACHE_LOCATION to a Redis or Memcached server.",
+        id='marketplace.E001',
+    )]
@@ -0,0 +1,55 @@
+"""
+Conditional GET for the catalog pages (home, store, category, product detail).
+
+The ETag is a hash of cheap version stamps instead of the rendered page:
+the home stamp (latest updated_date and row count of products, reviews,
+categories and banners), the catalog version, and what the page shows of
+the visitor (user id, cached cart state, CSRF cookie). Computing it needs no
+query once those are cached, so a repeat visit or a crawler revalidating a
+page gets a 304 without running the view. Responses are private, no-cache:
+browsers keep them, but always revalidate.
+
+No ETag (a full render) while flash messages are pending, or when the view's
+etag function returns None. Nor with a per-process cache (LocMem) unless
+CATALOG_ETAGS forces them on: a worker that never saw a version bump would
+keep answering 304 for a page that changed.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from carts.services import get_cart_state
+from utils.cache import is_shared_cache
+from .cache import get_catalog_version, get_home_version
+
+
+def etags_enabled():
+    enabled = getattr(settings, 'CATALOG_ETAGS', None)
+    return is_shared_cache() if enabled is None else enabled
+
+
+def visitor_etag(request, *parts):
+    """ETag for a page rendered from catalog data for this visitor."""
+    if not etags_enabled() or len(get_messages(request)):
+        return None
+    cart = get_cart_state(request)
+    user = request.user.pk if request.user.is_authenticated else '-'
+    key = '|'.join(map(str, (
+        *parts, get_home_version(), get_catalog_version(), user,
+        cart['count'], sorted(cart['product_ids']), request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    )))
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def catalog_etag(request, *args, **kwargs):
+    return visitor_etag(request)
+
+
+def conditional_page(etag_func=catalog_etag):
+    """Answer GET/HEAD with 304 when `etag_func` matches If-None-Match."""
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(condition(etag_func=etag_func)(view))
+    return decorator
@@ -0,0 +1,241 @@
+"""
+Per-request SQL and timing instrumentation (REQUEST_INSTRUMENTATION).
+
+QueryInstrumentationMiddleware wraps every database connection with
+connection.execute_wrapper for the duration of a request and records the
+number of queries, total SQL time, exact duplicates (same SQL and params) and
+N+1 patterns (the same statement run REQUEST_INSTRUMENTATION_N_PLUS_ONE or
+more times with different params). Each response gets a Server-Timing
+header and one JSON log line on the "marketplace.requests" logger (WARNING
+when an N+1 pattern was seen).
+
+Every process also keeps a rolling latency histogram per URL name: one slot
+per REQUEST_INSTRUMENTATION_WINDOW seconds, the last
+REQUEST_INSTRUMENTATION_WINDOWS slots kept. Snapshots are published to the
+shared cache every REQUEST_INSTRUMENTATION_PUBLISH_INTERVAL seconds so that
+`manage.py request_stats` can merge the histograms of all workers.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('marketplace.requests')
+
+# Upper bounds (ms) of the latency buckets; the last bucket is open ended
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_WORKERS_KEY = 'request_stats:workers'
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_sql(sql):
+    """Collapse IN (%s, %s, ...) so queries differing only in list length match."""
+    return _IN_LIST.sub('(%s, ...)', sql)
+
+
+class QueryRecorder:
+    """execute_wrapper that records every statement run through it."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.executions = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            template = normalize_sql(sql)
+            self.statements[template] += 1
+            try:
+                self.executions[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    @property
+    def duplicates(self):
+        """Queries that repeated an identical earlier query."""
+        return sum(n - 1 for n in self.executions.values() if n > 1)
+
+    def n_plus_one(self, threshold):
+        """[(template, times)] for statements run at least `threshold` times."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _empty_entry():
+    return {
+        'requests': 0, 'duration_ms': 0.0, 'queries': 0, 'sql_ms': 0.0,
+        'duplicates': 0, 'n_plus_one': 0, 'buckets': [0] * (len(BUCKETS) + 1),
+    }
+
+
+def _bucket(duration_ms):
+    for index, bound in enumerate(BUCKETS):
+        if duration_ms <= bound:
+            return index
+    return len(BUCKETS)
+
+
+def merge_entry(into, entry):
+    for key in ('requests', 'duration_ms', 'queries', 'sql_ms', 'duplicates', 'n_plus_one'):
+        into[key] += entry[key]
+    into['buckets'] = [a + b for a, b in zip(into['buckets'], entry['buckets'])]
+    return into
+
+
+def percentile(buckets, q):
+    """Upper bound (ms) of the bucket holding the q-th quantile; None past the last bound."""
+    total = sum(buckets)
+    if not total:
+        return 0
+    rank = q * total
+    seen = 0
+    for index, n in enumerate(buckets):
+        seen += n
+        if seen >= rank:
+            return BUCKETS[index] if index < len(BUCKETS) else None
+    return None
+
+
+class RequestStats:
+    """Rolling per-URL-name histograms for this process."""
+
+    def __init__(self):
+        self.token = f'{socket.gethostname()}:{os.getpid()}'
+        self._slots = {}            # slot -> {url_name: entry}
+        self._lock = threading.Lock()
+        self._published = 0.0
+
+    def _window(self):
+        return _setting('REQUEST_INSTRUMENTATION_WINDOW', 300), _setting('REQUEST_INSTRUMENTATION_WINDOWS', 12)
+
+    def record(self, url_name, duration_ms, recorder, n_plus_one):
+        window, windows = self._window()
+        slot = int(time.time() // window)
+        with self._lock:
+            entries = self._slots.setdefault(slot, {})
+            entry = entries.get(url_name)
+            if entry is None:
+                entry = entries[url_name] = _empty_entry()
+            entry['requests'] += 1
+            entry['duration_ms'] += duration_ms
+            entry['queries'] += recorder.count
+            entry['sql_ms'] += recorder.duration * 1000
+            entry['duplicates'] += recorder.duplicates
+            entry['n_plus_one'] += bool(n_plus_one)
+            entry['buckets'][_bucket(duration_ms)] += 1
+            for old in [s for s in self._slots if s <= slot - windows]:
+                del self._slots[old]
+        self.maybe_publish()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                slot: {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in entries.items()}
+                for slot, entries in self._slots.items()
+            }
+
+    def maybe_publish(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._published < _setting('REQUEST_INSTRUMENTATION_PUBLISH_INTERVAL', 10):
+            return
+        self._published = now
+        window, windows = self._window()
+        try:
+            cache.set(f'request_stats:{self.token}', self.snapshot(), window * windows)
+            # index of live workers; entries of exited processes age out
+            cutoff = time.time() - window * windows
+            workers = {t: seen for t, seen in (cache.get(_WORKERS_KEY) or {}).items() if seen > cutoff}
+            workers[self.token] = time.time()
+            cache.set(_WORKERS_KEY, workers, None)
+        except Exception:
+            logger.exception("Could not publish request stats")
+
+    def reset(self):
+        with self._lock:
+            self._slots.clear()
+
+
+stats = RequestStats()
+
+
+def collect_stats(since_slots=None):
+    """Merge every worker's published histograms: {url_name: entry}."""
+    window, windows = stats._window()
+    oldest = int(time.time() // window) - (since_slots or windows) + 1
+    workers = cache.get(_WORKERS_KEY) or {}
+    snapshots = cache.get_many([f'request_stats:{token}' for token in workers])
+    merged = {}
+    for snapshot in snapshots.values():
+        for slot, entries in snapshot.items():
+            if slot < oldest:
+                continue
+            for name, entry in entries.items():
+                merge_entry(merged.setdefault(name, _empty_entry()), entry)
+    return merged
+
+
+def clear_stats():
+    workers = cache.get(_WORKERS_KEY) or {}
+    cache.delete_many([f'request_stats:{token}' for token in workers] + [_WORKERS_KEY])
+    stats.reset()
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not _setting('REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or '<unresolved>'
+        n_plus_one = recorder.n_plus_one(_setting('REQUEST_INSTRUMENTATION_N_PLUS_ONE', 5))
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f'app;dur={duration_ms:.2f}'
+        )
+        record = {
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'queries': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 2),
+            'duplicates': recorder.duplicates,
+        }
+        if n_plus_one:
+            record['n_plus_one'] = [{'sql': sql[:300], 'times': n} for sql, n in n_plus_one]
+        logger.log(logging.WARNING if n_plus_one else logging.INFO, json.dumps(record))
+
+        stats.record(url_name, duration_ms, recorder, n_plus_one)
+        return response
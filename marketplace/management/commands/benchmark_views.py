@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from marketplace import benchmarks
+from store.search import get_search_backend
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic marketplace, request every public view and report "
+        "queries and latency per view. Fails if a view needs more queries than "
+        "the stored baseline (or, with --time-tolerance, is slower than it). "
+        "Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', choices=sorted(benchmarks.SCALES))
+        parser.add_argument('--products', type=int, help="Override the scale's product count.")
+        parser.add_argument('--users', type=int, help="Override the scale's user count.")
+        parser.add_argument('--reviews', type=int, help="Reviews per product.")
+        parser.add_argument('--orders', type=int, help="Orders per user.")
+        parser.add_argument('--activity', type=int, help="UserActivity rows.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per view.")
+        parser.add_argument('--view', action='append', dest='views',
+                            help="Only benchmark this view (repeatable).")
+        parser.add_argument('--time-tolerance', type=float, default=None,
+                            help="Also fail when p95 exceeds baseline p95 times this factor.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store these results as the baseline for the scale.")
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        sizes = dict(benchmarks.SCALES[scale])
+        for key in sizes:
+            if options.get(key) is not None:
+                sizes[key] = options[key]
+
+        try:
+            with transaction.atomic():
+                data = benchmarks.seed(**sizes)
+                results = benchmarks.run(data, repeat=options['repeat'], only=options['views'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            backend = get_search_backend()
+            if hasattr(backend, 'reset'):
+                backend.reset()
+
+        baseline = benchmarks.load_baseline(scale)
+        self.stdout.write(", ".join(f"{k}={v}" for k, v in sizes.items()))
+        self.stdout.write(f"{'view':<16} {'status':>6} {'queries':>8} {'base':>5} {'p50 ms':>8} {'p95 ms':>8} {'base p95':>9}")
+        for name, result in results.items():
+            expected = baseline.get(name, {})
+            self.stdout.write(
+                f"{name:<16} {result['status']:>6} {result['queries']:>8} {expected.get('queries', '-'):>5} "
+                f"{result['p50_ms']:>8} {result['p95_ms']:>8} {expected.get('p95_ms', '-'):>9}"
+            )
+
+        if options['update_baseline']:
+            benchmarks.save_baseline(scale, {**baseline, **results})
+            self.stdout.write(self.style.SUCCESS(f"Baseline for '{scale}' updated."))
+            return
+
+        problems = benchmarks.compare(results, baseline, options['time_tolerance'])
+        if problems:
+            raise CommandError("Regressions:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.instrumentation import BUCKETS, clear_stats, collect_stats, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Dump the per-URL-name request histograms recorded by "
+        "QueryInstrumentationMiddleware (REQUEST_INSTRUMENTATION) across all workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', type=int, default=None,
+                            help="Only the most recent N windows (default: all kept).")
+        parser.add_argument('--sort', default='total', choices=['total', 'p95', 'queries', 'requests'])
+        parser.add_argument('--limit', type=int, default=30)
+        parser.add_argument('--reset', action='store_true', help="Clear the published stats afterwards.")
+
+    def handle(self, *args, **options):
+        rows = []
+        for name, entry in collect_stats(options['windows']).items():
+            n = entry['requests']
+            rows.append({
+                'name': name,
+                'requests': n,
+                'total': entry['duration_ms'],
+                'avg': entry['duration_ms'] / n,
+                'p50': percentile(entry['buckets'], 0.5),
+                'p95': percentile(entry['buckets'], 0.95),
+                'p99': percentile(entry['buckets'], 0.99),
+                'queries': entry['queries'] / n,
+                'sql': entry['sql_ms'] / n,
+                'duplicates': entry['duplicates'] / n,
+                'n_plus_one': entry['n_plus_one'],
+            })
+        # p95 of None means "above the last bucket"
+        key = options['sort']
+        rows.sort(key=lambda r: float('inf') if r[key] is None else r[key], reverse=True)
+
+        self.stdout.write(
+            f"{'url name':<36} {'reqs':>7} {'avg ms':>8} {'p50':>6} {'p95':>6} {'p99':>6} "
+            f"{'queries':>8} {'sql ms':>7} {'dups':>5} {'n+1':>5}"
+        )
+        for r in rows[:options['limit']]:
+            p50, p95, p99 = (str(p) if p is not None else f'>{BUCKETS[-1]}' for p in (r['p50'], r['p95'], r['p99']))
+            self.stdout.write(
+                f"{r['name']:<36} {r['requests']:>7} {r['avg']:>8.1f} {p50:>6} {p95:>6} {p99:>6} "
+                f"{r['queries']:>8.1f} {r['sql']:>7.1f} {r['duplicates']:>5.1f} {r['n_plus_one']:>5}"
+            )
+        if not rows:
+            self.stdout.write("No requests recorded (is REQUEST_INSTRUMENTATION on?).")
+
+        if options['reset']:
+            clear_stats()
+            self.stdout.write(self.style.SUCCESS("Request stats cleared."))
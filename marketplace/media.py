@@ -0,0 +1,116 @@
+"""
+Serving MEDIA_ROOT from Django, for deployments with no front-end web
+server for /media/ (gunicorn, Passenger via passenger_wsgi.py).
+
+Enabled with MEDIA_SERVE. Responses carry an ETag (size + mtime) and
+Last-Modified, so browsers and proxies revalidate with a 304 instead of
+downloading the file again. Files are streamed with FileResponse, which
+hands the open file to the server's wsgi.file_wrapper (gunicorn sends it
+with sendfile()). Derivatives under derived/ have the content hash in
+their path and never change, so they get a year-long immutable
+Cache-Control; other uploads get MEDIA_CACHE_MAX_AGE.
+
+Text assets (MEDIA_PRECOMPRESS_EXTENSIONS, SVG and JSON by default) are
+gzipped once into a `<name>.gz` file next to the original and that copy
+is sent to clients that accept gzip.
+"""
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+import stat as stat_module
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from imaging.derivatives import DERIVED_ROOT
+
+IMMUTABLE_PREFIXES = (DERIVED_ROOT + '/',)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _cache_control(path):
+    if path.startswith(IMMUTABLE_PREFIXES):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={_setting('MEDIA_CACHE_MAX_AGE', 86400)}"
+
+
+def _etag(stat, suffix=''):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+
+def gzip_sibling(full_path, stat):
+    """
+    Path of an up-to-date `<full_path>.gz`, writing it first if needed, or
+    None when compression doesn't make the file smaller.
+    """
+    compressed = full_path + '.gz'
+    try:
+        if os.stat(compressed).st_mtime_ns >= stat.st_mtime_ns:
+            return compressed
+    except FileNotFoundError:
+        pass
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+    try:
+        with open(full_path, 'rb') as source, os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as target:
+                shutil.copyfileobj(source, target)
+        if os.path.getsize(tmp) >= stat.st_size:
+            os.unlink(tmp)
+            return None
+        os.replace(tmp, compressed)  # atomic, so concurrent requests never see half a file
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        return None
+    return compressed
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("Media file not found.")
+    if not stat_module.S_ISREG(stat.st_mode):
+        raise Http404("Media file not found.")
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    served, encoding, etag = full_path, None, _etag(stat)
+    precompress = (
+        _setting('MEDIA_PRECOMPRESS', True)
+        and os.path.splitext(path)[1].lower() in _setting('MEDIA_PRECOMPRESS_EXTENSIONS', ('.svg', '.json'))
+    )
+    if precompress and _accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        compressed = gzip_sibling(full_path, stat)
+        if compressed:
+            served, encoding, etag = compressed, 'gzip', _etag(stat, '-gz')
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': _cache_control(path),
+    }
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(served, 'rb'), content_type=content_type)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    for header, value in headers.items():
+        response.headers[header] = value
+    if precompress:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
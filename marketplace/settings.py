@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # trigram lookups for store.search (no-op on SQLite)
     'loginattempt',  # Security: Fake admin login page
     'category.apps.CategoryConfig',
     'accounts.apps.AccountsConfig',
@@ -51,18 +52,22 @@ INSTALLED_APPS = [
     'carts.apps.CartsConfig',
     'orders.apps.OrdersConfig',
     'recommendations.apps.RecommendationsConfig',
+    'outbox.apps.OutboxConfig',
+    'imaging.apps.ImagingConfig',
+    'marketplace.apps.MarketplaceConfig',  # project-wide management commands
 ]
 
 MIDDLEWARE = [
+    'marketplace.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # straight after SecurityMiddleware so static files skip sessions/auth
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
-
 ]
 
 ROOT_URLCONF = 'marketplace.urls'
@@ -151,13 +156,130 @@ STATICFILES_DIRS = [
 ]
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # destination for collectstatic
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Django 5.1+ ignores STATICFILES_STORAGE. In production WhiteNoise serves the
+# hashed, pre-gzipped files written by collectstatic with immutable caching
+# (marketplace/storage.py); DEBUG keeps plain storage so no manifest is needed
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'marketplace.storage.StaticFilesStorage',
+    },
+}
 
 
 # media files configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Serve /media/ from Django (gunicorn/Passenger with no front-end server for
+# it): ETag/Last-Modified revalidation, immutable caching for hashed
+# derived/ paths, MEDIA_CACHE_MAX_AGE seconds for other uploads, and
+# gzipped copies of SVG/JSON files. Off by default outside DEBUG
+MEDIA_SERVE = config('MEDIA_SERVE', default=DEBUG, cast=bool)
+MEDIA_CACHE_MAX_AGE = 86400
+MEDIA_PRECOMPRESS = config('MEDIA_PRECOMPRESS', default=True, cast=bool)
+MEDIA_PRECOMPRESS_EXTENSIONS = ('.svg', '.json')
+
+# Pre-sized WebP/JPEG derivatives of product, category and banner images
+# (imaging app): built on upload and by `manage.py build_image_derivatives`
+IMAGE_DERIVATIVES_ON_UPLOAD = True
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_ASSET_CACHE_TIMEOUT = 86400
+
+# Uploaded images (product, profile, payment QR) are re-encoded on upload:
+# longest side, pixel-count limit (decompression bombs), JPEG quality, and
+# how much of the re-encoded file is kept in memory before spooling to disk
+IMAGE_UPLOAD_MAX_SIDE = 2560
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+IMAGE_UPLOAD_QUALITY = 85
+IMAGE_UPLOAD_SPOOL_SIZE = 2 * 1024 * 1024
+
+
+# Cache: per-process LocMem by default; point CACHE_BACKEND/CACHE_LOCATION at
+# Redis or Memcached in production so invalidation is shared by all workers
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='vohrla'),
+    }
+}
+# With DEBUG off, `manage.py check` (and migrate) fail on a per-process cache
+# (marketplace.E001): layout, home, cart and catalog versions would only be
+# bumped in the worker that handled the write
+SHARED_CACHE_REQUIRED = not DEBUG
+
+# Catalog pages answer If-None-Match with 304 (marketplace.conditional). The
+# ETags come from cached version stamps, so None sends them only with a
+# shared cache; True forces them on (one process, e.g. runserver), False off
+CATALOG_ETAGS = None
+
+# Site settings / menu categories: shared-cache lifetime and how long each
+# worker reuses its in-process copy before re-checking the version
+LAYOUT_CACHE_TIMEOUT = 3600
+LAYOUT_CACHE_LOCAL_TTL = 5
+
+# Home page fragments (banners, product grid, offer); keys change with the
+# home version so this only bounds how long unused versions linger
+HOME_FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Cached recommendation responses (also bought, trending); writes invalidate early
+RECOMMENDATIONS_CACHE_TIMEOUT = 300
+
+# Personalized recommendations: neighbours kept per product by
+# build_recommendations, and how long a user's ranking stays cached
+RECOMMENDATIONS_NEIGHBORS = 20
+RECOMMENDATIONS_USER_CACHE_TIMEOUT = 3600
+
+# Product views are queued and bulk inserted by a background thread once
+# BATCH_SIZE are pending or every FLUSH_INTERVAL seconds. Off: written
+# synchronously (tests that assert on activity rows override it)
+RECOMMENDATIONS_ACTIVITY_ASYNC = config('RECOMMENDATIONS_ACTIVITY_ASYNC', default=True, cast=bool)
+RECOMMENDATIONS_ACTIVITY_BATCH_SIZE = 200
+RECOMMENDATIONS_ACTIVITY_FLUSH_INTERVAL = 2.0
+
+# Distinct products kept in each user's recently-viewed list
+RECOMMENDATIONS_RECENTLY_VIEWED_SIZE = 10
+
+# Raw product views older than this are rolled up into daily counts by
+# `manage.py rollup_activity`
+RECOMMENDATIONS_ACTIVITY_RETENTION_DAYS = 90
+
+# Cached cart state (badge count, in-cart products) lifetime in seconds;
+# add/remove/order invalidate it early
+CART_COUNT_CACHE_TIMEOUT = 300
+
+
+# Store listing: products per page (keyset pages; no total is counted)
+STORE_PAGE_SIZE = config('STORE_PAGE_SIZE', default=12, cast=int)
+
+# Product search: dotted path to a store.search backend ('' = pick by database
+# vendor) and the maximum number of ranked results shown
+STORE_SEARCH_BACKEND = config('STORE_SEARCH_BACKEND', default='')
+STORE_SEARCH_LIMIT = config('STORE_SEARCH_LIMIT', default=100, cast=int)
+
+
+# Per-request SQL/timing instrumentation (Server-Timing header, JSON log lines
+# on "marketplace.requests", histograms for `manage.py request_stats`).
+# N_PLUS_ONE: repeats of one statement that count as an N+1 pattern;
+# WINDOW/WINDOWS: histogram slot length in seconds and how many are kept.
+REQUEST_INSTRUMENTATION = config('REQUEST_INSTRUMENTATION', default=False, cast=bool)
+REQUEST_INSTRUMENTATION_N_PLUS_ONE = 5
+REQUEST_INSTRUMENTATION_WINDOW = 300
+REQUEST_INSTRUMENTATION_WINDOWS = 12
+REQUEST_INSTRUMENTATION_PUBLISH_INTERVAL = 10
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'marketplace.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -185,6 +307,18 @@ EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
+# 'django.core.mail.backends.console.EmailBackend' prints mail locally;
+# tests always use the locmem backend
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+
+# Views queue mail in outbox.OutgoingEmail; `manage.py send_outbox` sends it
+# in batches of BATCH_SIZE, retrying after RETRY_DELAY * 2**(attempt-1)
+# seconds up to MAX_ATTEMPTS times. LEASE: how long a claimed row is
+# reserved for the worker sending it.
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_LEASE = 300
 
 # For eSewa
 ESEWA_PRODUCT_CODE = config('ESEWA_PRODUCT_CODE', default='EPAYTEST')
@@ -0,0 +1,30 @@
+"""
+Static files storage for DEBUG=False.
+
+collectstatic writes content-hashed, pre-compressed copies that WhiteNoise
+serves with a year-long immutable Cache-Control. Vendored CSS/JS refer to
+files that aren't shipped (Bootstrap's sourcemaps, two ui.css background
+images) and some templates to placeholder images that don't exist. Those
+references keep their plain URL instead of failing collectstatic or, for
+{% static %}, turning the whole page into a 500; the browser gets a 404
+for that one file, as it does with DEBUG on.
+"""
+import logging
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+logger = logging.getLogger(__name__)
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # only raised when `name` isn't among the static files
+            logger.warning("Static file %s not found; its URL is left unhashed.", name)
+            return name
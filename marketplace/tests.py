@@ -0,0 +1,365 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.contrib.messages import constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import Account
+from banner.models import Banner
+from carts.models import CartItem
+from carts.services import invalidate_cart_state
+from category.cache import menu_links_cache
+from category.models import Category
+from sitesetting.cache import site_setting_cache
+from orders.inventory import reserve_stock
+from orders.models import Order, OrderProduct
+from store.models import Product, Variation
+from store.search import get_search_backend
+from . import benchmarks, instrumentation
+from .checks import check_shared_cache
+from .media import serve_media
+from .cache import catalog_version_cache, home_version_cache
+
+
+class HomeFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for layout_cache in (home_version_cache, menu_links_cache, site_setting_cache):
+            layout_cache.invalidate()
+        self.category = Category.objects.create(category_name='Books', slug='books')
+        self.product = Product.objects.create(
+            product_name='Calculus Notes', slug='calculus-notes', price=150, stock=3,
+            category=self.category, is_approved=True, is_featured=True,
+        )
+
+    def test_warm_home_page_runs_no_queries(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Calculus Notes')
+
+    def test_product_change_bumps_version(self):
+        self.client.get(reverse('home'))
+        self.product.product_name = 'Linear Algebra Notes'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Linear Algebra Notes')
+        self.assertNotContains(response, 'Calculus Notes')
+
+    def test_banner_and_delete_bump_version(self):
+        self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Banner.objects.create(banner_title='Exam Week Sale')
+        self.assertContains(self.client.get(reverse('home')), 'Exam Week Sale')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertNotContains(self.client.get(reverse('home')), 'Calculus Notes')
+
+    def test_version_is_bumped_only_on_commit(self):
+        self.client.get(reverse('home'))
+        version = cache.get(home_version_cache.version_key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Banner.objects.create(banner_title='Uncommitted Sale')
+            self.assertEqual(cache.get(home_version_cache.version_key), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(home_version_cache.version_key), version)
+
+
+class ViewQueryBudgetTests(TestCase):
+    """Every benchmarked view stays within its recorded query count (see benchmarks.py)."""
+
+    def setUp(self):
+        cache.clear()
+        for layout_cache in (home_version_cache, menu_links_cache, site_setting_cache):
+            layout_cache.invalidate()
+
+    def test_no_query_regressions(self):
+        data = benchmarks.seed(**benchmarks.SCALES['small'])
+        backend = get_search_backend()
+        if hasattr(backend, 'reset'):
+            self.addCleanup(backend.reset)
+        results = benchmarks.run(data, repeat=0)
+        self.assertEqual(benchmarks.compare(results, benchmarks.load_baseline('small')), [])
+
+
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.clear_stats()
+        self.category = Category.objects.create(category_name='Books', slug='books')
+        self.products = [
+            Product.objects.create(product_name=f'Notes {i}', slug=f'notes-{i}', price=10, stock=1,
+                                   category=self.category, is_approved=True)
+            for i in range(6)
+        ]
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('store'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_PUBLISH_INTERVAL=0)
+    def test_header_log_and_stats(self):
+        with self.assertLogs('marketplace.requests', 'INFO') as logs:
+            response = Client().get(reverse('store'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        self.assertIn('"url_name": "store"', logs.output[0])
+
+        entry = instrumentation.collect_stats()['store']
+        self.assertEqual(entry['requests'], 1)
+        self.assertGreater(entry['queries'], 0)
+        self.assertEqual(sum(entry['buckets']), 1)
+
+    def test_recorder_flags_repeats(self):
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for product in self.products:
+                Product.objects.get(pk=product.pk)
+            Product.objects.get(pk=self.products[0].pk)
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]))
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:3]]))
+        self.assertEqual(recorder.count, 9)
+        self.assertEqual(recorder.duplicates, 1)
+        self.assertEqual([n for _, n in recorder.n_plus_one(5)], [7])
+        self.assertEqual([n for _, n in recorder.n_plus_one(2)], [7, 2])
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, MEDIA_CACHE_MAX_AGE=600)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.factory = RequestFactory()
+        self.write('photos/products/a.jpg', b'jpeg' * 100)
+        self.write('derived/ab/abcd/card-480.webp', b'webp' * 100)
+        self.svg = b'<svg xmlns="http://www.w3.org/2000/svg">' + b'<rect/>' * 200 + b'</svg>'
+        self.write('photos/logos/logo.svg', self.svg)
+
+    def write(self, name, data):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def get(self, path, **headers):
+        return serve_media(self.factory.get('/media/' + path, headers=headers), path)
+
+    def test_headers_and_conditional_get(self):
+        response = self.get('photos/products/a.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg' * 100)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=600')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        for headers in ({'If-None-Match': etag}, {'If-Modified-Since': last_modified}):
+            not_modified = self.get('photos/products/a.jpg', **headers)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(self.get('photos/products/a.jpg', **{'If-None-Match': '"other"'}).status_code, 200)
+
+        derived = self.get('derived/ab/abcd/card-480.webp')
+        self.assertEqual(derived['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_precompressed_svg(self):
+        response = self.get('photos/logos/logo.svg', **{'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), self.svg)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertTrue(os.path.exists(os.path.join(self.media, 'photos/logos/logo.svg.gz')))
+
+        plain = self.get('photos/logos/logo.svg')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+        self.assertEqual(b''.join(plain.streaming_content), self.svg)
+
+    def test_missing_and_unsafe_paths(self):
+        for path in ('photos/missing.jpg', '../settings.py', 'photos', '/etc/passwd'):
+            with self.subTest(path), self.assertRaises(Http404):
+                self.get(path)
+        self.assertEqual(serve_media(self.factory.post('/media/photos/products/a.jpg'),
+                                     'photos/products/a.jpg').status_code, 405)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    def test_per_process_cache_is_rejected_when_required(self):
+        with override_settings(CACHES=self.locmem, SHARED_CACHE_REQUIRED=False):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=self.locmem, SHARED_CACHE_REQUIRED=True):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ['marketplace.E001'])
+
+    def test_shared_cache_passes(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=shared, SHARED_CACHE_REQUIRED=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ProductionStaticFilesTests(TestCase):
+    """collectstatic and page rendering with the storage used when DEBUG is off."""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        override = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=self.static_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'marketplace.storage.StaticFilesStorage'},
+            },
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_collectstatic_and_render(self):
+        with self.assertLogs('marketplace.storage', 'WARNING') as logs:
+            call_command('collectstatic', '--noinput', verbosity=0)
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, 'staticfiles.json')))
+        hashed = staticfiles_storage.stored_name('css/bootstrap.css')
+        self.assertNotEqual(hashed, 'css/bootstrap.css')
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, hashed + '.gz')))
+        # vendored files referring to files that aren't shipped are left as they are
+        self.assertTrue(any('bootstrap.css.map' in line for line in logs.output))
+        with open(os.path.join(self.static_root, staticfiles_storage.stored_name('css/ui.css'))) as f:
+            self.assertIn('url("../images/banners/bg-pattern.svg")', f.read())
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, staticfiles_storage.url('images/logo1.png'))
+        # references to files that aren't shipped fall back to the plain URL
+        self.assertEqual(staticfiles_storage.url('images/cards/book.png'), '/static/images/cards/book.png')
+
+
+# activity rows written in the request; ETags forced on, as the test cache is LocMem
+@override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False, CATALOG_ETAGS=True)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for layout_cache in (home_version_cache, catalog_version_cache, menu_links_cache, site_setting_cache):
+            layout_cache.invalidate()
+        self.category = Category.objects.create(category_name='Books', slug='books')
+        self.product = Product.objects.create(
+            product_name='Calculus Notes', slug='calculus-notes', price=150, stock=3,
+            category=self.category, is_approved=True,
+        )
+        self.detail_url = reverse('product_detail', args=['books', 'calculus-notes'])
+
+    def revalidate(self, url, client=None):
+        client = client or self.client
+        client.get(url)  # sets the CSRF cookie on pages with forms
+        etag = client.get(url)['ETag']
+        return client.get(url, headers={'If-None-Match': etag})
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        for url in (reverse('home'), reverse('store'), reverse('products_by_category', args=['books']),
+                    self.detail_url):
+            with self.subTest(url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn('private', first['Cache-Control'])
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_changes_change_the_etag(self):
+        changes = [
+            lambda: Product.objects.filter(pk=self.product.pk).first().save(),
+            lambda: Variation.objects.create(product=self.product, variation_category='color', variation_value='red'),
+            lambda: reserve_stock([(self.product.pk, 1)]),
+        ]
+        for change in changes:
+            etag = self.client.get(self.detail_url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_only_after_commit(self):
+        etag = self.revalidate(self.detail_url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.product.price = 175
+                self.product.save()
+                # a revalidation during the write still matches the old page
+                response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.detail_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cart_and_user_are_part_of_the_etag(self):
+        user = Account.objects.create_user('Ram', 'Shah', 'ram', 'ram@example.com', 'pw')
+        user.is_active = True
+        user.save()
+        client = Client()
+        client.force_login(user)
+        url = reverse('store')
+        self.assertEqual(self.revalidate(url, client).status_code, 304)
+        etag = client.get(url)['ETag']
+        self.assertNotEqual(etag, self.client.get(url)['ETag'])
+
+        CartItem.objects.create(user=user, product=self.product, quantity=1)
+        invalidate_cart_state(user=user)
+        self.assertEqual(client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        # signed-in product views are tracked, so they always render
+        self.assertFalse(client.get(self.detail_url).has_header('ETag'))
+
+    def test_pending_messages_skip_the_etag(self):
+        etag = self.client.get(reverse('store'))['ETag']
+        storage = CookieStorage(RequestFactory().get('/'))
+        self.client.cookies[storage.cookie_name] = storage._encode([Message(constants.SUCCESS, 'Saved')])
+        response = self.client.get(reverse('store'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Saved')
+
+    @override_settings(CATALOG_ETAGS=None)
+    def test_etags_need_a_shared_cache(self):
+        self.assertFalse(self.client.get(reverse('store')).has_header('ETag'))
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(self.revalidate(reverse('store')).status_code, 304)
+
+    def test_cash_on_delivery_bumps_the_catalog_version(self):
+        user = Account.objects.create_user('Ram', 'Shah', 'ram', 'ram@example.com', 'pw')
+        user.is_active = True
+        user.save()
+        order = Order.objects.create(user=user, order_number='COD1', first_name='Ram', last_name='Shah',
+                                     phone='9800000000', email='ram@example.com', address_line_1='Campus',
+                                     state='Bagmati', city='Kathmandu', order_total=150, tax=0, ip='127.0.0.1')
+        OrderProduct.objects.create(order=order, user=user, product=self.product, quantity=1,
+                                    product_price=150, ordered=False)
+        client = Client()
+        client.force_login(user)
+        version = catalog_version_cache.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('payments', args=[order.id]))
+        self.assertRedirects(response, f"{reverse('order_complete')}?order_number=COD1&payment_id=PAY-COD1",
+                             fetch_redirect_response=False)
+        # product_detail's "has ordered" flag and review form depend on it
+        self.assertNotEqual(catalog_version_cache.get(), version)
@@ -1,35 +1,48 @@
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.functional import SimpleLazyObject
 from store.models import Product
 from banner.models import Banner, PromoBanner
-from category.models import Category
-from sitesetting.models import SiteSetting, ContactSetting
+from category.cache import get_menu_links
+from sitesetting.cache import get_site_setting, get_contact_setting
+from .cache import get_home_version
+from .conditional import conditional_page
 
+@conditional_page()
 def home(request):
+    # Everything below is lazy: the template only evaluates it when a cached
+    # fragment (keyed by home_version) is missing.
+
     # Show only the 4 newest approved products
     products = (
         Product.objects
         .filter(status=True, is_approved=True)
+        .select_related('category')
         .order_by('-updated_date', '-created_date')[:4]
     )
 
     # Active banners
     banners = Banner.objects.filter(status=True)
-    promo_banner_left = PromoBanner.objects.filter(is_active=True, position='left').first()
-    promo_banner_right = PromoBanner.objects.filter(is_active=True, position='right').first()
+    promo_banner_left = SimpleLazyObject(
+        lambda: PromoBanner.objects.filter(is_active=True, position='left').first()
+    )
+    promo_banner_right = SimpleLazyObject(
+        lambda: PromoBanner.objects.filter(is_active=True, position='right').first()
+    )
 
     # Show only 4 categories on homepage
-    categories = Category.objects.filter(status=True)[:4]
+    categories = get_menu_links()[:4]
 
     # Great Offer: newest featured product, or fallback to newest product
-    offer_product = (
-        Product.objects
+    offer_product = SimpleLazyObject(
+        lambda: Product.objects
         .filter(status=True, is_approved=True, is_featured=True)
         .order_by('-updated_date', '-created_date')
         .first()
     )
 
     # Site Settings for Hero Section
-    site_setting = SiteSetting.objects.first()
+    site_setting = get_site_setting()
 
     context = {
         'products': products,
@@ -39,6 +52,8 @@ def home(request):
         'promo_banner_left': promo_banner_left,
         'promo_banner_right': promo_banner_right,
         'site_setting': site_setting,
+        'home_version': get_home_version(),
+        'home_cache_timeout': settings.HOME_FRAGMENT_CACHE_TIMEOUT,
     }
 
     return render(request, 'home/home.html', context)
@@ -48,9 +63,9 @@ def contact(request):
         # Handle form submission here (e.g., send email)
         pass
     
-    site_setting = SiteSetting.objects.first()
-    # Get or create ContactSetting to ensure it always exists
-    contact_setting, created = ContactSetting.objects.get_or_create(pk=1)
+    site_setting = get_site_setting()
+    # Cached; created on first use so it always exists
+    contact_setting = get_contact_setting()
     
     # Debug output
     print(f"DEBUG: contact_setting = {contact_setting}")
@@ -1,3 +1,208 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Account
+from carts.models import CartItem
+from category.models import Category
+from outbox.models import OutgoingEmail
+from recommendations.models import UserActivity
+from store.models import Product, Variation
+from .inventory import InsufficientStock, reserve_stock
+from .models import Order, OrderProduct
+
+BILLING = {
+    'first_name': 'Test', 'last_name': 'Buyer', 'phone': '9800000000',
+    'email': 'buyer@example.com', 'address_line_1': 'Campus', 'state': 'Bagmati',
+    'city': 'Kathmandu',
+}
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='Test', last_name='Buyer',
+            username='buyer', email='buyer@example.com', password='testpass123',
+        )
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(category_name='Books', slug='books')
+
+    def _fill_cart(self, size):
+        products = Product.objects.bulk_create([
+            Product(product_name=f'Book {i}', slug=f'book-{i}', price=100 + i, stock=10,
+                    category=self.category, is_approved=True)
+            for i in range(size)
+        ])
+        for product in products:
+            item = CartItem.objects.create(user=self.user, product=product, quantity=2)
+            color = Variation.objects.create(product=product, variation_category='color', variation_value='red')
+            item.variations.add(color)
+        return products
+
+    def _place(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('place_order'), BILLING)
+        return response, len(queries)
+
+    def test_order_totals_lines_and_variations(self):
+        products = self._fill_cart(3)
+        response, _ = self._place()
+
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('payments', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.order_number, timezone.localdate().strftime('%Y%m%d') + str(order.id))
+        subtotal = sum(p.price * 2 for p in products)
+        self.assertEqual(order.tax, subtotal * 2 / 100)
+        self.assertEqual(order.order_total, subtotal + order.tax)
+
+        lines = OrderProduct.objects.filter(order=order).prefetch_related('variations')
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            self.assertFalse(line.ordered)
+            self.assertEqual(line.quantity, 2)
+            self.assertEqual([v.variation_value for v in line.variations.all()], ['red'])
+
+    def test_query_count_does_not_grow_with_cart(self):
+        self._fill_cart(1)
+        _, small = self._place()
+        CartItem.objects.all().delete()
+        Product.objects.all().delete()
+
+        self._fill_cart(50)
+        _, large = self._place()
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 12)
+
+    def test_empty_cart_and_get(self):
+        self.assertRedirects(self.client.post(reverse('place_order'), BILLING),
+                             reverse('store'), fetch_redirect_response=False)
+        self._fill_cart(1)
+        self.assertRedirects(self.client.get(reverse('place_order')),
+                             reverse('checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class ReserveStockTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Books', slug='books')
+        self.a, self.b = Product.objects.bulk_create([
+            Product(product_name=name, slug=name.lower(), price=100, stock=3,
+                    category=category, is_approved=True)
+            for name in ('Atlas', 'Bible')
+        ])
+
+    def test_one_lock_and_one_update(self):
+        with transaction.atomic(), self.assertNumQueries(2):
+            remaining = reserve_stock([(self.a.pk, 1), (self.b.pk, 3), (self.a.pk, 1)])
+        self.assertEqual(remaining, {self.a.pk: 1, self.b.pk: 0})
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'stock')), {self.a.pk: 1, self.b.pk: 0}
+        )
+
+    def test_shortage_changes_nothing(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve_stock([(self.a.pk, 1), (self.b.pk, 4)])
+        self.assertEqual(ctx.exception.shortages, {self.b.pk: (4, 3)})
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+
+class EsewaReturnTests(PlaceOrderTests):
+    def _esewa_return(self, order):
+        data = base64.b64encode(json.dumps(
+            {'status': 'COMPLETE', 'transaction_code': f'TX{order.id}'}
+        ).encode()).decode()
+        return self.client.get(reverse('esewa_return', args=[order.id]), {'data': data})
+
+    def test_completion_reserves_stock_once(self):
+        products = self._fill_cart(2)
+        self._place()
+        order = Order.objects.get()
+
+        response = self._esewa_return(order)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('order_complete'), response['Location'])
+        self.assertEqual(set(Product.objects.filter(pk__in=[p.pk for p in products])
+                             .values_list('stock', flat=True)), {8})
+        self.assertTrue(all(OrderProduct.objects.values_list('ordered', flat=True)))
+
+        # a repeated callback does not decrement again
+        self._esewa_return(order)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {8})
+        self.assertEqual(UserActivity.objects.filter(user=self.user, action='buy').count(), 2)
+
+    def test_tracking_failure_does_not_break_completion(self):
+        self._fill_cart(2)
+        self._place()
+        order = Order.objects.get()
+
+        with mock.patch('recommendations.utils.record_copurchase', side_effect=RuntimeError), \
+                self.assertLogs('recommendations.utils', 'ERROR'):
+            response = self._esewa_return(order)
+        self.assertIn(reverse('order_complete'), response['Location'])
+        order.refresh_from_db()
+        self.assertTrue(order.is_ordered)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        self.assertFalse(UserActivity.objects.exists())
+
+    def test_sold_out_leaves_order_unpaid(self):
+        products = self._fill_cart(2)
+        self._place()
+        order = Order.objects.get()
+        Product.objects.filter(pk=products[1].pk).update(stock=1)
+
+        response = self._esewa_return(order)
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        order.refresh_from_db()
+        self.assertFalse(order.is_ordered)
+        self.assertFalse(any(OrderProduct.objects.values_list('ordered', flat=True)))
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock, 10)
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Many simultaneous completions against one low-stock product never oversell."""
+
+    def test_no_oversell(self):
+        category = Category.objects.create(category_name='Books', slug='books')
+        product = Product.objects.create(product_name='Rare Book', slug='rare-book', price=100,
+                                         stock=5, category=category, is_approved=True)
+        outcomes = []
+        start = threading.Barrier(20)
+
+        def buyer():
+            try:
+                start.wait()
+                for _ in range(200):
+                    try:
+                        with transaction.atomic():
+                            reserve_stock([(product.pk, 1)])
+                        outcomes.append('ok')
+                        return
+                    except InsufficientStock:
+                        outcomes.append('sold out')
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)  # SQLite: locked by another writer; retry
+                outcomes.append('gave up')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(outcomes.count('ok'), 5)
+        self.assertEqual(outcomes.count('sold out'), 15)
+        self.assertEqual(product.stock, 0)
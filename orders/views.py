@@ -2,7 +2,6 @@ import uuid
 import hmac
 import base64
 import hashlib
-import datetime
 import random
 import string
 import json
@@ -15,10 +14,15 @@ from django.http import JsonResponse
 from django.utils import timezone
 from django.urls import reverse
 from django.core.mail import EmailMessage
-from django.db.models import F
+from django.db import transaction
 from django.template.loader import render_to_string
+from outbox.services import enqueue as enqueue_email
+from .inventory import InsufficientStock, reserve_stock
 from .models import Order, OrderProduct, Payment
 from carts.models import CartItem
+from carts.services import invalidate_cart_state
+from marketplace.cache import bump_catalog_version
+from recommendations.utils import track_order_purchase
 from store.models import Product
 from accounts.models import Account
 
@@ -66,76 +70,76 @@ def generate_order_number():
 def place_order(request, total=0, quantity=0):
     current_user = request.user
 
-    # If cart count is 0 or less, redirect back to store
-    cart_items = CartItem.objects.filter(user=current_user)
-    cart_count = cart_items.count()
-    if cart_count <= 0:
-        return redirect('store')
-
-    # Totals
-    grand_total = 0
-    tax = 0
-
-    for cart_item in cart_items:
-        total += (cart_item.product.price * cart_item.quantity)
-        quantity += cart_item.quantity
+    if request.method != 'POST':
+        # Nothing to place: back to the store, otherwise to checkout
+        if not CartItem.objects.filter(user=current_user).exists():
+            return redirect('store')
+        return redirect('checkout')
+
+    with transaction.atomic():
+        # Lock the cart lines (and their products) once, in product order so
+        # concurrent checkouts of overlapping carts lock in the same order
+        cart_items = list(
+            CartItem.objects.select_for_update()
+            .filter(user=current_user)
+            .select_related('product')
+            .prefetch_related('variations')
+            .order_by('product_id', 'id')
+        )
+        if not cart_items:
+            return redirect('store')
 
-    tax = (2 * total) / 100
-    grand_total = total + tax
+        # Totals
+        for cart_item in cart_items:
+            total += (cart_item.product.price * cart_item.quantity)
+            quantity += cart_item.quantity
+        tax = (2 * total) / 100
+        grand_total = total + tax
 
-    if request.method == 'POST':
         # Store all billing information in Order table
-        data = Order()
-        data.user = current_user
-        data.first_name = request.POST.get('first_name')
-        data.last_name = request.POST.get('last_name')
-        data.phone = request.POST.get('phone')
-        data.email = request.POST.get('email')
-        data.address_line_1 = request.POST.get('address_line_1')
-        data.address_line_2 = request.POST.get('address_line_2', '')
-        data.country = request.POST.get('country', 'Nepal')
-        data.state = request.POST.get('state')
-        data.city = request.POST.get('city')
-        data.order_note = request.POST.get('order_note', '')
-        data.order_total = grand_total
-        data.tax = tax
-        data.ip = request.META.get('REMOTE_ADDR')
-        data.is_ordered = False
-        data.save()
-
-        # Generate order number (YYYYMMDD + DB id)
-        yr = int(datetime.date.today().strftime('%Y'))
-        dt = int(datetime.date.today().strftime('%d'))
-        mt = int(datetime.date.today().strftime('%m'))
-        d = datetime.date(yr, mt, dt)
-        current_date = d.strftime('%Y%m%d')  # e.g. 20250204
-        order_number = current_date + str(data.id)
-        data.order_number = order_number
-        data.save()
-
-        # Fetch the newly created (unpaid) order and go to payments page
-        order = Order.objects.get(
+        order = Order.objects.create(
             user=current_user,
+            first_name=request.POST.get('first_name'),
+            last_name=request.POST.get('last_name'),
+            phone=request.POST.get('phone'),
+            email=request.POST.get('email'),
+            address_line_1=request.POST.get('address_line_1'),
+            address_line_2=request.POST.get('address_line_2', ''),
+            country=request.POST.get('country', 'Nepal'),
+            state=request.POST.get('state'),
+            city=request.POST.get('city'),
+            order_note=request.POST.get('order_note', ''),
+            order_total=grand_total,
+            tax=tax,
+            ip=request.META.get('REMOTE_ADDR'),
             is_ordered=False,
-            order_number=order_number
         )
 
-        # Create OrderProduct records for each cart item
-        for cart_item in cart_items:
-            OrderProduct.objects.create(
+        # Order number is YYYYMMDD + DB id; set with a single-column UPDATE
+        order.order_number = timezone.localdate().strftime('%Y%m%d') + str(order.id)
+        Order.objects.filter(pk=order.pk).update(order_number=order.order_number)
+
+        # OrderProduct records (ordered=True once payment completes)
+        order_products = OrderProduct.objects.bulk_create([
+            OrderProduct(
                 order=order,
                 user=current_user,
                 product=cart_item.product,
                 quantity=cart_item.quantity,
                 product_price=cart_item.product.price,
-                ordered=False  # Will be set to True when payment is completed
+                ordered=False,
             )
-
-        # Redirect to payments page with order ID
-        return redirect('payments', order_id=order.id)
-
-    # If not POST: return to checkout
-    return redirect('checkout')
+            for cart_item in cart_items
+        ])
+        Through = OrderProduct.variations.through
+        Through.objects.bulk_create([
+            Through(orderproduct_id=order_product.id, variation_id=variation.id)
+            for cart_item, order_product in zip(cart_items, order_products)
+            for variation in cart_item.variations.all()
+        ])
+
+    # Redirect to payments page with order ID
+    return redirect('payments', order_id=order.id)
 
 @login_required(login_url='user_login')
 def payments(request, order_id):
@@ -151,9 +155,12 @@ def payments(request, order_id):
         
         # Mark all OrderProduct records as ordered
         OrderProduct.objects.filter(order=order).update(ordered=True)
+        invalidate_cart_state(user=request.user)
+        # product pages show whether the user ordered them (review form)
+        bump_catalog_version()
         
         # Create payment record
-        Payment.objects.create(
+        payment = Payment.objects.create(
             user=request.user,
             payment_id=f"PAY-{order.order_number}",
             payment_method='Cash on Delivery',
@@ -161,7 +168,8 @@ def payments(request, order_id):
             status='Completed'
         )
         
-        return redirect('order_complete', order_id=order.id)
+        url = reverse('order_complete')
+        return redirect(f"{url}?order_number={order.order_number}&payment_id={payment.payment_id}")
     
     # Calculate totals from order
     total = order.order_total - order.tax if order.tax else order.order_total
@@ -225,6 +233,54 @@ def esewa_start(request, order_id):
         },
     )
 
+@transaction.atomic
+def _complete_order_lines(order, payment):
+    """
+    Reserve stock for the order's unpaid lines and mark them ordered.
+    Lines come from the order itself or, if place_order never created them,
+    from the user's cart (which is then emptied). Raises InsufficientStock
+    (rolling everything back) if any product ran out.
+    Returns the products newly purchased.
+    """
+    # a repeated callback for the same order waits here, then sees them ordered
+    lines = list(order.orderproduct_set.select_for_update(of=("self",)).select_related("product"))
+    if lines:
+        pending = [op for op in lines if not op.ordered]
+        reserve_stock((op.product_id, op.quantity) for op in pending)
+        order.orderproduct_set.update(payment=payment, ordered=True)
+        return [op.product for op in pending]
+
+    cart_items = list(
+        CartItem.objects.select_for_update()
+        .filter(user=order.user)
+        .select_related("product")
+        .prefetch_related("variations")
+        .order_by("product_id", "id")
+    )
+    reserve_stock((item.product_id, item.quantity) for item in cart_items)
+    order_products = OrderProduct.objects.bulk_create([
+        OrderProduct(
+            order=order,
+            payment=payment,
+            user=order.user,
+            product=item.product,
+            quantity=item.quantity,
+            product_price=item.product.price,
+            ordered=True,
+        )
+        for item in cart_items
+    ])
+    Through = OrderProduct.variations.through
+    Through.objects.bulk_create([
+        Through(orderproduct_id=op.id, variation_id=variation.id)
+        for item, op in zip(cart_items, order_products)
+        for variation in item.variations.all()
+    ])
+    CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    transaction.on_commit(lambda: invalidate_cart_state(user=order.user))
+    return [item.product for item in cart_items]
+
+
 def esewa_return(request, order_id):
     """
     TEST/UAT handler:
@@ -232,9 +288,11 @@ def esewa_return(request, order_id):
     - If status == COMPLETE:
         * create Payment (or get existing)
         * link order.payment, set order.is_ordered = True (and optional status)
-        * create OrderProducts from cart (once), copy variations, decrement stock
-        * or, if already created, ensure they're linked & marked ordered
+        * reserve stock for all lines at once (orders.inventory) and mark
+          them ordered; lines come from place_order or, failing that, the cart
+        * if anything sold out meanwhile, change nothing and send the user back
         * send order confirmation email
+        * record the purchases for recommendations
         * redirect to order_complete with ?order_number & ?payment_id
     - Else: show error and redirect home.
     """
@@ -271,43 +329,20 @@ def esewa_return(request, order_id):
             },
         )
 
-        # 2) Create OrderProducts from cart once (and decrement stock)
-        if not order.orderproduct_set.exists() and CartItem:
-            cart_items = (
-                CartItem.objects.filter(user=order.user)
-                .select_related("product")
+        # 2) Reserve stock and mark the lines ordered, all or nothing
+        try:
+            purchased = _complete_order_lines(order, payment)
+        except InsufficientStock as exc:
+            names = dict(Product.objects.filter(pk__in=exc.shortages).values_list("pk", "product_name"))
+            messages.error(
+                request,
+                "Payment received, but some items sold out before it completed: "
+                + ", ".join(names.values())
+                + ". Please contact admin for a refund.",
             )
-            for item in cart_items:
-                op = OrderProduct.objects.create(
-                    order=order,
-                    payment=payment,
-                    user=order.user,
-                    product=item.product,
-                    quantity=item.quantity,
-                    product_price=item.product.price,
-                    ordered=True,
-                )
-                # copy variations if present
-                if hasattr(item, "variations"):
-                    op.variations.set(item.variations.all())
-
-                # atomic stock decrement
-                Product.objects.filter(pk=item.product_id).update(
-                    stock=F("stock") - item.quantity
-                )
-
-            # clear cart after migration
-            cart_items.delete()
-        else:
-            # items already created earlier → ensure linked & ordered
-            for op in order.orderproduct_set.all():
-                if getattr(op, "payment_id", None) != payment.id:
-                    op.payment = payment
-                if not op.ordered:
-                    op.ordered = True
-                op.save(update_fields=["payment", "ordered"])
-
-        # 3) Send order confirmation email (best-effort)
+            return redirect("cart")
+
+        # 3) Queue the order confirmation email
         items = order.orderproduct_set.select_related("product").prefetch_related("variations")
         amount_paid = _order_amount(order)  # recompute for email
         mail_subject = "Thank you for your order!"
@@ -321,13 +356,7 @@ def esewa_return(request, order_id):
             },
         )
         to_email = request.user.email
-        try:
-            EmailMessage(mail_subject, message, to=[to_email]).send()
-        except Exception:
-            messages.warning(
-                request,
-                "Order received, but we couldn't send the email. Contact admin.",
-            )
+        enqueue_email(EmailMessage(mail_subject, message, to=[to_email]))
 
         # 4) Mark order completed
         order.payment = payment
@@ -336,7 +365,10 @@ def esewa_return(request, order_id):
             order.status = "Accepted"  # optional: match your STATUS choices
         order.save()
 
-        # 5) Redirect to order_complete (with expected query params)
+        # 5) Feed also-bought and trending (best effort, never raises)
+        track_order_purchase(order.user, purchased)
+
+        # 6) Redirect to order_complete (with expected query params)
         url = reverse("order_complete")
         return redirect(f"{url}?order_number={order.order_number}&payment_id={payment.payment_id}")
 
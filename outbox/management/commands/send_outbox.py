@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from outbox.services import deliver_batch, deliver_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued emails from the outbox in batches (one mail connection per "
+        "batch). Run from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new mail.")
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if not options['loop']:
+            sent, failed = deliver_pending(batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed."))
+            return
+
+        while True:
+            close_old_connections()
+            sent, failed = deliver_batch(batch_size)
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed.")
+            else:
+                time.sleep(options['interval'])
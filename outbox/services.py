@@ -0,0 +1,136 @@
+"""
+Durable email outbox.
+
+Views build an EmailMessage as usual and call enqueue(message) instead of
+message.send(). That is one INSERT in the request's own transaction, so
+checkout and registration no longer wait on (or fail with) SMTP.
+
+`manage.py send_outbox` delivers the queue. deliver_batch() claims up to
+EMAIL_OUTBOX_BATCH_SIZE due rows and opens one backend connection for the
+whole batch. Claimed rows are locked with SKIP LOCKED and leased for
+EMAIL_OUTBOX_LEASE seconds, so several workers can run side by side. A
+failed message is retried after EMAIL_OUTBOX_RETRY_DELAY * 2**(attempts-1)
+seconds. After EMAIL_OUTBOX_MAX_ATTEMPTS tries it is marked failed.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 3600
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(message):
+    """Queue an EmailMessage (or EmailMultiAlternatives) for the worker."""
+    if message.attachments:
+        raise ValueError("The outbox does not store attachments.")
+    return OutgoingEmail.objects.create(
+        subject=message.subject,
+        body=message.body,
+        content_subtype=message.content_subtype,
+        alternatives=[[content, mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+        from_email=message.from_email or '',
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+    )
+
+
+def build_message(row, connection=None):
+    message = EmailMultiAlternatives(
+        row.subject, row.body, row.from_email or None, row.to,
+        bcc=row.bcc, connection=connection, cc=row.cc, reply_to=row.reply_to,
+    )
+    message.content_subtype = row.content_subtype
+    for content, mimetype in row.alternatives:
+        message.attach_alternative(content, mimetype)
+    return message
+
+
+def retry_delay(attempts):
+    base = _setting('EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return min(base * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    lease = now + timedelta(seconds=_setting('EMAIL_OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        rows = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=lease)
+    return rows
+
+
+def deliver_batch(batch_size=None):
+    """Send one batch of due emails. Returns (sent, failed) counts."""
+    batch_size = batch_size or _setting('EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    rows = _claim(batch_size)
+    if not rows:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+        opened = None
+    except Exception as exc:
+        opened = exc
+    try:
+        for row in rows:
+            error = opened
+            if error is None:
+                try:
+                    connection.send_messages([build_message(row, connection)])
+                except Exception as exc:
+                    error = exc
+            now = timezone.now()
+            row.attempts += 1
+            if error is None:
+                row.status, row.sent_at, row.last_error = 'sent', now, ''
+                sent += 1
+            else:
+                row.last_error = f"{type(error).__name__}: {error}"
+                if row.attempts >= max_attempts:
+                    row.status = 'failed'
+                    logger.error("Giving up on email %s after %d attempts: %s", row.pk, row.attempts, row.last_error)
+                else:
+                    row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+                failed += 1
+    finally:
+        if opened is None:
+            try:
+                connection.close()
+            except Exception:
+                logger.exception("Error closing the email connection")
+        OutgoingEmail.objects.bulk_update(
+            rows, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+        )
+    return sent, failed
+
+
+def deliver_pending(batch_size=None):
+    """Deliver batches until nothing is due. Returns (sent, failed) totals."""
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = deliver_batch(batch_size)
+        if not batch_sent and not batch_failed:
+            return sent, failed
+        sent += batch_sent
+        failed += batch_failed
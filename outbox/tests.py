@@ -0,0 +1,84 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import OutgoingEmail
+from .services import deliver_batch, deliver_pending, enqueue, retry_delay
+
+
+class FlakyBackend(EmailBackend):
+    """locmem backend that refuses mail to anyone at fail.example.com."""
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(to.endswith('@fail.example.com') for m in messages for to in m.to):
+            raise ConnectionError("550 mailbox unavailable")
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    def test_enqueue_round_trips_html_and_alternatives(self):
+        message = EmailMultiAlternatives('Hi', '<p>Hello</p>', None, ['a@example.com'], cc=['c@example.com'])
+        message.content_subtype = 'html'
+        message.attach_alternative('Hello', 'text/plain')
+        enqueue(message)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(deliver_pending(), (1, 0))
+        sent = mail.outbox[0]
+        self.assertEqual((sent.subject, sent.body, sent.content_subtype), ('Hi', '<p>Hello</p>', 'html'))
+        self.assertEqual(sent.to, ['a@example.com'])
+        self.assertEqual(sent.cc, ['c@example.com'])
+        self.assertEqual(sent.alternatives[0][:2], ('Hello', 'text/plain'))
+        row = OutgoingEmail.objects.get()
+        self.assertEqual((row.status, row.attempts), ('sent', 1))
+        self.assertIsNotNone(row.sent_at)
+
+    @override_settings(EMAIL_BACKEND='outbox.tests.FlakyBackend', EMAIL_OUTBOX_BATCH_SIZE=10)
+    def test_one_connection_per_batch_and_backoff(self):
+        FlakyBackend.opened = 0
+        for i in range(12):
+            enqueue(EmailMessage('Order', 'Thanks', to=[f'user{i}@example.com']))
+        enqueue(EmailMessage('Order', 'Thanks', to=['nobody@fail.example.com']))
+
+        self.assertEqual(deliver_pending(), (12, 1))
+        self.assertEqual(FlakyBackend.opened, 2)
+        self.assertEqual(len(mail.outbox), 12)
+
+        failed = OutgoingEmail.objects.get(status='pending')
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('550', failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now() + timedelta(seconds=retry_delay(1) - 5))
+        # not due yet
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='outbox.tests.FlakyBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+    def test_gives_up_after_max_attempts(self):
+        enqueue(EmailMessage('Order', 'Thanks', to=['nobody@fail.example.com']))
+        with self.assertLogs('outbox.services', 'ERROR'):
+            for _ in range(3):
+                OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+                deliver_batch()
+        row = OutgoingEmail.objects.get()
+        self.assertEqual((row.status, row.attempts), ('failed', 3))
+
+    def test_unreachable_server_keeps_mail_queued(self):
+        enqueue(EmailMessage('Order', 'Thanks', to=['a@example.com']))
+        with patch.object(EmailBackend, 'open', side_effect=OSError('connection refused')):
+            self.assertEqual(deliver_batch(), (0, 1))
+        row = OutgoingEmail.objects.get()
+        self.assertEqual(row.status, 'pending')
+        self.assertIn('connection refused', row.last_error)
+
+    def test_retry_delay_doubles_and_caps(self):
+        self.assertEqual([retry_delay(n) for n in (1, 2, 3)], [60, 120, 240])
+        self.assertEqual(retry_delay(30), 3600)
@@ -0,0 +1,200 @@
+"""
+Item-based collaborative filtering for get_user_recommendations.
+
+Offline (`manage.py build_recommendations`):
+  1. Aggregate UserActivity (plus its daily rollups, see retention.py)
+     into a sparse user x item matrix R, stored as
+     two dict-of-dicts (rows by user, columns by item). A cell holds
+     log1p(weighted interactions), where a buy is worth BUY_WEIGHT views.
+  2. For each item i, compute the cosine similarity
+         sim(i, j) = R[:, i] . R[:, j] / (|R[:, i]| |R[:, j]|)
+     against every item that shares a user. This is one sparse column
+     times R^T at a time, so memory stays O(items). Keep only the top-k
+     neighbours in ProductNeighbor.
+
+Online (get_user_recommendations): take the user's recent interactions as
+seeds, read their precomputed neighbours in one indexed query, add up
+R[u, i] * sim(i, j), and cache the result per user.
+
+Pure Python on purpose: the app deploys to hosts where NumPy/SciPy wheels
+are a burden, and the offline pass runs in seconds at our catalog size.
+"""
+import heapq
+import itertools
+import math
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import ProductNeighbor, UserActivity, UserActivityDaily
+
+BUY_WEIGHT = 3.0
+
+# Users with more distinct items than this only contribute their heaviest
+# items to similarity (keeps the per-user pair cost bounded for power users).
+MAX_ITEMS_PER_USER = 200
+
+# Seeds used when serving: the user's most recent distinct products
+MAX_SEEDS = 50
+RECENT_ACTIVITY = 500
+
+# Recommendations kept per user in the cache
+CACHED_PER_USER = 20
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def interaction_counts():
+    """(user_id, product_id, action, count) for all activity, raw and rolled up."""
+    raw = (
+        UserActivity.objects.order_by()
+        .values_list('user_id', 'product_id', 'action')
+        .annotate(n=Count('id'))
+    )
+    daily = (
+        UserActivityDaily.objects.order_by()
+        .values_list('user_id', 'product_id', 'action')
+        .annotate(n=Sum('count'))
+    )
+    return itertools.chain(raw.iterator(chunk_size=5000), daily.iterator(chunk_size=5000))
+
+
+def interaction_matrix(rows):
+    """
+    Build the sparse matrix from (user_id, product_id, action, count) rows.
+    Returns (by_user, by_item): {user: {item: w}} and {item: {user: w}}.
+    """
+    raw = defaultdict(lambda: defaultdict(float))
+    for user_id, product_id, action, count in rows:
+        raw[user_id][product_id] += count * (BUY_WEIGHT if action == 'buy' else 1.0)
+
+    by_user, by_item = {}, defaultdict(dict)
+    for user_id, items in raw.items():
+        if len(items) > MAX_ITEMS_PER_USER:
+            items = dict(heapq.nlargest(MAX_ITEMS_PER_USER, items.items(), key=lambda kv: kv[1]))
+        row = {product_id: math.log1p(w) for product_id, w in items.items()}
+        by_user[user_id] = row
+        for product_id, w in row.items():
+            by_item[product_id][user_id] = w
+    return by_user, dict(by_item)
+
+
+def item_neighbors(by_user, by_item, k=20):
+    """{item: [(neighbour, cosine), ...]} with at most `k` neighbours each."""
+    norms = {
+        item: math.sqrt(sum(w * w for w in column.values()))
+        for item, column in by_item.items()
+    }
+    neighbors = {}
+    for item, column in by_item.items():
+        dots = defaultdict(float)
+        for user_id, w in column.items():
+            for other, w_other in by_user[user_id].items():
+                dots[other] += w * w_other
+        dots.pop(item, None)
+        if not dots:
+            continue
+        norm = norms[item]
+        scored = ((other, dot / (norm * norms[other])) for other, dot in dots.items())
+        neighbors[item] = heapq.nlargest(k, scored, key=lambda pair: (pair[1], -pair[0]))
+    return neighbors
+
+
+def build_neighbors(k=None, batch_size=1000):
+    """
+    Recompute ProductNeighbor from all activity and retire cached user
+    recommendations. Returns the number of neighbour rows written.
+    """
+    k = k or _setting('RECOMMENDATIONS_NEIGHBORS', 20)
+    by_user, by_item = interaction_matrix(interaction_counts())
+    neighbors = item_neighbors(by_user, by_item, k=k)
+
+    rows = [
+        ProductNeighbor(product_id=item, neighbor_id=other, score=score)
+        for item, pairs in neighbors.items()
+        for other, score in pairs
+    ]
+    with transaction.atomic():
+        ProductNeighbor.objects.all().delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+    cache.set(_VERSION_KEY, uuid.uuid4().hex, None)
+    return len(rows)
+
+
+# --- serving --------------------------------------------------------------
+
+_VERSION_KEY = 'recommendations:user:version'
+
+
+def _user_cache_key(user_id):
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(_VERSION_KEY, version, None)
+        version = cache.get(_VERSION_KEY, version)
+    return f'recommendations:user:{version}:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_cache_key(user_id))
+
+
+def invalidate_users(user_ids):
+    if user_ids:
+        prefix = _user_cache_key('')
+        cache.delete_many([f'{prefix}{user_id}' for user_id in user_ids])
+
+
+def _user_seeds(user_id):
+    """{product_id: weight} from the user's most recent activity."""
+    weights = defaultdict(float)
+    recent = (
+        UserActivity.objects.filter(user_id=user_id)
+        .order_by('-timestamp')
+        .values_list('product_id', 'action')[:RECENT_ACTIVITY]
+    )
+    for product_id, action in recent:
+        if product_id in weights or len(weights) < MAX_SEEDS:
+            weights[product_id] += BUY_WEIGHT if action == 'buy' else 1.0
+    if len(weights) < MAX_SEEDS:
+        # users inactive for longer than the retention window only have rollups
+        daily = (
+            UserActivityDaily.objects.filter(user_id=user_id)
+            .order_by('-day')
+            .values_list('product_id', 'action', 'count')[:RECENT_ACTIVITY]
+        )
+        for product_id, action, count in daily:
+            if product_id in weights or len(weights) < MAX_SEEDS:
+                weights[product_id] += count * (BUY_WEIGHT if action == 'buy' else 1.0)
+    return {product_id: math.log1p(w) for product_id, w in weights.items()}
+
+
+def recommend(user_id, limit=5):
+    """[{'product': id, 'score': float}] best first, excluding seen products."""
+    key = _user_cache_key(user_id)
+    cached = cache.get(key)
+    # (ranking, complete): re-rank only if a caller wants more than was kept
+    if cached is None or (len(cached[0]) < limit and not cached[1]):
+        seeds = _user_seeds(user_id)
+        scores = defaultdict(float)
+        if seeds:
+            neighbours = ProductNeighbor.objects.filter(product_id__in=seeds).values_list(
+                'product_id', 'neighbor_id', 'score'
+            )
+            for product_id, neighbor_id, score in neighbours:
+                if neighbor_id not in seeds:
+                    scores[neighbor_id] += seeds[product_id] * score
+        size = max(limit, CACHED_PER_USER)
+        ranked = [
+            {'product': product_id, 'score': round(score, 6)}
+            for product_id, score in heapq.nlargest(size, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+        ]
+        cached = (ranked, len(scores) <= size)
+        cache.set(key, cached, _setting('RECOMMENDATIONS_USER_CACHE_TIMEOUT', 3600))
+    return cached[0][:limit]
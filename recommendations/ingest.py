@@ -0,0 +1,158 @@
+"""
+Buffered UserActivity ingestion.
+
+track_product_view hands events to a process-wide ActivityBuffer instead of
+inserting inside the request. A daemon thread writes them with bulk_create
+once RECOMMENDATIONS_ACTIVITY_BATCH_SIZE events are queued or every
+RECOMMENDATIONS_ACTIVITY_FLUSH_INTERVAL seconds, whichever comes first.
+Repeated views of the same product by the same user within one batch are
+coalesced into a single row (the latest), which is also upserted into the
+user's RecentlyViewed list. The queue is drained at interpreter exit.
+
+With RECOMMENDATIONS_ACTIVITY_ASYNC off, events are written synchronously;
+tests that assert on activity rows turn it off with override_settings.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Subquery
+
+from . import engine
+from .models import RecentlyViewed, UserActivity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    def __init__(self, batch_size=None, interval=None):
+        self.batch_size = batch_size or getattr(settings, 'RECOMMENDATIONS_ACTIVITY_BATCH_SIZE', 200)
+        self.interval = interval or getattr(settings, 'RECOMMENDATIONS_ACTIVITY_FLUSH_INTERVAL', 2.0)
+        self._queue = queue.Queue()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, user_id, product_id, action, timestamp):
+        self._queue.put((user_id, product_id, action, timestamp))
+        self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='activity-flusher', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+    def _take(self):
+        events = []
+        while len(events) < self.batch_size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows inserted."""
+        written = 0
+        while True:
+            events = self._take()
+            if not events:
+                return written
+            try:
+                written += write_events(events)
+            except Exception:
+                # activity is best-effort; never let the flusher die
+                logger.exception("Dropped %d activity event(s)", len(events))
+
+    def shutdown(self, timeout=5.0):
+        """Stop the flusher thread and write whatever is still queued."""
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+
+
+def write_events(events):
+    """bulk_create (user_id, product_id, action, timestamp) events, coalescing repeat views."""
+    rows, latest_view = [], {}
+    for user_id, product_id, action, timestamp in events:
+        if action == 'view':
+            key = (user_id, product_id)
+            previous = latest_view.get(key)
+            if previous is not None:
+                if timestamp > previous.timestamp:
+                    previous.timestamp = timestamp
+                continue
+        row = UserActivity(user_id=user_id, product_id=product_id, action=action, timestamp=timestamp)
+        if action == 'view':
+            latest_view[(user_id, product_id)] = row
+        rows.append(row)
+    UserActivity.objects.bulk_create(rows)
+    update_recently_viewed(latest_view.values())
+    engine.invalidate_users({row.user_id for row in rows})
+    return len(rows)
+
+
+def update_recently_viewed(views):
+    """Upsert (user, product) -> latest view time, then trim each user's list."""
+    views = list(views)
+    if not views:
+        return
+    RecentlyViewed.objects.bulk_create(
+        [RecentlyViewed(user_id=v.user_id, product_id=v.product_id, viewed_at=v.timestamp) for v in views],
+        update_conflicts=True,
+        unique_fields=['user', 'product'],
+        update_fields=['viewed_at'],
+    )
+    size = getattr(settings, 'RECOMMENDATIONS_RECENTLY_VIEWED_SIZE', 10)
+    for user_id in {v.user_id for v in views}:
+        keep = (
+            RecentlyViewed.objects.filter(user_id=user_id)
+            .order_by('-viewed_at', '-id').values('pk')[:size]
+        )
+        RecentlyViewed.objects.filter(user_id=user_id).exclude(pk__in=Subquery(keep)).delete()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ActivityBuffer()
+                atexit.register(_buffer.shutdown)
+    return _buffer
+
+
+def record_activity(user_id, product_id, action, timestamp):
+    if getattr(settings, 'RECOMMENDATIONS_ACTIVITY_ASYNC', True):
+        get_buffer().add(user_id, product_id, action, timestamp)
+    else:
+        write_events([(user_id, product_id, action, timestamp)])
@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.models import Account
+from category.models import Category
+from recommendations import engine
+from recommendations.models import UserActivity
+from store.models import Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+def legacy_recommendations(user_id, limit=5):
+    """The previous get_user_recommendations, kept for comparison."""
+    user_products = UserActivity.objects.filter(user_id=user_id).values_list('product_id', flat=True).distinct()
+    similar_users = (
+        UserActivity.objects.filter(product_id__in=user_products)
+        .exclude(user_id=user_id).values_list('user_id', flat=True).distinct()
+    )
+    return list(
+        UserActivity.objects.filter(user_id__in=similar_users, action='buy')
+        .exclude(product_id__in=user_products)
+        .values('product').annotate(score=Count('user')).order_by('-score')[:limit]
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark personalized recommendations on a synthetic activity log: "
+        "the old per-request query vs. the precomputed engine. Everything runs "
+        "in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Activity rows to generate.")
+        parser.add_argument('--users-per-row', type=float, default=0.02,
+                            help="Users as a fraction of rows (default 1 user per 50 rows).")
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--sample', type=int, default=20, help="Users timed per strategy.")
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help="Do not time the old query (slow on large logs).")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                user_ids = self._seed(options, rng)
+                self._run(options, rng, user_ids)
+                raise _Rollback
+        except _Rollback:
+            pass
+        cache.delete(engine._VERSION_KEY)
+
+    def _seed(self, options, rng):
+        start = time.perf_counter()
+        category = Category.objects.create(category_name='Benchmark', slug='benchmark-recommendations')
+        products = Product.objects.bulk_create(
+            [
+                Product(product_name=f'Bench {i}', slug=f'bench-rec-{i}', price=100, stock=1,
+                        category=category, is_approved=True)
+                for i in range(options['products'])
+            ],
+            batch_size=2000,
+        )
+        n_users = max(int(options['rows'] * options['users_per_row']), 1)
+        users = Account.objects.bulk_create(
+            [
+                Account(first_name='Bench', last_name=str(i), username=f'bench-rec-{i}',
+                        email=f'bench-rec-{i}@example.com')
+                for i in range(n_users)
+            ],
+            batch_size=2000,
+        )
+        product_ids = [p.pk for p in products]
+        user_ids = [u.pk for u in users]
+        # Product popularity follows a power law and a heavy tail of power
+        # users generates most of the rows
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(len(product_ids))]
+        user_weights = [rng.paretovariate(1.5) for _ in user_ids]
+        now = timezone.now()
+        rows = options['rows']
+        pairs = zip(
+            rng.choices(user_ids, weights=user_weights, k=rows),
+            rng.choices(product_ids, weights=weights, k=rows),
+        )
+        batch = []
+        for user_id, product_id in pairs:
+            batch.append(UserActivity(
+                user_id=user_id,
+                product_id=product_id,
+                action='buy' if rng.random() < 0.1 else 'view',
+                timestamp=now - timezone.timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            ))
+            if len(batch) == 10000:
+                UserActivity.objects.bulk_create(batch)
+                batch = []
+        UserActivity.objects.bulk_create(batch)
+        self.stdout.write(
+            f"seeded {options['rows']} rows, {n_users} users, {len(product_ids)} products "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return user_ids
+
+    def _run(self, options, rng, user_ids):
+        # the heaviest users are where the old query hurt most
+        heavy = list(
+            UserActivity.objects.values('user_id').annotate(n=Count('id'))
+            .order_by('-n').values_list('user_id', flat=True)[:options['sample'] // 2]
+        )
+        sample = heavy + rng.sample(user_ids, min(len(user_ids), options['sample'] - len(heavy)))
+
+        if not options['skip_legacy']:
+            self._report('legacy query', [self._time(legacy_recommendations, u) for u in sample])
+
+        start = time.perf_counter()
+        rows = engine.build_neighbors()
+        self.stdout.write(f"build_neighbors: {rows} rows in {time.perf_counter() - start:.1f}s")
+
+        self._report('engine (cold)', [self._time(engine.recommend, u) for u in sample])
+        self._report('engine (cached)', [self._time(engine.recommend, u) for u in sample])
+
+    def _time(self, func, user_id):
+        start = time.perf_counter()
+        func(user_id)
+        return (time.perf_counter() - start) * 1000
+
+    def _report(self, label, timings):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{label:<16} median {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms   max {timings[-1]:8.2f} ms"
+        )
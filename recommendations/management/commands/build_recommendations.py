@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.engine import build_neighbors
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the item-item similarity table used by personalized "
+        "recommendations. Run periodically (e.g. nightly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, default=None,
+                            help="Neighbours kept per product (default RECOMMENDATIONS_NEIGHBORS).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = build_neighbors(k=options['neighbors'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} product neighbour row(s)."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recommendations.retention import partition_by_month
+
+
+class Command(BaseCommand):
+    help = (
+        "PostgreSQL only: partition the UserActivity table by month (first "
+        "run converts the table, later runs create upcoming partitions). "
+        "Schedule monthly after the initial conversion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Monthly partitioning needs PostgreSQL.")
+        if partition_by_month(options['months_ahead']):
+            self.stdout.write(self.style.SUCCESS("UserActivity is now partitioned by month."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Upcoming monthly partitions are in place."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.utils import rebuild_copurchases
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product co-purchase table from all 'buy' activity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pairs = rebuild_copurchases(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {pairs} co-purchase pair(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.utils import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly trending buckets from 'buy' activity and drop "
+        "buckets older than the longest trending window. Safe to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        buckets = rebuild_trending(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {buckets} trending bucket(s)."))
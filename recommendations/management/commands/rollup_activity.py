@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.retention import rollup_activity
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll raw UserActivity views older than the retention window into daily "
+        "per-(user, product, action) counts and delete the raw rows in small "
+        "chunks. Safe to interrupt and re-run; schedule daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Keep this many days raw (default RECOMMENDATIONS_ACTIVITY_RETENTION_DAYS).")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks to spread out the load.")
+
+    def handle(self, *args, **options):
+        rows = rollup_activity(
+            days=options['days'], chunk_size=options['chunk_size'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rows} activity row(s)."))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0001_initial'),
+        ('store', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copurchases', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product Co-Purchases',
+                'indexes': [models.Index(fields=['product', '-count'], name='copurchase_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='copurchase_pair_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_productcopurchase'),
+        ('store', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPurchaseBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_buckets', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour', 'product'], name='purchase_bucket_window_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'hour'), name='purchase_bucket_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+RECENT = 10
+
+
+def backfill_recently_viewed(apps, schema_editor):
+    UserActivity = apps.get_model('recommendations', 'UserActivity')
+    RecentlyViewed = apps.get_model('recommendations', 'RecentlyViewed')
+    latest = {}
+    rows = (
+        UserActivity.objects.filter(action='view').order_by()
+        .values_list('user_id', 'product_id').annotate(viewed_at=Max('timestamp'))
+    )
+    for user_id, product_id, viewed_at in rows.iterator():
+        latest.setdefault(user_id, []).append((viewed_at, product_id))
+    RecentlyViewed.objects.bulk_create(
+        [
+            RecentlyViewed(user_id=user_id, product_id=product_id, viewed_at=viewed_at)
+            for user_id, views in latest.items()
+            for viewed_at, product_id in sorted(views, reverse=True)[:RECENT]
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_productneighbor'),
+        ('store', '0008_product_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecentlyViewed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recently_viewed', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Recently Viewed',
+                'indexes': [models.Index(fields=['user', '-viewed_at'], name='recently_viewed_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='recently_viewed_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_recently_viewed, migrations.RunPython.noop),
+    ]
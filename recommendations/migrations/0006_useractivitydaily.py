@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0005_recentlyviewed'),
+        ('store', '0008_product_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('view', 'View'), ('buy', 'Buy')], default='view', max_length=10)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Activities (daily)',
+                'indexes': [models.Index(fields=['user', 'day'], name='activity_daily_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'product', 'action', 'day'), name='activity_daily_unique')],
+            },
+        ),
+    ]
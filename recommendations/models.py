@@ -40,3 +40,153 @@ class UserActivity(models.Model):
     
     def __str__(self):
         return f"{self.user.username} {self.action}ed {self.product.product_name} at {self.timestamp}"
+
+
+class ProductCoPurchase(models.Model):
+    """
+    Item-to-item co-occurrence: `count` users bought both `product` and
+    `other`. Stored in both directions so "also bought" for a product is a
+    single index range read. Maintained by track_product_purchase and
+    rebuilt with `manage.py rebuild_copurchases`.
+    """
+    product = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='copurchases'
+    )
+    other = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Product Co-Purchases'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='copurchase_pair_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-count'], name='copurchase_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.count}"
+
+
+class ProductPurchaseBucket(models.Model):
+    """
+    Purchases of a product within one hour. Trending sums the buckets of the
+    requested window instead of scanning raw 'buy' activity.
+    """
+    product = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='purchase_buckets'
+    )
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'hour'], name='purchase_bucket_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['hour', 'product'], name='purchase_bucket_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.hour:%Y-%m-%d %H}:00: {self.count}"
+
+
+class ProductNeighbor(models.Model):
+    """
+    Precomputed item-item cosine similarity: the top-k `neighbor`s of
+    `product` by shared user interest. Written by build_recommendations.
+    """
+    product = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='neighbors'
+    )
+    neighbor = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'neighbor'], name='product_neighbor_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.neighbor_id}: {self.score:.3f}"
+
+
+class RecentlyViewed(models.Model):
+    """
+    Each user's last few distinct viewed products, newest first. One row per
+    (user, product), upserted on every view and trimmed to
+    RECOMMENDATIONS_RECENTLY_VIEWED_SIZE rows per user.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recently_viewed'
+    )
+    product = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    viewed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'Recently Viewed'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='recently_viewed_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-viewed_at'], name='recently_viewed_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} viewed {self.product_id} at {self.viewed_at}"
+
+
+class UserActivityDaily(models.Model):
+    """
+    Raw UserActivity older than the retention window, rolled up to one row
+    per (user, product, action, day). Written by `manage.py rollup_activity`.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='daily_activities'
+    )
+    product = models.ForeignKey(
+        'store.Product',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    action = models.CharField(
+        max_length=10,
+        choices=UserActivity.ACTION_CHOICES,
+        default='view'
+    )
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'User Activities (daily)'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product', 'action', 'day'], name='activity_daily_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day'], name='activity_daily_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.action} {self.product_id} x{self.count} on {self.day}"
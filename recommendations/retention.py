@@ -0,0 +1,180 @@
+"""
+UserActivity retention.
+
+rollup_activity() folds raw events older than the retention window into
+UserActivityDaily and deletes them. Each chunk of at most `chunk_size` rows
+is read, merged into the daily counts and deleted by primary key inside its
+own short transaction. The table is never locked as a whole, and an
+interrupted run can simply be restarted.
+
+Only 'view' events are rolled up. Buys are rare and stay raw, because
+record_copurchase and the co-purchase and trending rebuilds read them row
+by row.
+
+partition_by_month() optionally turns the table into a PostgreSQL table
+range-partitioned by month, so old months live in their own (smaller)
+tables and indexes.
+"""
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import UserActivity, UserActivityDaily
+
+
+def retention_cutoff(days=None):
+    days = days if days is not None else getattr(settings, 'RECOMMENDATIONS_ACTIVITY_RETENTION_DAYS', 90)
+    today = timezone.localdate()
+    start = today - timedelta(days=days)
+    return timezone.make_aware(datetime(start.year, start.month, start.day))
+
+
+ROLLUP_ACTIONS = ('view',)
+
+
+def rollup_activity(days=None, chunk_size=5000, pause=0.0):
+    """
+    Roll raw views older than `days` into daily counts.
+    Returns the number of raw rows rolled up (and deleted).
+    """
+    cutoff = retention_cutoff(days)
+    total = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                UserActivity.objects.filter(action__in=ROLLUP_ACTIONS, timestamp__lt=cutoff)
+                .order_by('id')
+                .values_list('id', 'user_id', 'product_id', 'action', 'timestamp')[:chunk_size]
+            )
+            if not chunk:
+                return total
+            _merge_daily(Counter(
+                (user_id, product_id, action, timezone.localdate(timestamp))
+                for _, user_id, product_id, action, timestamp in chunk
+            ))
+            UserActivity.objects.filter(id__in=[row[0] for row in chunk]).delete()
+        total += len(chunk)
+        if pause:
+            time.sleep(pause)
+
+
+def _merge_daily(counts):
+    users = {key[0] for key in counts}
+    days = {key[3] for key in counts}
+    existing = {
+        (row.user_id, row.product_id, row.action, row.day): row
+        for row in UserActivityDaily.objects.select_for_update().filter(
+            user_id__in=users, day__in=days
+        )
+    }
+    changed, created = [], []
+    for key, count in counts.items():
+        row = existing.get(key)
+        if row is None:
+            user_id, product_id, action, day = key
+            created.append(UserActivityDaily(
+                user_id=user_id, product_id=product_id, action=action, day=day, count=count
+            ))
+        else:
+            row.count += count
+            changed.append(row)
+    UserActivityDaily.objects.bulk_update(changed, ['count'], batch_size=1000)
+    UserActivityDaily.objects.bulk_create(created, batch_size=1000)
+
+
+# --- PostgreSQL monthly partitioning ----------------------------------------
+
+def _months(first, last):
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def is_partitioned():
+    table = UserActivity._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def ensure_partitions(first_month, months_ahead=3):
+    """Create monthly partitions from `first_month` to `months_ahead` months from now."""
+    table = UserActivity._meta.db_table
+    last = timezone.localdate() + timedelta(days=31 * months_ahead)
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for start, end in _months(first_month, last):
+            name = f'{table}_y{start.year}m{start.month:02d}'
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [start.isoformat(), end.isoformat()],
+            )
+
+
+@transaction.atomic
+def partition_by_month(months_ahead=3):
+    """
+    Convert recommendations_useractivity into a table partitioned by month on
+    "timestamp" (PostgreSQL only). The primary key becomes (id, timestamp),
+    as PostgreSQL requires. The table is locked while rows are copied, so
+    run this during a quiet period and roll up old rows first.
+    Returns False if the table was already partitioned.
+    """
+    if is_partitioned():
+        ensure_partitions(timezone.localdate(), months_ahead)
+        return False
+
+    meta = UserActivity._meta
+    table = meta.db_table
+    qn = connection.ops.quote_name
+    new, old, seq = f'{table}_partitioned', f'{table}_unpartitioned', f'{table}_part_id_seq'
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT MIN({qn('timestamp')}) FROM {qn(table)}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"CREATE TABLE {qn(new)} (LIKE {qn(table)} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({qn('timestamp')})"
+        )
+        cursor.execute(f"ALTER TABLE {qn(new)} ADD PRIMARY KEY (id, {qn('timestamp')})")
+        cursor.execute(f"CREATE SEQUENCE {qn(seq)} OWNED BY {qn(new)}.id")
+        cursor.execute(f"ALTER TABLE {qn(new)} ALTER COLUMN id SET DEFAULT nextval(%s)", [seq])
+        cursor.execute(f"CREATE TABLE {qn(new + '_default')} PARTITION OF {qn(new)} DEFAULT")
+
+    # partitions are created against the final name, so swap first
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+        cursor.execute(f"ALTER TABLE {qn(new)} RENAME TO {qn(table)}")
+    first = timezone.localdate(oldest) if oldest else timezone.localdate()
+    ensure_partitions(first, months_ahead)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+        cursor.execute(f"SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {qn(table)}), 0) + 1, false)", [seq])
+        cursor.execute(f"DROP TABLE {qn(old)}")
+
+    # indexes and foreign keys go on the partitioned parent (PostgreSQL 11+)
+    # and are inherited by every partition
+    with connection.cursor() as cursor:
+        for index in meta.indexes:
+            columns = ', '.join(qn(meta.get_field(name).column) for name in index.fields)
+            cursor.execute(f"CREATE INDEX {qn(index.name)} ON {qn(table)} ({columns})")
+        for field in (meta.get_field('user'), meta.get_field('product')):
+            target = field.target_field
+            cursor.execute(f"CREATE INDEX {qn(f'{table}_{field.column}_idx')} ON {qn(table)} ({qn(field.column)})")
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(f'{table}_{field.column}_fk')} "
+                f"FOREIGN KEY ({qn(field.column)}) "
+                f"REFERENCES {qn(target.model._meta.db_table)} ({qn(target.column)}) "
+                f"DEFERRABLE INITIALLY DEFERRED"
+            )
+    return True
@@ -1,18 +1,37 @@
-from django.test import TestCase, Client
+import time
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from store.models import Product, Category
-from .models import UserActivity
+from django.core.cache import cache
+from django.core.management import call_command
+from .models import ProductCoPurchase, ProductPurchaseBucket, RecentlyViewed, UserActivity, UserActivityDaily
+from . import engine
+from .ingest import ActivityBuffer
+from .retention import is_partitioned, partition_by_month
+from .utils import (
+    get_user_recommendations, record_trending_purchase, track_order_purchase, track_product_purchase,
+    track_product_view,
+)
+from datetime import timedelta
 from django.utils import timezone
 from decimal import Decimal
+from io import StringIO
 
 User = get_user_model()
 
 
+@override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False)  # activity rows written in the request
 class RecommendationSystemTest(TestCase):
     def setUp(self):
         # Create test user
         self.user = User.objects.create_user(
+            first_name='Test',
+            last_name='User',
             username='testuser',
             email='test@example.com',
             password='testpass123'
@@ -54,23 +73,14 @@ class RecommendationSystemTest(TestCase):
         
         # Create test client
         self.client = Client()
+        cache.clear()
     
     def test_recently_viewed(self):
         """Test recently viewed products endpoint"""
-        # Create some view activities
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product1,
-            action='view',
-            timestamp=timezone.now()
-        )
-        
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product2,
-            action='view',
-            timestamp=timezone.now()
-        )
+        # Create some view activities (maintains the recently-viewed list)
+        track_product_view(self.user, self.product1)
+        track_product_view(self.user, self.product2)
+        track_product_view(self.user, self.product1)
         
         url = reverse('recommendations:recently_viewed', args=[self.user.id])
         response = self.client.get(url)
@@ -79,23 +89,13 @@ class RecommendationSystemTest(TestCase):
         data = response.json()
         self.assertTrue(data['success'])
         self.assertEqual(len(data['products']), 2)
+        self.assertEqual(data['products'][0]['id'], self.product1.id)
     
     def test_also_bought(self):
         """Test also bought products endpoint"""
-        # Create some purchase activities
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product1,
-            action='buy',
-            timestamp=timezone.now()
-        )
-        
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product2,
-            action='buy',
-            timestamp=timezone.now()
-        )
+        # Create some purchase activities (feeds the co-purchase table)
+        track_product_purchase(self.user, self.product1)
+        track_product_purchase(self.user, self.product2)
         
         url = reverse('recommendations:also_bought', args=[self.product1.id])
         response = self.client.get(url)
@@ -107,20 +107,9 @@ class RecommendationSystemTest(TestCase):
     
     def test_trending(self):
         """Test trending products endpoint"""
-        # Create some recent purchase activities
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product1,
-            action='buy',
-            timestamp=timezone.now()
-        )
-        
-        UserActivity.objects.create(
-            user=self.user,
-            product=self.product2,
-            action='buy',
-            timestamp=timezone.now()
-        )
+        # Create some recent purchase activities (feeds the hourly buckets)
+        track_product_purchase(self.user, self.product1)
+        track_product_purchase(self.user, self.product2)
         
         url = reverse('recommendations:trending')
         response = self.client.get(url)
@@ -142,3 +131,330 @@ class RecommendationSystemTest(TestCase):
         self.assertEqual(activity.action, 'view')
         self.assertEqual(activity.user, self.user)
         self.assertEqual(activity.product, self.product1)
+
+
+class CoPurchaseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_name='Books', slug='books')
+        self.products = [
+            Product.objects.create(
+                product_name=f'Book {i}', slug=f'book-{i}', price=100, stock=10,
+                category=category,
+            )
+            for i in range(3)
+        ]
+        self.users = [
+            User.objects.create_user(
+                first_name='Buyer', last_name=str(i),
+                username=f'buyer{i}', email=f'buyer{i}@example.com', password='testpass123',
+            )
+            for i in range(2)
+        ]
+
+    def pairs(self):
+        return dict(
+            ((row.product_id, row.other_id), row.count)
+            for row in ProductCoPurchase.objects.all()
+        )
+
+    def test_purchases_update_pairs_incrementally(self):
+        a, b, c = self.products
+        for user in self.users:
+            track_product_purchase(user, a)
+            track_product_purchase(user, b)
+        track_product_purchase(self.users[0], c)
+        # buying the same product again adds no pairs
+        track_product_purchase(self.users[0], a)
+
+        pairs = self.pairs()
+        self.assertEqual(pairs[(a.id, b.id)], 2)
+        self.assertEqual(pairs[(b.id, a.id)], 2)
+        self.assertEqual(pairs[(c.id, a.id)], 1)
+        self.assertNotIn((a.id, a.id), pairs)
+
+        call_command('rebuild_copurchases', stdout=StringIO())
+        self.assertEqual(self.pairs(), pairs)
+
+    def test_order_is_tracked_in_one_batch(self):
+        a, b, c = self.products
+        track_product_purchase(self.users[0], a)
+        # savepoint, earlier buys, pairs insert + update, buckets insert + one
+        # update per distinct count, activity insert, release
+        with self.assertNumQueries(9):
+            track_order_purchase(self.users[0], [b, c, b])
+        pairs = self.pairs()
+        self.assertEqual(set(pairs.values()), {1})
+        self.assertEqual(len(pairs), 6)
+        self.assertEqual(UserActivity.objects.filter(user=self.users[0], action='buy').count(), 4)
+        self.assertEqual(dict(ProductPurchaseBucket.objects.values_list('product_id', 'count')),
+                         {a.id: 1, b.id: 2, c.id: 1})
+
+        # same pairs as buying the products one by one
+        for product in (a, b, c, b):
+            track_product_purchase(self.users[1], product)
+        self.assertEqual(self.pairs(), {key: 2 for key in pairs})
+
+    def test_also_bought_reads_table_and_caches(self):
+        a, b, c = self.products
+        for user in self.users:
+            track_product_purchase(user, a)
+            track_product_purchase(user, b)
+        track_product_purchase(self.users[0], c)
+
+        url = reverse('recommendations:also_bought', args=[a.id])
+        with self.assertNumQueries(2):
+            data = self.client.get(url).json()
+        self.assertEqual([p['id'] for p in data['products']], [b.id, c.id])
+        self.assertEqual(data['products'][0]['buy_count'], 2)
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        # a new purchase invalidates the cached response
+        track_product_purchase(self.users[1], c)
+        data = self.client.get(url).json()
+        self.assertEqual([p['buy_count'] for p in data['products']], [2, 2])
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        books = Category.objects.create(category_name='Books', slug='books')
+        snacks = Category.objects.create(category_name='Snacks', slug='snacks')
+        self.book = Product.objects.create(product_name='Novel', slug='novel', price=100, stock=10, category=books)
+        self.chips = Product.objects.create(product_name='Chips', slug='chips', price=50, stock=10, category=snacks)
+        self.tea = Product.objects.create(product_name='Tea', slug='tea', price=30, stock=10, category=snacks)
+        now = timezone.now()
+        record_trending_purchase(self.book, now, count=3)
+        record_trending_purchase(self.chips, now - timedelta(hours=2))
+        record_trending_purchase(self.chips, now - timedelta(days=3), count=5)
+        record_trending_purchase(self.tea, now - timedelta(days=20), count=9)
+
+    def trending(self, **params):
+        response = self.client.get(reverse('recommendations:trending'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(p['name'], p['buy_count']) for p in response.json()['products']]
+
+    def test_windows_sum_hourly_buckets(self):
+        self.assertEqual(self.trending(window='24h'), [('Novel', 3), ('Chips', 1)])
+        self.assertEqual(self.trending(), [('Chips', 6), ('Novel', 3)])
+        self.assertEqual(self.trending(window='30d'), [('Tea', 9), ('Chips', 6), ('Novel', 3)])
+        self.assertEqual(self.client.get(reverse('recommendations:trending'), {'window': '1y'}).status_code, 400)
+
+    def test_category_trending(self):
+        self.assertEqual(self.trending(window='30d', category='snacks'), [('Tea', 9), ('Chips', 6)])
+
+    def test_rebuild_from_activity(self):
+        user = User.objects.create_user(
+            first_name='Buyer', last_name='One',
+            username='buyer', email='buyer@example.com', password='testpass123',
+        )
+        UserActivity.objects.create(user=user, product=self.tea, action='buy')
+        UserActivity.objects.create(user=user, product=self.tea, action='buy',
+                                    timestamp=timezone.now() - timedelta(days=40))
+        call_command('rebuild_trending', stdout=StringIO())
+        self.assertEqual(list(ProductPurchaseBucket.objects.values_list('product_id', 'count')),
+                         [(self.tea.id, 1)])
+
+
+@override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False)  # activity rows written in the request
+class RecommendationEngineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_name='Gear', slug='gear')
+        self.laptop, self.mouse, self.bag, self.kettle = [
+            Product.objects.create(product_name=name, slug=name.lower(), price=100, stock=10, category=category)
+            for name in ('Laptop', 'Mouse', 'Bag', 'Kettle')
+        ]
+        self.users = [
+            User.objects.create_user(
+                first_name='User', last_name=str(i),
+                username=f'user{i}', email=f'user{i}@example.com', password='testpass123',
+            )
+            for i in range(4)
+        ]
+
+    def activity(self, user, product, action='view'):
+        UserActivity.objects.create(user=user, product=product, action=action)
+
+    def test_item_cosine_neighbors(self):
+        by_user, by_item = engine.interaction_matrix([
+            (1, 10, 'view', 1), (1, 20, 'view', 1),
+            (2, 10, 'view', 1), (2, 20, 'view', 1),
+            (3, 10, 'view', 1), (3, 30, 'view', 1),
+        ])
+        neighbors = engine.item_neighbors(by_user, by_item, k=5)
+        # 10 and 20 share two of 10's three users: 2 / (sqrt(3) * sqrt(2))
+        self.assertAlmostEqual(dict(neighbors[10])[20], 2 / (3 ** 0.5 * 2 ** 0.5))
+        self.assertEqual([other for other, _ in neighbors[10]], [20, 30])
+        self.assertAlmostEqual(dict(neighbors[20])[10], 2 / (2 ** 0.5 * 3 ** 0.5))
+
+    def test_recommends_unseen_neighbours_and_caches(self):
+        laptop_buyers = self.users[:3]
+        for user in laptop_buyers:
+            self.activity(user, self.laptop, 'buy')
+            self.activity(user, self.mouse)
+        self.activity(self.users[0], self.bag)
+        self.activity(self.users[3], self.kettle)
+        call_command('build_recommendations', stdout=StringIO())
+
+        newcomer = self.users[3]
+        self.activity(newcomer, self.laptop)
+        result = get_user_recommendations(newcomer)
+        self.assertEqual([r['product'] for r in result], [self.mouse.id, self.bag.id])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_recommendations(newcomer), result)
+
+        # new activity drops the cached ranking
+        track_product_view(newcomer, self.mouse)
+        self.assertEqual([r['product'] for r in get_user_recommendations(newcomer)], [self.bag.id])
+
+
+@override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False)  # activity rows written in the request
+class ActivityIngestionTest(TransactionTestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Pens', slug='pens')
+        self.pen = Product.objects.create(product_name='Pen', slug='pen', price=10, stock=10, category=category)
+        self.ink = Product.objects.create(product_name='Ink', slug='ink', price=20, stock=10, category=category)
+        self.user = User.objects.create_user(
+            first_name='Ink', last_name='Fan',
+            username='inkfan', email='inkfan@example.com', password='testpass123',
+        )
+
+    def test_sync_fallback_writes_immediately(self):
+        track_product_view(self.user, self.pen)
+        self.assertEqual(UserActivity.objects.filter(action='view').count(), 1)
+
+    def test_flush_coalesces_repeat_views_in_one_insert(self):
+        buffer = ActivityBuffer(batch_size=100, interval=60)
+        now = timezone.now()
+        for seconds in (0, 1, 2):
+            buffer._queue.put((self.user.pk, self.pen.pk, 'view', now + timedelta(seconds=seconds)))
+        buffer._queue.put((self.user.pk, self.ink.pk, 'view', now))
+        buffer._queue.put((self.user.pk, self.pen.pk, 'buy', now))
+        buffer._queue.put((self.user.pk, self.pen.pk, 'buy', now))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 4)
+        inserts = [q for q in queries.captured_queries if 'INSERT INTO "recommendations_useractivity"' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        pen_view = UserActivity.objects.get(product=self.pen, action='view')
+        self.assertEqual(pen_view.timestamp, now + timedelta(seconds=2))
+        self.assertEqual(UserActivity.objects.filter(action='buy').count(), 2)
+
+    @override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=True)
+    def test_background_flusher_and_shutdown_drain(self):
+        buffer = ActivityBuffer(batch_size=2, interval=60)
+        with mock.patch('recommendations.ingest._buffer', buffer):
+            track_product_view(self.user, self.pen)
+            track_product_view(self.user, self.ink)   # reaches batch_size: wakes the flusher
+            for _ in range(50):
+                if UserActivity.objects.count() == 2:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(UserActivity.objects.count(), 2)
+
+            track_product_view(self.user, self.ink)   # below the threshold: waits
+            buffer.shutdown()
+        self.assertEqual(UserActivity.objects.count(), 3)
+        self.assertFalse(buffer._thread.is_alive())
+
+
+    @override_settings(RECOMMENDATIONS_RECENTLY_VIEWED_SIZE=3)
+    def test_recently_viewed_list_is_capped(self):
+        products = [self.pen, self.ink] + [
+            Product.objects.create(product_name=f'Pad {i}', slug=f'pad-{i}', price=5, stock=1,
+                                   category=self.pen.category)
+            for i in range(3)
+        ]
+        for product in products:
+            track_product_view(self.user, product)
+        track_product_view(self.user, self.ink)
+
+        self.assertEqual(RecentlyViewed.objects.filter(user=self.user).count(), 3)
+        url = reverse('recommendations:recently_viewed', args=[self.user.id])
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual([p['name'] for p in data['products']], ['Ink', 'Pad 2', 'Pad 1'])
+
+
+class ActivityRetentionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_name='Tools', slug='tools')
+        self.saw, self.drill, self.glue = [
+            Product.objects.create(product_name=name, slug=name.lower(), price=50, stock=5, category=category)
+            for name in ('Saw', 'Drill', 'Glue')
+        ]
+        self.users = [
+            User.objects.create_user(
+                first_name='Maker', last_name=str(i),
+                username=f'maker{i}', email=f'maker{i}@example.com', password='testpass123',
+            )
+            for i in range(3)
+        ]
+        self.old = timezone.now() - timedelta(days=120)
+
+    def activity(self, user, product, action='view', when=None):
+        UserActivity.objects.create(user=user, product=product, action=action, timestamp=when or self.old)
+
+    def test_rollup_counts_deletes_in_chunks_and_is_rerunnable(self):
+        for _ in range(3):
+            self.activity(self.users[0], self.saw)
+        self.activity(self.users[0], self.saw, when=self.old + timedelta(days=1))
+        self.activity(self.users[0], self.saw, 'buy')
+        self.activity(self.users[0], self.drill, when=timezone.now())
+
+        call_command('rollup_activity', '--days', '90', '--chunk-size', '2', stdout=StringIO())
+        daily = sorted(UserActivityDaily.objects.values_list('product_id', 'action', 'count'))
+        self.assertEqual(daily, [(self.saw.id, 'view', 1), (self.saw.id, 'view', 3)])
+        # buys and recent views stay raw
+        self.assertEqual(
+            sorted(UserActivity.objects.values_list('product_id', 'action')),
+            sorted([(self.saw.id, 'buy'), (self.drill.id, 'view')]),
+        )
+
+        # a late-arriving old event is merged into the existing day
+        self.activity(self.users[0], self.saw)
+        call_command('rollup_activity', '--days', '90', stdout=StringIO())
+        self.assertEqual(UserActivityDaily.objects.get(day=timezone.localdate(self.old)).count, 4)
+
+    def test_recommendations_use_rolled_up_history(self):
+        for user in self.users[:2]:
+            self.activity(user, self.saw)
+            self.activity(user, self.glue)
+        self.activity(self.users[2], self.saw)
+        call_command('rollup_activity', stdout=StringIO())
+        self.assertFalse(UserActivity.objects.exists())
+
+        call_command('build_recommendations', stdout=StringIO())
+        # users[2] only has rolled-up history
+        self.assertEqual([r['product'] for r in get_user_recommendations(self.users[2])], [self.glue.id])
+
+    @skipUnless(connection.vendor == 'postgresql', "monthly partitioning needs PostgreSQL")
+    def test_partition_by_month_keeps_rows_indexes_and_foreign_keys(self):
+        self.activity(self.users[0], self.saw)
+        self.activity(self.users[1], self.drill, 'buy', when=timezone.now())
+        rows = sorted(UserActivity.objects.values_list('id', 'user_id', 'product_id', 'action'))
+
+        self.assertTrue(partition_by_month(months_ahead=1))
+        self.assertTrue(is_partitioned())
+        self.assertEqual(sorted(UserActivity.objects.values_list('id', 'user_id', 'product_id', 'action')), rows)
+        # ids continue from the copied rows
+        self.assertGreater(UserActivity.objects.create(user=self.users[2], product=self.glue).id, rows[-1][0])
+
+        table = UserActivity._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT contype, count(*) FROM pg_constraint WHERE conrelid = %s::regclass GROUP BY contype",
+                [table],
+            )
+            self.assertEqual(dict(cursor.fetchall()), {'f': 2, 'p': 1})
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", [table])
+            indexes = {name for name, in cursor.fetchall()}
+        self.assertTrue({index.name for index in UserActivity._meta.indexes} <= indexes)
+
+        # later runs only add upcoming partitions
+        self.assertFalse(partition_by_month(months_ahead=2))
@@ -1,67 +1,209 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Sum
 from django.utils import timezone
-from .models import UserActivity
-from django.db.models import Count
+from . import engine
+from .ingest import record_activity
+from .models import ProductCoPurchase, ProductPurchaseBucket, UserActivity
+
+logger = logging.getLogger(__name__)
 
 
 def track_product_view(user, product):
     """
-    Track when a user views a product.
+    Track when a user views a product. Buffered and written in batches
+    off the request path (see recommendations.ingest).
     """
     if user.is_authenticated:
-        UserActivity.objects.create(
-            user=user,
-            product=product,
-            action='view',
-            timestamp=timezone.now()
-        )
+        record_activity(user.pk, product.pk, 'view', timezone.now())
 
 
 def track_product_purchase(user, product):
     """
     Track when a user purchases a product.
     """
-    if user.is_authenticated:
-        UserActivity.objects.create(
-            user=user,
-            product=product,
-            action='buy',
-            timestamp=timezone.now()
-        )
+    track_order_purchase(user, [product])
+
+
+def track_order_purchase(user, products):
+    """
+    Track the products (or ids) of one order as bought by `user`, one 'buy'
+    row per entry. A fixed number of queries however long the order is.
+    Best effort: a failure is logged and rolled back, never raised, so it
+    can't break the checkout that called it.
+    """
+    product_ids = [getattr(product, 'pk', product) for product in products]
+    if not user.is_authenticated or not product_ids:
+        return
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record_copurchase(user, product_ids)
+            record_trending_purchases(Counter(product_ids), now)
+            UserActivity.objects.bulk_create([
+                UserActivity(user=user, product_id=product_id, action='buy', timestamp=now)
+                for product_id in product_ids
+            ])
+    except Exception:
+        logger.exception("Could not record purchases of user %s", user.pk)
+        return
+    engine.invalidate_user(user.pk)
 
 
 def get_user_recommendations(user, limit=5):
     """
     Get personalized recommendations for a user based on their activity.
+    Returns [{'product': product_id, 'score': float}], best first; see
+    recommendations.engine for how they are computed.
     """
     if not user.is_authenticated:
         return []
-    
-    # Get products the user has viewed or bought
-    user_products = UserActivity.objects.filter(
-        user=user
-    ).values_list('product_id', flat=True).distinct()
-    
-    if not user_products:
-        return []
-    
-    # Find similar users (users who interacted with the same products)
-    similar_users = UserActivity.objects.filter(
-        product_id__in=user_products
-    ).exclude(
-        user=user
-    ).values_list('user_id', flat=True).distinct()
-    
-    if not similar_users:
-        return []
-    
-    # Get products liked by similar users
-    recommended_products = UserActivity.objects.filter(
-        user_id__in=similar_users,
-        action='buy'
-    ).exclude(
-        product_id__in=user_products
-    ).values('product').annotate(
-        score=Count('user')
-    ).order_by('-score')[:limit]
-    
-    return recommended_products
+    return engine.recommend(user.pk, limit)
+
+
+# --- co-purchase matrix ---------------------------------------------------
+
+def also_bought_cache_key(product_id):
+    return f'recommendations:also_bought:{product_id}'
+
+
+def record_copurchase(user, products):
+    """
+    Count each of `products` (or ids) as bought together with everything
+    `user` bought before and with each other. Call before the new 'buy'
+    rows are written; products bought before add no pairs. Constant number
+    of queries per order.
+    """
+    bought = set(
+        UserActivity.objects.filter(user=user, action='buy')
+        .values_list('product_id', flat=True).distinct()
+    )
+    new = {getattr(product, 'pk', product) for product in products} - bought
+    partners = bought | new
+    pairs = [(a, b) for a in new for b in partners if a != b]
+    pairs += [(b, a) for a in new for b in bought]
+    if not pairs:
+        return
+
+    ProductCoPurchase.objects.bulk_create(
+        [ProductCoPurchase(product_id=a, other_id=b) for a, b in pairs],
+        ignore_conflicts=True,
+    )
+    # exactly the pairs above: no row pairs a product with itself
+    ProductCoPurchase.objects.filter(
+        Q(product_id__in=new, other_id__in=partners) | Q(product_id__in=bought, other_id__in=new)
+    ).update(count=F('count') + 1)
+    cache.delete_many([also_bought_cache_key(pid) for pid in partners])
+
+
+def rebuild_copurchases(batch_size=1000):
+    """
+    Recompute ProductCoPurchase from every 'buy' UserActivity.
+    Returns the number of (directed) pairs written.
+    """
+    counts = Counter()
+    rows = (
+        UserActivity.objects.filter(action='buy')
+        .order_by('user_id').values_list('user_id', 'product_id').distinct()
+    )
+    baskets = defaultdict(set)
+    for user_id, product_id in rows.iterator(chunk_size=5000):
+        baskets[user_id].add(product_id)
+    for products in baskets.values():
+        for a in products:
+            for b in products:
+                if a != b:
+                    counts[(a, b)] += 1
+
+    touched = set(ProductCoPurchase.objects.values_list('product_id', flat=True).distinct())
+    with transaction.atomic():
+        ProductCoPurchase.objects.all().delete()
+        batch = []
+        for (a, b), count in counts.items():
+            batch.append(ProductCoPurchase(product_id=a, other_id=b, count=count))
+            if len(batch) >= batch_size:
+                ProductCoPurchase.objects.bulk_create(batch)
+                batch = []
+        ProductCoPurchase.objects.bulk_create(batch)
+    touched.update(a for a, _ in counts)
+    cache.delete_many([also_bought_cache_key(pid) for pid in touched])
+    return len(counts)
+
+
+# --- trending counters ----------------------------------------------------
+
+# window name -> (hours, label)
+TRENDING_WINDOWS = {
+    '24h': (24, '24 hours'),
+    '7d': (24 * 7, '7 days'),
+    '30d': (24 * 30, '30 days'),
+}
+
+
+def _bucket_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def record_trending_purchase(product, when=None, count=1):
+    """Add `count` purchases of `product` to its hourly bucket."""
+    record_trending_purchases({getattr(product, 'pk', product): count}, when)
+
+
+def record_trending_purchases(counts, when=None):
+    """Add {product_id: purchases} to the products' hourly buckets."""
+    hour = _bucket_hour(when or timezone.now())
+    ProductPurchaseBucket.objects.bulk_create(
+        [ProductPurchaseBucket(product_id=product_id, hour=hour) for product_id in counts],
+        ignore_conflicts=True,
+    )
+    by_count = defaultdict(list)
+    for product_id, count in counts.items():
+        by_count[count].append(product_id)
+    # one update per distinct count; an order is usually all 1s
+    for count, product_ids in by_count.items():
+        ProductPurchaseBucket.objects.filter(product_id__in=product_ids, hour=hour).update(count=F('count') + count)
+
+
+def trending_product_counts(window='7d', category_slug=None, limit=5):
+    """
+    [(product_id, purchases)] for the top `limit` products in the sliding
+    window, summed over hourly buckets. Includes the current partial hour.
+    """
+    hours, _ = TRENDING_WINDOWS[window]
+    since = _bucket_hour(timezone.now()) - timedelta(hours=hours - 1)
+    buckets = ProductPurchaseBucket.objects.filter(hour__gte=since)
+    if category_slug:
+        buckets = buckets.filter(product__category__slug=category_slug)
+    return list(
+        buckets.values('product_id')
+        .annotate(buy_count=Sum('count'))
+        .order_by('-buy_count', 'product_id')
+        .values_list('product_id', 'buy_count')[:limit]
+    )
+
+
+def rebuild_trending(batch_size=1000):
+    """
+    Recompute the hourly buckets of the longest window from 'buy' activity
+    and drop older buckets. Returns the number of buckets written.
+    """
+    longest = max(hours for hours, _ in TRENDING_WINDOWS.values())
+    since = _bucket_hour(timezone.now()) - timedelta(hours=longest - 1)
+
+    counts = Counter()
+    rows = UserActivity.objects.filter(action='buy', timestamp__gte=since).values_list('product_id', 'timestamp')
+    for product_id, timestamp in rows.iterator(chunk_size=5000):
+        counts[(product_id, _bucket_hour(timestamp))] += 1
+
+    with transaction.atomic():
+        ProductPurchaseBucket.objects.all().delete()
+        ProductPurchaseBucket.objects.bulk_create(
+            [ProductPurchaseBucket(product_id=pid, hour=hour, count=count)
+             for (pid, hour), count in counts.items()],
+            batch_size=batch_size,
+        )
+    return len(counts)
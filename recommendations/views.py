@@ -1,32 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
-from django.utils.timezone import now, timedelta
-from django.db.models import Count, Q
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from .models import UserActivity
+from store.models import Product
+from .models import ProductCoPurchase, RecentlyViewed
+from .utils import TRENDING_WINDOWS, also_bought_cache_key, trending_product_counts
+
+
+def _product_data(product, **extra):
+    """Cacheable product payload; image_url is made absolute per request."""
+    return {
+        'id': product.id,
+        'name': product.product_name,
+        'image_url': product.images.url if product.images else None,
+        'price': float(product.price),
+        **extra,
+    }
+
+
+def _absolute_images(request, products):
+    return [
+        {**item, 'image_url': request.build_absolute_uri(item['image_url']) if item['image_url'] else None}
+        for item in products
+    ]
 
 
 @require_http_methods(["GET"])
 def recently_viewed(request, user_id):
     """
-    Return the last 5 products a user has viewed (ordered by timestamp).
+    Return the last 5 distinct products a user has viewed (newest first).
     """
     try:
-        recent_activities = UserActivity.objects.filter(
-            user_id=user_id,
-            action='view'
-        ).select_related('product').order_by('-timestamp')[:5]
-        
-        products = []
-        for activity in recent_activities:
-            products.append({
-                'id': activity.product.id,
-                'name': activity.product.product_name,
-                'image_url': request.build_absolute_uri(activity.product.images.url) if activity.product.images else None,
-                'price': float(activity.product.price),
-                'timestamp': activity.timestamp.isoformat()
-            })
+        # bounded per-user list, products joined in the same query
+        recent = (
+            RecentlyViewed.objects.filter(user_id=user_id)
+            .select_related('product')
+            .order_by('-viewed_at', '-id')[:5]
+        )
+        products = _absolute_images(request, [
+            _product_data(entry.product, timestamp=entry.viewed_at.isoformat())
+            for entry in recent
+        ])
         
         return JsonResponse({
             'success': True,
@@ -48,47 +64,31 @@ def also_bought(request, product_id):
     Excludes the current product.
     """
     try:
-        # Get users who bought the current product
-        users_who_bought = UserActivity.objects.filter(
-            product_id=product_id,
-            action='buy'
-        ).values_list('user_id', flat=True)
-        
-        if not users_who_bought:
+        key = also_bought_cache_key(product_id)
+        products = cache.get(key)
+        if products is None:
+            # One index range read on the co-purchase table, one bulk product fetch
+            pairs = list(
+                ProductCoPurchase.objects.filter(product_id=product_id, count__gt=0)
+                .order_by('-count', 'other_id')
+                .values_list('other_id', 'count')[:5]
+            )
+            found = Product.objects.in_bulk([other_id for other_id, _ in pairs])
+            products = [
+                _product_data(found[other_id], buy_count=count)
+                for other_id, count in pairs if other_id in found
+            ]
+            cache.set(key, products, getattr(settings, 'RECOMMENDATIONS_CACHE_TIMEOUT', 300))
+
+        if not products:
             return JsonResponse({
                 'success': True,
                 'products': [],
                 'count': 0,
                 'message': 'No purchase history found for this product'
             })
-        
-        # Find products bought by the same users (excluding current product)
-        also_bought_products = UserActivity.objects.filter(
-            user_id__in=users_who_bought,
-            action='buy'
-        ).exclude(
-            product_id=product_id
-        ).values('product').annotate(
-            buy_count=Count('product')
-        ).order_by('-buy_count')[:5]
-        
-        products = []
-        for item in also_bought_products:
-            product = item['product']
-            # Get the actual product object for additional details
-            product_obj = UserActivity.objects.filter(
-                product_id=product,
-                action='buy'
-            ).select_related('product').first().product
-            
-            products.append({
-                'id': product_obj.id,
-                'name': product_obj.product_name,
-                'image_url': request.build_absolute_uri(product_obj.images.url) if product_obj.images else None,
-                'price': float(product_obj.price),
-                'buy_count': item['buy_count']
-            })
-        
+
+        products = _absolute_images(request, products)
         return JsonResponse({
             'success': True,
             'products': products,
@@ -105,42 +105,35 @@ def also_bought(request, product_id):
 @require_http_methods(["GET"])
 def trending(request):
     """
-    Return the top 5 most bought products in the last 7 days.
+    Return the top 5 most bought products in a sliding window.
+    ?window=24h|7d|30d (default 7d), optional ?category=<slug>.
     """
     try:
-        # Calculate date 7 days ago
-        seven_days_ago = now() - timedelta(days=7)
-        
-        # Get products bought in the last 7 days, ordered by purchase count
-        trending_products = UserActivity.objects.filter(
-            action='buy',
-            timestamp__gte=seven_days_ago
-        ).values('product').annotate(
-            buy_count=Count('product')
-        ).order_by('-buy_count')[:5]
-        
-        products = []
-        for item in trending_products:
-            product_id = item['product']
-            # Get the actual product object for additional details
-            product_obj = UserActivity.objects.filter(
-                product_id=product_id,
-                action='buy'
-            ).select_related('product').first().product
-            
-            products.append({
-                'id': product_obj.id,
-                'name': product_obj.product_name,
-                'image_url': request.build_absolute_uri(product_obj.images.url) if product_obj.images else None,
-                'price': float(product_obj.price),
-                'buy_count': item['buy_count']
-            })
-        
+        window = request.GET.get('window', '7d')
+        if window not in TRENDING_WINDOWS:
+            return JsonResponse({
+                'success': False,
+                'error': f"Unknown window '{window}', use one of: {', '.join(TRENDING_WINDOWS)}"
+            }, status=400)
+        category_slug = request.GET.get('category') or None
+
+        key = f'recommendations:trending:{window}:{category_slug or "*"}'
+        products = cache.get(key)
+        if products is None:
+            counts = trending_product_counts(window, category_slug, limit=5)
+            found = Product.objects.in_bulk([product_id for product_id, _ in counts])
+            products = [
+                _product_data(found[product_id], buy_count=buy_count)
+                for product_id, buy_count in counts if product_id in found
+            ]
+            cache.set(key, products, getattr(settings, 'RECOMMENDATIONS_CACHE_TIMEOUT', 300))
+
+        products = _absolute_images(request, products)
         return JsonResponse({
             'success': True,
             'products': products,
             'count': len(products),
-            'period': '7 days'
+            'period': TRENDING_WINDOWS[window][1]
         })
         
     except Exception as e:
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SitesettingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sitesetting'
+
+    def ready(self):
+        import sitesetting.signals
@@ -0,0 +1,17 @@
+from utils.cache import VersionedCache
+from .models import SiteSetting, ContactSetting
+
+site_setting_cache = VersionedCache('site_setting', lambda: SiteSetting.objects.first())
+
+# ContactSetting is a singleton row; make sure it always exists
+contact_setting_cache = VersionedCache(
+    'contact_setting', lambda: ContactSetting.objects.get_or_create(pk=1)[0]
+)
+
+
+def get_site_setting():
+    return site_setting_cache.get()
+
+
+def get_contact_setting():
+    return contact_setting_cache.get()
@@ -1,5 +1,5 @@
-from .models import SiteSetting
+from .cache import get_site_setting
 
 def site_settings(request):
-    setting = SiteSetting.objects.first()
-    return {'site_setting': setting}
\ No newline at end of file
+    setting = get_site_setting()
+    return {'site_setting': setting}
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from .cache import site_setting_cache, contact_setting_cache
+from .models import SiteSetting, ContactSetting
+from marketplace.cache import bump_catalog_version
+
+# Invalidate once the write is committed: a request refilling the cache
+# before that would read, and keep, the old row
+@receiver([post_save, post_delete], sender=SiteSetting)
+def site_setting_changed(sender, **kwargs):
+    transaction.on_commit(site_setting_cache.invalidate)
+    bump_catalog_version()  # layout of every catalog page
+
+@receiver([post_save, post_delete], sender=ContactSetting)
+def contact_setting_changed(sender, **kwargs):
+    transaction.on_commit(contact_setting_cache.invalidate)
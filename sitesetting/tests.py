@@ -1,3 +1,65 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
-# Create your tests here.
+from category.cache import menu_links_cache
+from category.context_processor import menu_links
+from category.models import Category
+from .cache import site_setting_cache
+from .context_processor import site_settings
+from .models import SiteSetting
+
+
+class LayoutCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        site_setting_cache.invalidate()
+        menu_links_cache.invalidate()
+        self.request = RequestFactory().get('/')
+
+    def test_chrome_costs_no_queries_once_warm(self):
+        SiteSetting.objects.create(site_title='Vohrla')
+        Category.objects.create(category_name='Books', slug='books')
+        site_settings(self.request)
+        menu_links(self.request)
+        with self.assertNumQueries(0):
+            self.assertEqual(site_settings(self.request)['site_setting'].site_title, 'Vohrla')
+            self.assertEqual(len(menu_links(self.request)['links']), 1)
+
+    def test_save_and_delete_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            setting = SiteSetting.objects.create(site_title='Old')
+        self.assertEqual(site_settings(self.request)['site_setting'].site_title, 'Old')
+        setting.site_title = 'New'
+        with self.captureOnCommitCallbacks(execute=True):
+            setting.save()
+        self.assertEqual(site_settings(self.request)['site_setting'].site_title, 'New')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(category_name='Books', slug='books')
+        self.assertEqual(len(menu_links(self.request)['links']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(menu_links(self.request)['links'], [])
+
+    def test_invalidation_waits_for_commit(self):
+        site_settings(self.request)
+        menu_links(self.request)
+        versions = [cache.get(c.version_key) for c in (site_setting_cache, menu_links_cache)]
+        with self.captureOnCommitCallbacks() as callbacks:
+            SiteSetting.objects.create(site_title='Uncommitted')
+            Category.objects.create(category_name='Books', slug='books')
+            # a concurrent request would still get the committed (old) data
+            self.assertEqual(versions, [cache.get(c.version_key) for c in (site_setting_cache, menu_links_cache)])
+        for callback in callbacks:
+            callback()
+        after = [cache.get(c.version_key) for c in (site_setting_cache, menu_links_cache)]
+        self.assertTrue(all(old != new for old, new in zip(versions, after)))
+
+    @override_settings(LAYOUT_CACHE_LOCAL_TTL=0)
+    def test_other_workers_see_new_version_through_shared_cache(self):
+        SiteSetting.objects.create(site_title='Shared')
+        site_settings(self.request)
+        # another worker bumped the version: the local copy must not be used
+        cache.set(site_setting_cache.version_key, 'bumped-elsewhere', None)
+        SiteSetting.objects.update(site_title='Changed')
+        self.assertEqual(site_settings(self.request)['site_setting'].site_title, 'Changed')
@@ -1,11 +1,14 @@
 # products/forms.py
 from django import forms
+from imaging.forms import ProcessedImageField
 from .models import Product, Review
 
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        exclude = ("owner", "is_approved", "slug")  # admin controls approval
+        exclude = ("owner", "is_approved", "slug", "rating_avg", "rating_count")  # admin controls approval; ratings are derived
+        # uploads are bounded, EXIF-rotated, stripped and re-encoded (imaging.uploads)
+        field_classes = {"images": ProcessedImageField}
         widgets = {
             # Keep FileInput as we don't want "Currently... Clear"
             "images": forms.FileInput(attrs={"class": "form-control"}),
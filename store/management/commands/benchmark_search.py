@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from category.models import Category
+from store.models import Product
+from store.search import IcontainsSearchBackend, get_search_backend
+
+WORDS = (
+    "laptop phone charger cable notebook textbook calculator hoodie jacket "
+    "sneakers backpack bottle lamp headphones keyboard mouse monitor desk "
+    "chair guitar novel physics chemistry biology calculus snack coffee tea "
+    "blue black red green white large small used new vintage wireless"
+).split()
+
+# common terms (match a large share of the catalog) and a miss
+QUERIES = ["laptop", "wireless headphones", "physics textbook", "vint", "zzzz"]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the configured search backend with the old icontains scan on "
+        "synthetic catalogs. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help="Comma separated catalog sizes.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Timed runs per query.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        rng = random.Random(options['seed'])
+        backend = get_search_backend()
+        baseline = IcontainsSearchBackend()
+
+        self.stdout.write(f"backend: {type(backend).__name__}")
+        self.stdout.write(f"{'products':>10} {'query':<22} {'icontains ms':>13} {'backend ms':>11} {'hits':>6}")
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    brands = self._seed(size, rng)
+                    backend.rebuild()
+                    # selective queries: a brand name and a brand + common word
+                    brand = rng.choice(brands)
+                    for query in QUERIES + [brand, f"{brand} {WORDS[0]}"]:
+                        old_ms, _ = self._time(baseline, query, options['repeat'])
+                        new_ms, hits = self._time(backend, query, options['repeat'])
+                        self.stdout.write(f"{size:>10} {query:<22} {old_ms:>13.2f} {new_ms:>11.2f} {hits:>6}")
+                    raise _Rollback
+            except _Rollback:
+                pass
+        # the in-memory index saw the rolled back rows; rebuild lazily from real data
+        if hasattr(backend, 'reset'):
+            backend.reset()
+
+    def _seed(self, size, rng):
+        """Insert `size` products; returns the rare brand tokens used in names."""
+        category = Category.objects.create(category_name='Benchmark', slug='benchmark-search')
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        brands = ["".join(rng.choices(letters, k=7)) for _ in range(max(size // 20, 1))]
+        batch = []
+        for i in range(size):
+            name = " ".join([rng.choice(brands)] + rng.choices(WORDS, k=3))
+            batch.append(Product(
+                product_name=f"{name} {i}",
+                slug=f"bench-search-{i}",
+                description=" ".join(rng.choices(WORDS, k=25)),
+                price=rng.randint(10, 5000),
+                stock=1,
+                category=category,
+                is_approved=True,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        return brands
+
+    def _time(self, backend, query, repeat):
+        qs = Product.objects.filter(status=True, is_approved=True)
+        backend.search(qs, query, limit=100)  # warm-up (builds lazy indexes)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = len(backend.search(qs, query, limit=100))
+        return (time.perf_counter() - start) * 1000 / repeat, hits
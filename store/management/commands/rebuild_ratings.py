@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from store.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = "Rebuild Product.rating_avg / rating_count from active reviews in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # One GROUP BY over Review instead of one aggregate per product
+        stats = {
+            row['product_id']: row
+            for row in Review.objects.filter(status=True)
+            .values('product_id')
+            .annotate(avg_rating=Avg('rating'), review_count=Count('id'))
+        }
+
+        changed = []
+        products = Product.objects.only('id', 'rating_avg', 'rating_count')
+        for product in products.iterator(chunk_size=batch_size):
+            row = stats.get(product.id)
+            avg = round(float(row['avg_rating']), 1) if row else 0
+            count = row['review_count'] if row else 0
+            if product.rating_avg != avg or product.rating_count != count:
+                product.rating_avg = avg
+                product.rating_count = count
+                changed.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_update(
+                changed, ['rating_avg', 'rating_count'], batch_size=batch_size
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Updated ratings for {len(changed)} product(s)."))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:16
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    rows = (
+        Review.objects.filter(status=True)
+        .values('product_id')
+        .annotate(avg_rating=Avg('rating'), review_count=Count('id'))
+    )
+    for row in rows:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_avg=round(float(row['avg_rating']), 1),
+            rating_count=row['review_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
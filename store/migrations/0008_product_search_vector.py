@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN indexes + backfill; PostgreSQL only (SQLite uses the in-memory index)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_search_vector_gin '
+        'ON store_product USING GIN (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_gin '
+        'ON store_product USING GIN (product_name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        "UPDATE store_product SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(product_name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_gin')
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_seek_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -2,6 +2,7 @@
 from django.db import models
 from django.db.models import Avg, Count
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
 from category.models import Category
 
@@ -26,9 +27,26 @@ class Product(models.Model):
     is_approved = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)   # <- keep this here
 
+    # denormalized review aggregates (see update_rating / rebuild_ratings)
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    # full-text document, maintained by store.search on PostgreSQL only
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # seek keys used by store.pagination.SORT_ORDERINGS
+        indexes = [
+            models.Index(fields=['price', 'id'], name='product_price_seek_idx'),
+            models.Index(fields=['created_date', 'id'], name='product_created_seek_idx'),
+            models.Index(fields=['rating_count', 'id'], name='product_popular_seek_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_seek_idx'),
+            models.Index(fields=['category', 'created_date', 'id'], name='product_cat_created_seek_idx'),
+        ]
+
     def get_url(self):
         return reverse('product_detail', args=[self.category.slug, self.slug])
 
@@ -37,19 +55,26 @@ class Product(models.Model):
     
     @property
     def average_review(self):
-        """Calculate average rating from reviews"""
-        reviews = self.review_set.filter(status=True)
-        if reviews.exists():
-            result = reviews.aggregate(avg_rating=Avg('rating'))
-            avg = result['avg_rating']
-            if avg is not None:
-                return round(float(avg), 1)
-        return 0
-    
+        """Average rating of active reviews (stored on the row)"""
+        return self.rating_avg
+
     @property
     def count_review(self):
-        """Count total reviews"""
-        return self.review_set.filter(status=True).count()
+        """Number of active reviews (stored on the row)"""
+        return self.rating_count
+
+    def update_rating(self):
+        """Recompute rating_avg / rating_count from active reviews."""
+        result = self.review_set.filter(status=True).aggregate(
+            avg_rating=Avg('rating'), review_count=Count('id')
+        )
+        avg = result['avg_rating']
+        self.rating_avg = round(float(avg), 1) if avg is not None else 0
+        self.rating_count = result['review_count']
+        # update() skips auto_now so a new review does not re-sort listings
+        Product.objects.filter(pk=self.pk).update(
+            rating_avg=self.rating_avg, rating_count=self.rating_count
+        )
 
 
 # Use a tuple of tuples (stable ordering) – not a set
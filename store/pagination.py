@@ -0,0 +1,115 @@
+"""
+Keyset (seek) pagination for the store listing.
+
+Instead of OFFSET, each page remembers the sort key of its first/last row
+and the next query seeks past it with a WHERE clause that the composite
+indexes on Product can satisfy. The cost of page N is the same as page 1.
+"""
+from django.core import signing
+from django.db.models import Q
+
+# sort mode -> ordering; every ordering ends with a unique column (id)
+SORT_ORDERINGS = {
+    'price-low': ('price', 'id'),
+    'price-high': ('-price', '-id'),
+    'newest': ('-created_date', '-id'),
+    'popular': ('-rating_count', '-id'),
+}
+
+CURSOR_SALT = 'store.pagination.cursor'
+
+
+def _flip(key):
+    return key[1:] if key.startswith('-') else f'-{key}'
+
+
+def _seek_filter(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`, i.e. the expanded form of
+    (a, b) > (va, vb) so mixed asc/desc keys work on every backend.
+    """
+    condition = Q()
+    for i, key in enumerate(ordering):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` by `ordering` using opaque, signed cursor tokens.
+    A tampered or stale cursor simply falls back to the first page.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [
+            queryset.model._meta.get_field(key.lstrip('-')) for key in self.ordering
+        ]
+
+    def encode_cursor(self, obj, direction):
+        values = [field.value_to_string(obj) for field in self.fields]
+        return signing.dumps({'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, token):
+        try:
+            data = signing.loads(token, salt=CURSOR_SALT)
+            values = [field.to_python(v) for field, v in zip(self.fields, data['v'])]
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None, 'n'
+        if len(values) != len(self.fields) or data.get('d') not in ('n', 'p'):
+            return None, 'n'
+        return values, data['d']
+
+    def get_page(self, token=None):
+        values, direction = self.decode_cursor(token) if token else (None, 'n')
+        ordering = self.ordering if direction == 'n' else tuple(_flip(k) for k in self.ordering)
+
+        qs = self.queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(_seek_filter(ordering, values))
+
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'n':
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if rows and has_previous else None,
+        )
@@ -0,0 +1,285 @@
+"""
+Product search backends.
+
+store.views.search asks get_search_backend() for a backend and calls
+search(queryset, keyword). Backends are picked by STORE_SEARCH_BACKEND
+(a dotted path) or, by default, from the database vendor:
+
+- PostgresSearchBackend: weighted tsvector column + GIN index, ranked with
+  ts_rank, falling back to pg_trgm similarity for typos and word fragments.
+- InMemorySearchBackend: a per-process inverted index for SQLite dev.
+- IcontainsSearchBackend: the original LIKE scan, kept as a baseline.
+
+Product save/delete signals call update_product / remove_product so the
+index stays current.
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# relative weight of a hit in the name vs. the description
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SearchBackend:
+    """Interface every search backend implements."""
+
+    def search(self, queryset, keyword, limit=None):
+        """Return products from `queryset` matching `keyword`, best first."""
+        raise NotImplementedError
+
+    def update_product(self, product):
+        """Called after a product is saved."""
+
+    def remove_product(self, product_id):
+        """Called after a product is deleted."""
+
+    def rebuild(self):
+        """Re-index every product (after bulk imports / raw SQL writes)."""
+
+
+class IcontainsSearchBackend(SearchBackend):
+    """The original sequential LIKE scan; unranked, newest first."""
+
+    def search(self, queryset, keyword, limit=None):
+        qs = queryset.filter(
+            Q(description__icontains=keyword) | Q(product_name__icontains=keyword)
+        ).order_by('-created_date')
+        return list(qs[:limit] if limit else qs)
+
+
+class PostgresSearchBackend(SearchBackend):
+    config = 'english'
+    trigram_threshold = 0.2
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('product_name', weight='A', config=self.config)
+            + SearchVector('description', weight='B', config=self.config)
+        )
+
+    def search(self, queryset, keyword, limit=None):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+        from django.db.models import F
+
+        query = SearchQuery(keyword, config=self.config, search_type='websearch')
+        ranked = (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-created_date')
+        )
+        results = list(ranked[:limit] if limit else ranked)
+        if results:
+            return results
+
+        # No lexeme match: `product_name % keyword` picks candidates through the
+        # GIN trgm index, and only those are ranked by similarity. The operator's
+        # cut-off is pg_trgm.similarity_threshold, set for this transaction only.
+        similar = (
+            queryset.filter(product_name__trigram_similar=keyword)
+            .annotate(rank=TrigramSimilarity('product_name', keyword))
+            .order_by('-rank', '-created_date')
+        )
+        with transaction.atomic(using=queryset.db):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('SET LOCAL pg_trgm.similarity_threshold = %s', [self.trigram_threshold])
+            return list(similar[:limit] if limit else similar)
+
+    def update_product(self, product):
+        Product.objects.filter(pk=product.pk).update(search_vector=self.vector())
+
+    def rebuild(self):
+        Product.objects.update(search_vector=self.vector())
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    Per-process inverted index: token -> {product_id: weighted term frequency}.
+
+    Built lazily from the database on the first search, then kept current by
+    the Product signals (applied on commit). Query terms are ANDed and matched
+    by prefix, so "lap" finds "laptop" like the old icontains did, and results
+    are ranked by TF-IDF with name hits weighted above description hits.
+    Meant for local development; each worker process holds its own copy.
+    """
+
+    chunk_size = 500
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._docs = {}            # product_id -> set(tokens)
+            self._sorted_tokens = None
+            self._built = False
+
+    def _add(self, product_id, name, description):
+        self._discard(product_id)
+        weights = defaultdict(float)
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+        for token, weight in weights.items():
+            self._postings[token][product_id] = weight
+        self._docs[product_id] = set(weights)
+        self._sorted_tokens = None
+
+    def _discard(self, product_id):
+        for token in self._docs.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._sorted_tokens = None
+
+    def rebuild(self):
+        with self._lock:
+            self.reset()
+            rows = Product.objects.values_list('id', 'product_name', 'description')
+            for product_id, name, description in rows.iterator(chunk_size=2000):
+                self._add(product_id, name, description)
+            self._built = True
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def _expand(self, term):
+        """Index tokens starting with `term`."""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        tokens = self._sorted_tokens
+        i = bisect_left(tokens, term)
+        while i < len(tokens) and tokens[i].startswith(term):
+            yield tokens[i]
+            i += 1
+
+    def score(self, keyword):
+        """{product_id: score} for products containing every query term."""
+        terms = tokenize(keyword)
+        if not terms:
+            return {}
+        with self._lock:
+            self._ensure_built()
+            total = len(self._docs) or 1
+            # per query term: [(postings, idf), ...] over its prefix expansions
+            per_term = []
+            for term in terms:
+                expanded = [
+                    (self._postings[token], math.log(1 + total / len(self._postings[token])))
+                    for token in self._expand(term)
+                ]
+                if not expanded:
+                    return {}
+                per_term.append(expanded)
+
+            # Start from the rarest term so later terms only probe candidates
+            per_term.sort(key=lambda expanded: sum(len(p) for p, _ in expanded))
+            scores = defaultdict(float)
+            for postings, idf in per_term[0]:
+                for product_id, weight in postings.items():
+                    scores[product_id] += weight * idf
+            for expanded in per_term[1:]:
+                narrowed = {}
+                for product_id, score in scores.items():
+                    extra = sum(p[product_id] * idf for p, idf in expanded if product_id in p)
+                    if extra:
+                        narrowed[product_id] = score + extra
+                scores = narrowed
+                if not scores:
+                    return {}
+            return dict(scores)
+
+    def search(self, queryset, keyword, limit=None):
+        scores = self.score(keyword)
+        # Best first; newer (higher id) products win ties like the old ordering
+        key = lambda pid: (scores[pid], pid)
+        if limit:
+            # Top-k heap; only fall back to a full sort if filtering drops rows
+            ranked_ids = heapq.nlargest(limit * 2, scores, key=key)
+            chunk_size = limit
+        else:
+            ranked_ids = sorted(scores, key=key, reverse=True)
+            chunk_size = self.chunk_size
+
+        results = self._fetch(queryset, ranked_ids, scores, chunk_size, limit)
+        if limit and len(results) < limit and len(ranked_ids) < len(scores):
+            ranked_ids = sorted(scores, key=key, reverse=True)
+            results = self._fetch(queryset, ranked_ids, scores, self.chunk_size, limit)
+        return results[:limit] if limit else results
+
+    def _fetch(self, queryset, ranked_ids, scores, chunk_size, limit):
+        # Filtering (status/approval) stays in the database; fetch in chunks
+        # so a broad prefix never builds an oversized IN (...) list
+        results = []
+        for start in range(0, len(ranked_ids), chunk_size):
+            chunk = ranked_ids[start:start + chunk_size]
+            found = queryset.filter(pk__in=chunk).order_by().in_bulk()
+            for pid in chunk:
+                product = found.get(pid)
+                if product is not None:
+                    product.rank = scores[pid]
+                    results.append(product)
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def update_product(self, product):
+        product_id, name, description = product.pk, product.product_name, product.description
+
+        def apply():
+            with self._lock:
+                if self._built:
+                    self._add(product_id, name, description)
+
+        transaction.on_commit(apply)
+
+    def remove_product(self, product_id):
+        def apply():
+            with self._lock:
+                if self._built:
+                    self._discard(product_id)
+
+        transaction.on_commit(apply)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'STORE_SEARCH_BACKEND', '')
+                if path:
+                    _backend = import_string(path)()
+                elif connection.vendor == 'postgresql':
+                    _backend = PostgresSearchBackend()
+                else:
+                    _backend = InMemorySearchBackend()
+    return _backend
@@ -1,12 +1,47 @@
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Product
-from utils.media_cleanup import delete_old_file_on_update, delete_file_on_delete
+from .models import Product, ProductGallery, Review, Variation
+from .search import get_search_backend
+from marketplace.cache import bump_catalog_version, bump_home_version
+from utils.media_cleanup import track_files
 
-@receiver(pre_save, sender=Product)
-def images_update_cleanup(sender, instance, **kwargs):
-    delete_old_file_on_update(instance, Product, 'images')
+# Dedupe uploads; delete replaced/orphaned image files
+track_files(Product, 'images')
+track_files(ProductGallery, 'image')
+
+# Keep the search index current
+SEARCH_FIELDS = {'product_name', 'description'}
+
+@receiver(post_save, sender=Product)
+def product_saved_update_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not SEARCH_FIELDS & set(update_fields)):
+        return
+    get_search_backend().update_product(instance)
 
 @receiver(post_delete, sender=Product)
-def images_delete_cleanup(sender, instance, **kwargs):
-    delete_file_on_delete(instance, 'images')
+def product_deleted_update_search(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+
+# Keep Product.rating_avg / rating_count in sync with its reviews
+@receiver(post_save, sender=Review)
+def review_saved_update_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Product(pk=instance.product_id).update_rating()
+
+@receiver(post_delete, sender=Review)
+def review_deleted_update_rating(sender, instance, **kwargs):
+    Product(pk=instance.product_id).update_rating()
+
+# Home page fragments show products and their ratings
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Review)
+def product_changed_bump_home(sender, **kwargs):
+    bump_home_version()
+    bump_catalog_version()
+
+# Product pages also render variations and gallery images
+@receiver([post_save, post_delete], sender=Variation)
+@receiver([post_save, post_delete], sender=ProductGallery)
+def product_parts_changed_bump_catalog(sender, **kwargs):
+    bump_catalog_version()
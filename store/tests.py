@@ -1,3 +1,242 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Account
+from carts.models import CartItem
+from category.cache import menu_links_cache
+from category.models import Category
+from sitesetting.cache import site_setting_cache
+from .models import Product, ProductGallery, Review, Variation
+from .pagination import SORT_ORDERINGS
+from .search import InMemorySearchBackend, PostgresSearchBackend
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        self.user = Account.objects.create_user(
+            first_name='Test', last_name='User',
+            username='rater', email='rater@example.com', password='testpass123',
+        )
+        category = Category.objects.create(category_name='Books', slug='books')
+        self.product = Product.objects.create(
+            product_name='Notebook', slug='notebook', price=100, stock=5,
+            category=category, is_approved=True,
+        )
+
+    def test_review_signals_keep_rating_current(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=4)
+        Review.objects.create(product=self.product, user=self.user, rating=5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_avg, 4.5)
+        self.assertEqual(self.product.rating_count, 2)
+
+        review.status = False
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.average_review, 5.0)
+        self.assertEqual(self.product.count_review, 1)
+
+    def test_rating_properties_do_not_query(self):
+        Review.objects.create(product=self.product, user=self.user, rating=3)
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.average_review, 3.0)
+            self.assertEqual(product.count_review, 1)
+
+    def test_rebuild_ratings_command(self):
+        Review.objects.create(product=self.product, user=self.user, rating=2)
+        Product.objects.filter(pk=self.product.pk).update(rating_avg=0, rating_count=0)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_avg, 2.0)
+        self.assertEqual(self.product.rating_count, 1)
+
+
+@override_settings(STORE_PAGE_SIZE=3)
+class StoreKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(category_name='Gadgets', slug='gadgets')
+        for i, price in enumerate([50, 20, 20, 70, 10, 20, 90, 30]):
+            Product.objects.create(
+                product_name=f'Item {i}', slug=f'item-{i}', price=price, stock=1,
+                category=self.category, is_approved=True,
+            )
+
+    def _walk(self, sort, **params):
+        seen, cursor = [], None
+        while True:
+            query = {'sort': sort, **params}
+            if cursor:
+                query['cursor'] = cursor
+            page = self.client.get(reverse('store'), query).context['products']
+            self.assertLessEqual(len(page), 3)
+            seen.extend(p.id for p in page)
+            if not page.has_next:
+                return seen, page
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_sort_mode_without_gaps(self):
+        for sort, ordering in SORT_ORDERINGS.items():
+            seen, _ = self._walk(sort)
+            expected = list(
+                Product.objects.order_by(*ordering).values_list('id', flat=True)
+            )
+            self.assertEqual(seen, expected, sort)
+
+    def test_price_filter_and_previous_cursor(self):
+        seen, last_page = self._walk('price-low', min_price='20', max_price='70')
+        prices = list(Product.objects.filter(id__in=seen).values_list('price', flat=True))
+        self.assertTrue(all(20 <= p <= 70 for p in prices))
+        self.assertEqual(len(seen), 6)
+
+        previous = self.client.get(reverse('store'), {
+            'sort': 'price-low', 'min_price': '20', 'max_price': '70',
+            'cursor': last_page.previous_cursor,
+        }).context['products']
+        self.assertEqual([p.id for p in previous], seen[:3])
+        self.assertFalse(previous.has_previous)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('store'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['products'].has_previous)
+
+
+class InMemorySearchBackendTests(TestCase):
+    def setUp(self):
+        self.backend = InMemorySearchBackend()
+        category = Category.objects.create(category_name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(
+            product_name='Gaming Laptop', slug='gaming-laptop', price=900, stock=1,
+            description='Fast machine with a backlit keyboard.',
+            category=category, is_approved=True,
+        )
+        self.keyboard = Product.objects.create(
+            product_name='Mechanical Keyboard', slug='mechanical-keyboard', price=80, stock=1,
+            description='Pairs well with any laptop.',
+            category=category, is_approved=True,
+        )
+        self.hidden = Product.objects.create(
+            product_name='Laptop Stand', slug='laptop-stand', price=20, stock=1,
+            category=category, is_approved=False,
+        )
+
+    def _search(self, keyword):
+        qs = Product.objects.filter(status=True, is_approved=True)
+        return [p.pk for p in self.backend.search(qs, keyword)]
+
+    def test_ranks_name_hits_above_description_hits(self):
+        self.assertEqual(self._search('laptop'), [self.laptop.pk, self.keyboard.pk])
+        self.assertEqual(self._search('keyboard'), [self.keyboard.pk, self.laptop.pk])
+
+    def test_prefix_and_all_terms_must_match(self):
+        self.assertEqual(self._search('mech key'), [self.keyboard.pk])
+        self.assertEqual(self._search('laptop nothing'), [])
+
+    def test_signals_keep_index_current(self):
+        self.backend.rebuild()
+        with patch('store.signals.get_search_backend', return_value=self.backend):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.keyboard.product_name = 'Wireless Mouse'
+                self.keyboard.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.laptop.delete()
+        self.assertEqual(self._search('mouse'), [self.keyboard.pk])
+        self.assertEqual(self._search('gaming'), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search backend')
+class PostgresSearchBackendTests(TestCase):
+    def setUp(self):
+        self.backend = PostgresSearchBackend()
+        category = Category.objects.create(category_name='Electronics', slug='electronics')
+        self.laptop = Product.objects.create(
+            product_name='Gaming Laptop', slug='gaming-laptop', price=900, stock=1,
+            category=category, is_approved=True,
+        )
+        self.backend.rebuild()
+
+    def test_trigram_fallback_finds_typos(self):
+        qs = Product.objects.filter(status=True, is_approved=True)
+        self.assertEqual(self.backend.search(qs, 'gaming laptp'), [self.laptop])
+        self.assertEqual(self.backend.search(qs, 'zzzz'), [])
+
+    def test_trigram_fallback_uses_the_gin_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')  # a few rows would never pick an index
+        plan = Product.objects.filter(product_name__trigram_similar='laptp').explain()
+        self.assertIn('product_name_trgm_gin', plan)
+
+
+@override_settings(RECOMMENDATIONS_ACTIVITY_ASYNC=False)  # activity rows written in the request
+class ProductDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for layout_cache in (menu_links_cache, site_setting_cache):
+            layout_cache.invalidate()
+        self.seller = Account.objects.create_user(
+            first_name='Sam', last_name='Seller',
+            username='seller', email='seller@example.com', password='testpass123',
+        )
+        self.category = Category.objects.create(category_name='Clothes', slug='clothes')
+
+    def make_product(self, slug, extras):
+        product = Product.objects.create(
+            product_name=slug.title(), slug=slug, price=500, stock=10,
+            category=self.category, owner=self.seller, is_approved=True,
+        )
+        for i in range(extras):
+            ProductGallery.objects.create(product=product, image=f'store/products/{slug}-{i}.jpg')
+            Variation.objects.create(product=product, variation_category='color', variation_value=f'c{i}')
+            Variation.objects.create(product=product, variation_category='size', variation_value=f's{i}')
+            reviewer = Account.objects.create_user(
+                first_name='Rev', last_name=str(i),
+                username=f'{slug}-rev{i}', email=f'{slug}-rev{i}@example.com', password='testpass123',
+            )
+            Review.objects.create(product=product, user=reviewer, rating=4, subject=f'Review {i}')
+        return product
+
+    def count_queries(self, product):
+        url = reverse('product_detail', args=[self.category.slug, product.slug])
+        self.client.get(url)  # warm layout caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries.captured_queries, response
+
+    def test_anonymous_query_count_is_constant(self):
+        small, response = self.count_queries(self.make_product('tee', 1))
+        large, response = self.count_queries(self.make_product('hoodie', 6))
+        # product + gallery + variations + reviews with authors
+        self.assertEqual(len(small), 4)
+        self.assertEqual(len(large), 4)
+        self.assertContains(response, 'Review 5')
+        self.assertContains(response, '<option value="s5">')
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_in_cart_uses_cached_cart_state(self):
+        buyer = Account.objects.create_user(
+            first_name='Bea', last_name='Buyer',
+            username='buyer', email='buyer@example.com', password='testpass123',
+        )
+        buyer.is_active = True
+        buyer.save()
+        self.client.force_login(buyer)
+        product = self.make_product('scarf', 3)
+        CartItem.objects.create(user=buyer, product=product, quantity=1)
+
+        queries, response = self.count_queries(product)
+        self.assertTrue(response.context['in_cart'])
+        self.assertFalse(any('carts_cartitem' in q['sql'] for q in queries))
+        # the 4 page queries + session + user + "has ordered" check; activity
+        # writes are synchronous here (queued in production)
+        page = [q for q in queries if 'recommendations_' not in q['sql']]
+        self.assertEqual(len(page), 7)
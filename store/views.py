@@ -1,19 +1,24 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.db.models import Prefetch
 from django.http import Http404
-from . models import Product, ProductGallery
+from . models import Product, ProductGallery, Variation
 from category.models import Category
-from carts.models import CartItem
-from carts.views import _cart_id
+from carts.services import get_cart_state
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
+from outbox.services import enqueue as enqueue_email
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from . forms import ContactSellerForm, ReviewForm
+from .pagination import KeysetPaginator, SORT_ORDERINGS
+from .search import get_search_backend
 from .models import Review
+from recommendations.utils import track_product_view
+from marketplace.conditional import conditional_page, visitor_etag
 
+@conditional_page()
 def store(request, category_slug=None):
     categories = None
     products = None
@@ -25,8 +30,8 @@ def store(request, category_slug=None):
         
     # If no slug is passed, redirect to the normal store page
     else:
-        # Fetch all products where status is true and order by id 
-        products = Product.objects.all().filter(status=True, is_approved=True).order_by('id')
+        # Fetch all products where status is true
+        products = Product.objects.all().filter(status=True, is_approved=True)
     
     # Apply price range filter
     min_price = request.GET.get('min_price')
@@ -37,28 +42,26 @@ def store(request, category_slug=None):
     if max_price and max_price.isdigit():
         products = products.filter(price__lte=int(max_price))
     
-    # Apply sorting
+    # Apply sorting (keyset pagination needs a unique tiebreaker, see SORT_ORDERINGS)
     sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in SORT_ORDERINGS:
+        sort_by = 'newest'
     
-    if sort_by == 'price-low':
-        products = products.order_by('price')
-    elif sort_by == 'price-high':
-        products = products.order_by('-price')
-    elif sort_by == 'popular':
-        # Order by most viewed/popular (you can customize this logic)
-        products = products.order_by('-created_date')  # For now, using created_date as popularity
-    else:  # newest first (default)
-        products = products.order_by('-created_date')
-    
-    # Remove pagination - show all products
-    # paginator = Paginator(products, 3) 
-    # page = request.GET.get('page') 
-    # paged_products = paginator.get_page(page)
-    product_count = products.count()
+    # Keyset pagination: page cost is constant however deep the shopper scrolls
+    paginator = KeysetPaginator(
+        products.select_related('category'),
+        SORT_ORDERINGS[sort_by],
+        per_page=getattr(settings, 'STORE_PAGE_SIZE', 12),
+    )
+    paged_products = paginator.get_page(request.GET.get('cursor'))
+
+    # Filters carried over to the next/previous page links
+    page_query = request.GET.copy()
+    page_query.pop('cursor', None)
     
     context = {
-        'products': products,  # Use products directly instead of paged_products
-        'product_count': product_count,
+        'products': paged_products,
+        'page_query': page_query.urlencode(),
         'category_slug': category_slug,
         'min_price': min_price or '',
         'max_price': max_price or '',
@@ -68,57 +71,56 @@ def store(request, category_slug=None):
     return render(request, 'store/store.html', context)
     
 
+def _product_detail_etag(request, category_slug, product_slug):
+    # signed-in views are tracked and may show the review form: always render
+    if request.user.is_authenticated:
+        return None
+    return visitor_etag(request)
+
+
+@conditional_page(_product_detail_etag)
 def product_detail(request, category_slug, product_slug):
+    # One query for the product, one per prefetch (gallery, variations, reviews + authors)
     product = get_object_or_404(
-        Product,
+        Product.objects.select_related('category', 'owner').prefetch_related(
+            Prefetch('gallery_images', queryset=ProductGallery.objects.order_by('id'), to_attr='gallery'),
+            Prefetch('variations', queryset=Variation.objects.filter(is_active=True).order_by('id'),
+                     to_attr='active_variations'),
+            Prefetch('review_set', queryset=Review.objects.filter(status=True)
+                     .select_related('user').order_by('-created_date'), to_attr='active_reviews'),
+        ),
         category__slug=category_slug,
         slug=product_slug,
         status=True,
     )
 
-    if not product.is_approved and not (request.user.is_staff or request.user == getattr(product, 'owner', None)):
+    if not product.is_approved and not (request.user.is_staff or request.user == product.owner):
         raise Http404("Product not found")
 
-    in_cart = CartItem.objects.filter(
-        cart__cart_id=_cart_id(request),
-        product=product
-    ).exists()
+    # queued, not inserted here (recommendations.ingest)
+    track_product_view(request.user, product)
 
-   
-    # Get product gallery images
-    product_gallery = ProductGallery.objects.filter(product_id=product.id)
-    
-    # Get order product info (if user has ordered this product)
-    order_product = None
+    # cached cart state; never creates a session for anonymous visitors
+    in_cart = product.id in get_cart_state(request)['product_ids']
+
+    # Has the user ordered this product (allows reviewing)
+    order_product = False
     if request.user.is_authenticated:
         from orders.models import OrderProduct
         order_product = OrderProduct.objects.filter(
             user=request.user,
             product=product
-        ).first()
-    
-    # Get reviews for this product
-    reviews = []
-    try:
-        reviews = Review.objects.filter(product=product, status=True).order_by('-created_date')
-    except:
-        # Reviews might not exist yet
-        pass
-
-    colors = product.variations.filter(
-        variation_category__iexact='color', is_active=True
-    ).order_by('id')
-
-    sizes = product.variations.filter(
-        variation_category__iexact='size', is_active=True
-    ).order_by('id')
+        ).exists()
+
+    colors = [v for v in product.active_variations if v.variation_category.lower() == 'color']
+    sizes = [v for v in product.active_variations if v.variation_category.lower() == 'size']
 
     context = {
         'product': product,
         'in_cart': in_cart,
         'order_product': order_product,
-        'reviews': reviews,
-        'product_gallery': product_gallery,
+        'reviews': product.active_reviews,
+        'product_gallery': product.gallery,
         'colors': colors,
         'sizes': sizes,
     }
@@ -129,20 +131,17 @@ def product_detail(request, category_slug, product_slug):
 
 def search(request):
     keyword = request.GET.get('keyword', '').strip()
-    products = Product.objects.none()
-    product_count = 0
     
     if not keyword:
         return redirect('home')  # or redirect('home')
     
-    products = Product.objects.filter(
-        status=True, 
-        is_approved=True
-        ).order_by('-created_date').filter(
-        Q(description__icontains=keyword) | 
-        Q (product_name__icontains=keyword)
-        )
-    product_count = products.count()
+    # Ranked full-text search (see store/search.py for the backends)
+    products = get_search_backend().search(
+        Product.objects.filter(status=True, is_approved=True).select_related('category'),
+        keyword,
+        limit=getattr(settings, 'STORE_SEARCH_LIMIT', 100),
+    )
+    product_count = len(products)
             
     context = {
         'products': products,
@@ -218,13 +217,12 @@ def message_seller(request, user_id):
                 f"Email: {buyer.email}\n\n"
                 f"{body}"
             )
-            send_mail(
+            enqueue_email(EmailMessage(
                 email_subject,
                 email_body,
                 getattr(settings, "DEFAULT_FROM_EMAIL", None),
                 [seller.email],
-                fail_silently=True,
-            )
+            ))
 
             messages.success(request, "Your message was sent to the seller.")
             # Redirect to messages app detail page (namespaced)
@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """
+    False for per-process backends (LocMem): there a version bump only
+    reaches the worker that made it, and the others keep serving the old
+    version until it times out.
+    """
+    return not isinstance(caches[alias], LocMemCache)
+
+
+class VersionedCache:
+    """
+    Two-level cache for near-static data (site settings, menu categories).
+
+    Each process keeps its own copy for `local_ttl` seconds, so a typical
+    render costs no query and no cache round trip. Behind that sits the
+    shared Django cache, keyed by a version token. invalidate() writes a
+    new token, so other workers pick up the change once their local copy
+    expires.
+    """
+
+    def __init__(self, name, loader, timeout=None, local_ttl=None):
+        self.name = name
+        self.loader = loader
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self._local = None          # (version, expires_at, value)
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f'vcache:{self.name}:version'
+
+    def _data_key(self, version):
+        return f'vcache:{self.name}:{version}'
+
+    def _timeouts(self):
+        timeout = self.timeout
+        if timeout is None:
+            timeout = getattr(settings, 'LAYOUT_CACHE_TIMEOUT', 3600)
+        local_ttl = self.local_ttl
+        if local_ttl is None:
+            local_ttl = getattr(settings, 'LAYOUT_CACHE_LOCAL_TTL', 5)
+        return timeout, local_ttl
+
+    def get(self):
+        timeout, local_ttl = self._timeouts()
+        now = time.monotonic()
+        local = self._local
+        if local is not None and now < local[1]:
+            return local[2]
+
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.version_key, version, None)
+            version = cache.get(self.version_key, version)
+
+        if local is not None and local[0] == version:
+            value = local[2]
+        else:
+            # wrapped in a tuple so a legitimately empty value (None) is cached too
+            hit = cache.get(self._data_key(version))
+            if hit is None:
+                hit = (self.loader(),)
+                cache.set(self._data_key(version), hit, timeout)
+            value = hit[0]
+
+        with self._lock:
+            self._local = (version, now + local_ttl, value)
+        return value
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        with self._lock:
+            self._local = None
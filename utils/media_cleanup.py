@@ -1,21 +1,175 @@
-import os
+"""
+Lifecycle of uploaded media files.
 
-def delete_old_file_on_update(instance, model, field_name):
-    """Delete the old file from disk when updating the field."""
-    if not instance.pk:
-        return
-    try:
-        old_instance = model.objects.get(pk=instance.pk)
-    except model.DoesNotExist:
+track_files(model, *fields) connects a model's file fields to:
+
+* loaded state: the stored names are remembered when an instance is built
+  (post_init), so a save can tell whether a field changed without fetching
+  the old row again;
+* dedup: a new upload whose SHA-256 matches a file already stored in the
+  same upload directory reuses that file instead of writing a copy
+  (imaging.StoredFile is the hash index);
+* cleanup: a file that was replaced, or whose row was deleted, is removed
+  once the transaction commits, unless some FileField still references it
+  (deduplicated files are shared).
+
+Files that slip past this (queryset.update()/delete(), bulk_create,
+uploads from failed saves) are found by `manage.py sweep_media`.
+"""
+import hashlib
+import posixpath
+from functools import lru_cache, partial
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+_tracked = {}  # model -> tuple of file field names
+
+
+@lru_cache(maxsize=None)
+def file_fields():
+    """(model, field name) for every FileField of every installed model."""
+    return tuple(
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    )
+
+
+def _stored_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def _upload_dir(field):
+    """Static directory of a field's uploads, or None when it can't be known."""
+    if callable(field.upload_to) or '%' in str(field.upload_to):
+        return None
+    return posixpath.normpath(str(field.upload_to))
+
+
+def is_referenced(name):
+    """True if any FileField that could hold `name` still points at it."""
+    for model, field_name in file_fields():
+        directory = _upload_dir(model._meta.get_field(field_name))
+        if directory is not None and not name.startswith(directory + '/'):
+            continue
+        if model._base_manager.filter(**{field_name: name}).exists():
+            return True
+    return False
+
+
+def delete_unreferenced(name, storage):
+    """Delete a stored file (and its hash record) unless it is still in use."""
+    from imaging.models import StoredFile
+
+    if not name or is_referenced(name):
+        return False
+    storage.delete(name)
+    StoredFile.objects.filter(name=name).delete()
+    return True
+
+
+def _delete_after_commit(name, storage):
+    transaction.on_commit(partial(delete_unreferenced, name, storage))
+
+
+def _content_hash(content):
+    digest, size = hashlib.sha256(), 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return digest.hexdigest(), size
+
+
+def dedupe_upload(instance, field_name):
+    """
+    Point a new, uncommitted upload at an identical stored file when there
+    is one; otherwise remember its hash so it is recorded after the save.
+    """
+    from imaging.models import StoredFile
+
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or fieldfile._committed:
         return
-    old_file = getattr(old_instance, field_name)
-    new_file = getattr(instance, field_name)
-    if old_file and old_file != new_file:
-        if os.path.isfile(old_file.path):
-            os.remove(old_file.path)
+    digest, size = _content_hash(fieldfile.file)
+    target = fieldfile.field.generate_filename(instance, posixpath.basename(fieldfile.name))
+    directory = posixpath.dirname(target)
+    candidates = StoredFile.objects.filter(
+        content_hash=digest, size=size, name__startswith=directory + '/'
+    ).values_list('name', flat=True)
+    for name in candidates:
+        if posixpath.dirname(name) == directory and fieldfile.storage.exists(name):
+            fieldfile.name = name
+            fieldfile._committed = True  # FileField.pre_save skips writing it
+            return
+    instance.__dict__.setdefault('_new_files', {})[field_name] = (digest, size)
+
+
+def remember_loaded_files(instance, field_names):
+    """Record the stored names as loaded (deferred fields are skipped)."""
+    state = instance.__dict__
+    instance._loaded_files = {f: _stored_name(state[f]) for f in field_names if f in state}
+
+
+def delete_old_file_on_update(instance, model, field_name):
+    """Delete the replaced file after commit when a saved field changes."""
+    state = instance.__dict__
+    if instance._state.adding or field_name not in state:
+        return  # new row, or a deferred field that was never touched
+    loaded = state.get('_loaded_files', {})
+    if field_name in loaded:
+        old_name = loaded[field_name]
+    else:
+        # deferred when loaded and assigned since: the old name is only in the row
+        old_name = model._base_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    if old_name and old_name != _stored_name(state[field_name]):
+        _delete_after_commit(old_name, model._meta.get_field(field_name).storage)
+
 
 def delete_file_on_delete(instance, field_name):
-    """Delete the file from disk when the instance is deleted."""
+    """Delete the file after commit when the instance is deleted."""
     file_field = getattr(instance, field_name)
-    if file_field and os.path.isfile(file_field.path):
-        os.remove(file_field.path)
+    if file_field:
+        _delete_after_commit(file_field.name, file_field.storage)
+
+
+def _post_init(sender, instance, **kwargs):
+    remember_loaded_files(instance, _tracked[sender])
+
+
+def _pre_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for field_name in _tracked[sender]:
+        dedupe_upload(instance, field_name)
+        delete_old_file_on_update(instance, sender, field_name)
+
+
+def _post_save(sender, instance, raw=False, **kwargs):
+    from imaging.models import StoredFile
+
+    new_files = instance.__dict__.pop('_new_files', None)
+    if new_files and not raw:
+        StoredFile.objects.bulk_create([
+            StoredFile(name=getattr(instance, field_name).name, content_hash=digest, size=size)
+            for field_name, (digest, size) in new_files.items()
+        ], ignore_conflicts=True)
+    remember_loaded_files(instance, _tracked[sender])
+
+
+def _post_delete(sender, instance, **kwargs):
+    for field_name in _tracked[sender]:
+        delete_file_on_delete(instance, field_name)
+
+
+def track_files(model, *field_names):
+    """Manage the files of `model`'s file fields as described above."""
+    _tracked[model] = field_names
+    uid = model._meta.label
+    post_init.connect(_post_init, sender=model, dispatch_uid=f'media_init_{uid}')
+    pre_save.connect(_pre_save, sender=model, dispatch_uid=f'media_pre_save_{uid}')
+    post_save.connect(_post_save, sender=model, dispatch_uid=f'media_post_save_{uid}')
+    post_delete.connect(_post_delete, sender=model, dispatch_uid=f'media_delete_{uid}')